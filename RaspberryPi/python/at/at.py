@@ -1,72 +1,24 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 
-import RPi.GPIO as GPIO
-import serial
-import time
+import logging
+import os
+import sys
 
-ser = serial.Serial('/dev/ttyS0',9600,timeout=1)
-ser.flushInput()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from sim7080g import Modem
 
-powerKey = 4
-command_input = ''
-rec_buff = ''
-
-def powerOn(powerKey):
-    print('SIM7080X is starting:')
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    GPIO.setup(powerKey,GPIO.OUT)
-    time.sleep(0.1)
-    GPIO.output(powerKey,GPIO.HIGH)
-    time.sleep(1)
-    GPIO.output(powerKey,GPIO.LOW)
-    time.sleep(5)
-
-def powerDown(powerKey):
-    print('SIM7080X is loging off:')
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    GPIO.setup(powerKey,GPIO.OUT)
-    GPIO.output(powerKey,GPIO.HIGH)
-    time.sleep(2)
-    GPIO.output(powerKey,GPIO.LOW)
-    time.sleep(5)
-    print('Good bye')
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-def checkStart():
-    while True:
-        # simcom module uart may be fool,so it is better to send much times when it starts.
-        ser.write( 'AT\r\n'.encode() )
-        time.sleep(1)
-        ser.write( 'AT\r\n'.encode() )
-        time.sleep(1)
-        ser.write( 'AT\r\n'.encode() )
-        time.sleep(1)
-        if ser.inWaiting():
-            time.sleep(0.01)
-            recBuff = ser.read(ser.inWaiting())
-            print('SOM7080X is ready\r\n')
-            print( 'try to start\r\n' + recBuff.decode() )
-            if 'OK' in recBuff.decode():
-                recBuff = ''
-                break 
-        else:
-            powerOn(powerKey)
+powerKey = 4
+modem = Modem('/dev/ttyS0', 9600, power_key=powerKey, gpio="rpi")
 
 try:
-    checkStart()
+    modem.check_start()
     while True:
-        command_input = raw_input('Please input the AT command,press Ctrl+C to exit:')
-        ser.write((command_input+  '\r\n' ).encode())
-        time.sleep(0.1)
-        if ser.inWaiting():
-            time.sleep(0.01)
-            rec_buff = ser.read(ser.inWaiting())
+        command_input = input('Please input the AT command,press Ctrl+C to exit:')
+        rec_buff = modem.command(command_input, timeout=1)
         if rec_buff != '':
-            print(rec_buff.decode())
-            rec_buff = ''
+            print(rec_buff)
 except:
-    if ser != None:
-        ser.close()
-    powerDown(powerKey)
-    GPIO.cleanup()
+    modem.power_down()
+    modem.close()
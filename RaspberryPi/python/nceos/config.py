@@ -7,6 +7,12 @@ SERIAL_BAUDRATE = 115200
 # UDP送信先設定
 UDP_ENDPOINT = "192.168.1.100"  # 例: サーバーのIPアドレス
 UDP_PORT = 5683
+# UDP の送信経路 ("PPP": Linux ソケット経由, "MODEM": モジュール内蔵スタック AT+CAOPEN 経由)
+UDP_TRANSPORT = "PPP"
+# UDP_TRANSPORT が "PPP" のとき、シーケンス番号と選択的 ACK で欠けたメッセージだけを再送する
+UDP_RELIABLE = False
+# ACK を待たずに送信できるメッセージ数
+RELIABLE_WINDOW = 32
 
 # CoAP送信先設定
 COAP_ENDPOINT = "coap.example.com"  # 例: CoAPサーバーのホスト名またはIP
@@ -18,8 +24,31 @@ PROTOCOL = "UDP"
 # 送信間隔（秒単位, 例: 300秒 = 5分）
 SEND_INTERVAL = 300
 
+# 移動状態に応じた測位間隔の範囲（秒）。停止中は MAX_SEND_INTERVAL まで間隔を伸ばす
+MIN_SEND_INTERVAL = 10
+MAX_SEND_INTERVAL = 3600
+# 軌跡の間引きで許容する誤差（メートル）
+TRACK_TOLERANCE = 10
+
 # コマンド受信用UDPポート
 COMMAND_UDP_PORT = 9999
 
-# センサー（GPS）読み取りタイムアウトの閾値（分）
+# GPS が測位できない間、GNSS の復旧手順 (最後の段階は PWRKEY による電源再投入) を繰り返す間隔の上限（分）
 SENSOR_TIMEOUT = 30
+
+# GNSS アシストデータ (XTRA) と最終測位位置のキャッシュ先
+GNSS_CACHE_DIR = "/var/cache/sim7080g"
+# XTRA の期限 (キャッシュの経過時間とモジュール上の有効性) を確認する間隔（秒）。UDP_TRANSPORT が "PPP" のときのみ
+XTRA_CHECK_INTERVAL = 3600
+
+# ログファイル (None で標準出力のみ。DEBUG はエラー発生時にまとめて書き出される)
+LOG_FILE = None
+
+# ICCID などの変化の少ない AT 問い合わせ応答のキャッシュ (None で保存しない)
+AT_CACHE_FILE = "/var/cache/sim7080g/at_cache.json"
+
+# 機能ごとの通信量・推定消費電力量 (mAh) をログに出す間隔（秒）。None で出さない
+ENERGY_REPORT_INTERVAL = 3600
+
+# ATコマンドのトレース出力先 (None で無効。終了時に JSON Lines で書き出し、レイテンシ統計をログに出す)
+AT_TRACE_FILE = None
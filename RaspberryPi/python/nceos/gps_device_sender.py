@@ -1,96 +1,124 @@
+import time
+
+# 起動時間の計測 (--profile-startup) の基準。ほかの import より先に記録する
+STARTED = time.perf_counter()
+
+import os
+import sys
 import asyncio
 import socket
 import struct
 import logging
-import serial
-from time import sleep
-from datetime import datetime, timedelta
-from aiocoap import Context, Message, POST
+from datetime import datetime
 import config  # 設定モジュールとして config.py を読み込む
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from sim7080g import ATScheduler, Modem, Tracer
+from sim7080g.at import response_lines
+from sim7080g.cache import ResponseCache
+from sim7080g.energy import EnergyMeter
+from sim7080g.gnss import AssistedGnss, fix_time
+from sim7080g.logpipe import BatchFileHandler, setup_logging
+from sim7080g.radio import RadioScheduler
+from sim7080g.sampling import AdaptiveSampler, TrackFilter
+from sim7080g.trace import format_summary
+from sim7080g.watchdog import GnssWatchdog
+
 # --- グローバル設定 ---
 PROTOCOL = config.PROTOCOL  # "UDP" または "CoAP"
 wait_time = config.SEND_INTERVAL  # 送信間隔（秒）
 # TOPICは起動時にICCIDから取得するため初期値はNone
 TOPIC = None
-sensor_timeout = config.SENSOR_TIMEOUT  # GPS読み取りタイムアウト判定（分）
-last_sensor_read_success = datetime.now()
+# UDP_TRANSPORT が "MODEM" の場合に device_main と notify_config_change で共有する内蔵スタックのソケット
+modem_sock = None
+# モデムを共有するタスク (送信・GNSS・コマンドサーバ) のコマンドを優先度順に実行するスケジューラ
+at_scheduler = None
+# 機能 (定期送信・通知) ごとの通信量と推定消費電力量
+energy_meter = None
+# ReliableSender のデータグラムに付くヘッダ (バージョン 1 + epoch 4 + floor 4 + シーケンス番号 4 バイト)
+RELIABLE_HEADER = 13
+# 送信する測位レコード (緯度, 経度, 測位時刻の UNIX 秒)
+PAYLOAD_FORMAT = struct.Struct('<ffI')
+# --profile-startup のときの起動からの経過時間 (イベント名 -> 秒)。計測しない場合は None
+startup_marks = None
+# 最初のデータグラムを送ったらセットする (--profile-startup の終了条件)
+startup_done = None
 
+# ログはキュー経由で書き込みスレッドから出力し、イベントループを止めない。
+# DEBUG (ATコマンドの送受信) はメモリに保持し、エラー発生時にだけ書き出す
+setup_logging(["device", "sim7080g"], BatchFileHandler(config.LOG_FILE) if config.LOG_FILE else None)
 logger = logging.getLogger("device")
-logger.setLevel(logging.DEBUG)
-handler = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-
-# --- ATコマンド送信関数 ---
-def send_at_command(command, ser, retries=3, response_delay=1):
+IMPORTED = time.perf_counter()
+
+def mark_startup(event):
     """
-    モデムにATコマンドを送信し、応答を取得する
+    --profile-startup のとき、起動からイベントまでの経過時間を記録する (イベントごとに最初の1回だけ)。
     """
-    if not isinstance(ser, serial.Serial):
-        logger.error(f"'ser' is not a serial.Serial object. Received type: {type(ser)}")
-        return ""
+    if startup_marks is None or event in startup_marks:
+        return
+    startup_marks[event] = time.perf_counter() - STARTED
+    if event == "first datagram sent":
+        startup_done.set()
 
-    for attempt in range(1, retries + 1):
-        try:
-            ser.reset_input_buffer()  # バッファをクリア
-            logger.debug(f"Sending AT command (Attempt {attempt}/{retries}): {command}")
-            ser.write((command + "\r\n").encode())  # コマンド送信
-            sleep(response_delay)  # 応答待ち
-
-            # 応答を取得
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode(errors='ignore').strip()
-                logger.debug(f"AT command response: {response}")
-                return response
-            else:
-                logger.warning(f"No response received for command '{command}' (Attempt {attempt}/{retries}).")
-        except Exception as e:
-            logger.error(f"Error sending AT command '{command}' (Attempt {attempt}/{retries}): {e}")
+def process_age():
+    """
+    /proc からプロセスの起動後の経過時間（秒）を求める (10ms 単位)。取得できなければ None を返す。
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # コマンド名 (括弧内) の後ろの 20 番目が起動時刻 (システム起動からのクロック数)
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
 
-    logger.error(f"Failed to get a response for command '{command}' after {retries} attempts.")
-    return ""
+def startup_report():
+    """
+    --profile-startup の結果 (モジュールの読み込み開始からの経過時間) を文字列で返す。
+    """
+    lines = ["Startup profile (seconds since gps_device_sender started importing):"]
+    age = process_age()
+    if age is not None:
+        # 計測を始める前のインタプリタの起動 (python 自体の起動と sitecustomize など)
+        lines.append(f"  {'interpreter (before import)':32s} {age - (time.perf_counter() - STARTED):7.3f}")
+    lines.append(f"  {'imports':32s} {IMPORTED - STARTED:7.3f}")
+    for event, elapsed in sorted(startup_marks.items(), key=lambda item: item[1]):
+        lines.append(f"  {event:32s} {elapsed:7.3f}")
+    if "first datagram sent" not in startup_marks:
+        lines.append("  (no datagram was sent)")
+    return "\n".join(lines)
 
-def get_iccid(ser):
+def get_iccid(cache):
     """
     AT+CCIDコマンドを使用してICCID情報を取得する。
+    応答は ResponseCache に保存され、次回起動時はシリアル通信なしで返る。
     取得に成功した場合はICCID文字列を返し、失敗時はNoneを返す。
     """
-    response = send_at_command("AT+CCID", ser)
-    if response.startswith("+CCID:"):
-        try:
-            # 例: +CCID: "898600xxxxxxxxxxxxxx"
-            iccid = response.split(":", 1)[1].strip().strip('"')
-            logger.info("ICCID取得成功: %s", iccid)
-            return iccid
-        except Exception as e:
-            logger.error("Failed to parse ICCID: %s", e)
-            return None
-    else:
-        logger.error("Invalid ICCID response: %s", response)
-        return None
+    response = cache.command("AT+CCID", retries=3)
+    # 応答はエコーバックの後に ICCID のみ (例: 898600xxxxxxxxxxxxxx)。"+CCID:" 付きの形式にも対応する
+    lines = response_lines(response, "AT+CCID")
+    if "OK" in response and lines:
+        iccid = lines[0].split(":", 1)[-1].strip().strip('"')
+        logger.info("ICCID取得成功: %s", iccid)
+        return iccid
+    logger.error("Invalid ICCID response: %s", response)
+    return None
 
-def read_gps_data(ser):
+def read_gps_data(gnss):
     """
     AT+CGNSINF コマンドを使用してGPS情報（緯度、経度）を取得する。
-    返り値: (latitude, longitude) as floats。取得失敗時は (None, None) を返す。
+    測位結果は AssistedGnss に記録され、TTFF と次回起動時の最終位置に使われる。
+    返り値: parse_cgnsinf の結果 (dict)。応答が不正な場合は None を返す。
     """
-    response = send_at_command("AT+CGNSINF", ser)
-    if response.startswith("+CGNSINF:"):
-        parts = response.split(',')
-        try:
-            # ※ 部分番号はモジュールの仕様に依存します。
-            # 例: parts[3]が緯度、parts[4]が経度の場合
-            lat = float(parts[3])
-            lon = float(parts[4])
-            return lat, lon
-        except Exception as e:
-            logger.error("Failed to parse GPS data: %s", e)
-            return None, None
-    else:
-        logger.error("Invalid GPS data response: %s", response)
-        return None, None
+    fix = gnss.read_fix()
+    if fix is None:
+        logger.error("Invalid GPS data response")
+        return None
+    if fix["lat"] is None or fix["lon"] is None:
+        logger.debug("No GPS fix yet")
+    return fix
 
 async def send_udp_message(sock, addr, payload):
     """
@@ -103,6 +131,9 @@ async def send_coap_message(coap_protocol, url, payload):
     """
     CoAP送信用の関数。aiocoapのContextを利用して送信します。
     """
+    # aiocoap は CoAP を使うときだけ読み込む (UDP では起動時間に含めない)
+    from aiocoap import Message, POST
+
     request = Message(code=POST, uri=url, payload=payload)
     try:
         response = await coap_protocol.request(request).response
@@ -113,45 +144,68 @@ async def send_coap_message(coap_protocol, url, payload):
 async def notify_config_change():
     """
     設定変更時にサーバへ通知する処理。
-    現在のPROTOCOLに応じてUDPまたはCoAPで、変更内容を送信します。
     """
-    global PROTOCOL, wait_time, TOPIC
     message = f"CONFIG_CHANGED: INTERVAL={wait_time} seconds, PROTOCOL={PROTOCOL}, TOPIC={TOPIC}"
     logger.info("Notifying server of config change: %s", message)
+    await notify_server(message)
+
+async def notify_server(message):
+    """
+    サーバへ通知メッセージを送信する処理。
+    現在のPROTOCOLに応じてUDPまたはCoAPで送信します。
+    """
     payload = message.encode('utf-8')
+    if energy_meter is not None:
+        transport = "coap" if PROTOCOL == "CoAP" else "modem" if modem_sock is not None else "udp"
+        energy_meter.record("notifications", transport, sent=len(payload))
+        if PROTOCOL == "CoAP":
+            # 確認型メッセージなのでサーバからの ACK も受信する
+            energy_meter.record("acks", "coap")
 
     if PROTOCOL == "UDP":
         ENDPOINT = config.UDP_ENDPOINT
         PORT = config.UDP_PORT
         serv_address = (ENDPOINT, PORT)
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            await send_udp_message(sock, serv_address, payload)
-            sock.close()
+            if modem_sock is not None:
+                # コマンドサーバからの通知は GNSS や定期送信より先に実行する
+                await at_scheduler.run(modem_sock.sendto, payload, serv_address, priority="urgent")
+            else:
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    await send_udp_message(sock, serv_address, payload)
         except Exception as e:
-            logger.error("Failed to send config change notification via UDP: %s", e)
+            logger.error("Failed to send notification via UDP: %s", e)
     elif PROTOCOL == "CoAP":
         ENDPOINT = config.COAP_ENDPOINT
         PORT = config.COAP_PORT
         url = f'coap://{ENDPOINT}:{PORT}/?t={TOPIC}'
         try:
+            from aiocoap import Context
+
             coap_protocol = await Context.create_client_context()
             await send_coap_message(coap_protocol, url, payload)
             await coap_protocol.shutdown()
         except Exception as e:
-            logger.error("Failed to send config change notification via CoAP: %s", e)
+            logger.error("Failed to send notification via CoAP: %s", e)
 
 async def device_main():
     """
     GPS情報を取得し、指定のプロトコル（UDPまたはCoAP）で定期送信する処理。
     """
-    global last_sensor_read_success, wait_time, PROTOCOL, TOPIC
+    global wait_time, PROTOCOL, TOPIC, modem_sock, at_scheduler, energy_meter
 
-    # シリアルポートの初期化（config.pyに定義されたパラメータを使用）
-    ser = serial.Serial(config.SERIAL_PORT, config.SERIAL_BAUDRATE, timeout=5)
+    # モデムの初期化（config.pyに定義されたパラメータを使用、ポートは初回コマンド時に開く）
+    modem = Modem(config.SERIAL_PORT, config.SERIAL_BAUDRATE, timeout=5)
+    tracer = Tracer().attach(modem.at) if config.AT_TRACE_FILE else None
+    at_scheduler = ATScheduler(modem)
+    # GNSS の電源状態は AT コマンドから、送受信量は送信処理から記録する
+    energy_meter = EnergyMeter().attach(modem.at, modem)
+    cache = ResponseCache(modem, config.AT_CACHE_FILE)
 
-    # 初回起動時にICCIDを取得し、トピック名に設定する
-    iccid = get_iccid(ser)
+    # 初回起動時にICCIDを取得し、トピック名に設定する (2回目以降はキャッシュから返る)。
+    # シリアル通信はスケジューラのスレッドで行い、その間もコマンドサーバは受信できる
+    iccid = await at_scheduler.run(get_iccid, cache, priority="urgent")
+    mark_startup("iccid")
     if iccid is not None:
         TOPIC = iccid
     else:
@@ -159,59 +213,167 @@ async def device_main():
         TOPIC = "gps_data"
     logger.info("Using topic: %s", TOPIC)
 
+    # XTRA は Linux 側の通信 (PPP) でダウンロードし、キャッシュからモジュールへ書き込む
+    gnss = AssistedGnss(modem, cache_dir=config.GNSS_CACHE_DIR)
+    if config.UDP_TRANSPORT == "PPP":
+        await asyncio.to_thread(gnss.refresh_xtra)
+    # 測位できない状態が続いたら GNSS の電源再投入からモジュールの電源再投入まで段階的に復旧する
+    watchdog = GnssWatchdog(modem, gnss, cache, max_backoff=config.SENSOR_TIMEOUT * 60)
+
     sock = None
+    reliable = None
     coap_protocol = None
+    scheduler = None
 
     try:
         if PROTOCOL == "UDP":
             ENDPOINT = config.UDP_ENDPOINT
             PORT = config.UDP_PORT
             serv_address = (ENDPOINT, PORT)
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # 送信方式ごとのモジュールは選ばれたものだけ読み込む
+            if config.UDP_TRANSPORT == "MODEM":
+                # PPP を使わずモジュール内蔵スタックで送信する
+                from sim7080g.udp import ModemUDPSocket
+
+                sock = modem_sock = ModemUDPSocket(modem)
+                # モジュールを再起動する復旧手順の後は PDP を有効化してソケットを開き直す
+                watchdog.reset_hooks.append(sock.reset)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                if config.UDP_RELIABLE:
+                    from reliable_udp import ACK_FORMAT, ReliableSender
+
+                    # ACK を待たずにウィンドウ内で送り続け、サーバの ACK で欠けた分だけ再送する
+                    reliable = ReliableSender(sock, serv_address, window=config.RELIABLE_WINDOW)
+                    reliable.start()
+                    # 送信と再送は LTE ウィンドウの間だけ行う
+                    reliable.pause()
         elif PROTOCOL == "CoAP":
             ENDPOINT = config.COAP_ENDPOINT
             PORT = config.COAP_PORT
+            from aiocoap import Context
+
             coap_protocol = await Context.create_client_context()
 
         logger.info("Connecting to %s with topic '%s' using %s protocol ...", ENDPOINT, TOPIC, PROTOCOL)
 
+        async def send_payload(payload):
+            if PROTOCOL == "UDP" and reliable is not None:
+                await reliable.send(payload)
+                energy_meter.record("telemetry", "udp", sent=len(payload) + RELIABLE_HEADER)
+            elif PROTOCOL == "UDP" and sock is modem_sock:
+                await at_scheduler.run(sock.sendto, payload, serv_address, priority="send")
+                energy_meter.record("telemetry", "modem", sent=len(payload))
+            elif PROTOCOL == "UDP":
+                await send_udp_message(sock, serv_address, payload)
+                energy_meter.record("telemetry", "udp", sent=len(payload))
+            elif PROTOCOL == "CoAP":
+                url = f'coap://{ENDPOINT}:{PORT}/?t={TOPIC}'
+                await send_coap_message(coap_protocol, url, payload)
+                energy_meter.record("telemetry", "coap", sent=len(payload))
+                # 確認型メッセージなので ACK の受信は "acks" として別に数える
+                energy_meter.record("acks", "coap")
+            mark_startup("first datagram sent")
+
+        # ReliableSender の再送 (telemetry) と受信した ACK (acks) は送信後にまとめて記録する
+        reliable_counted = {"retransmits": 0, "acks": 0}
+        next_energy_report = time.monotonic() + (config.ENERGY_REPORT_INTERVAL or 0)
+        next_xtra_check = time.monotonic() + config.XTRA_CHECK_INTERVAL
+
+        # GNSS と LTE は同時に使えないため、測位と送信を別々の無線ウィンドウで行う
+        scheduler = RadioScheduler(gnss, lambda: watchdog.track(read_gps_data(gnss)), send_payload,
+                                   run=lambda fn: at_scheduler.run(fn, priority="gnss"))
+        # 移動状態で測位間隔を変え、許容誤差内で再現できる点は送らない
+        sampler = AdaptiveSampler(config.MIN_SEND_INTERVAL, config.MAX_SEND_INTERVAL)
+        track = TrackFilter(config.TRACK_TOLERANCE, max_age=config.MAX_SEND_INTERVAL)
+
         while True:
+            fix = None
             try:
-                # blockingなGPS取得処理を非同期に実行
-                lat, lon = await asyncio.to_thread(read_gps_data, ser)
-                if lat is None or lon is None:
+                # GNSS ウィンドウ: 測位できるまで GNSS を動かし、終わったら止める
+                fix = await scheduler.gnss_window()
+                if fix is not None:
+                    mark_startup("first fix")
+                event = await at_scheduler.run(watchdog.update, fix, priority="urgent")
+                if event is not None:
+                    details = ", ".join(f"{key}={value}" for key, value in event.items() if key != "event")
+                    await notify_server(f"GNSS_{event['event'].upper()}: {details}, TOPIC={TOPIC}")
+                if fix is None:
                     logger.error("Failed to read GPS data")
-                    if (datetime.now() - last_sensor_read_success) >= timedelta(minutes=sensor_timeout):
-                        logger.error("GPS read timeout exceeded sensor timeout threshold")
-                    await asyncio.sleep(wait_time)
-                    continue
-
-                last_sensor_read_success = datetime.now()
-                now = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
-                message = f"GPS: lat={lat}, lon={lon}, time={now}"
-                payload = struct.pack('ff', lat, lon)
-                logger.info("Sending %s message to %s:%s with body %s at %s", PROTOCOL, ENDPOINT, PORT, message, now)
-
-                if PROTOCOL == "UDP":
-                    await send_udp_message(sock, serv_address, payload)
-                elif PROTOCOL == "CoAP":
-                    url = f'coap://{ENDPOINT}:{PORT}/?t={TOPIC}'
-                    await send_coap_message(coap_protocol, url, payload)
+                else:
+                    # 間引きのため点は遅れて (最大 MAX_SEND_INTERVAL) 送られる。受信時刻ではなく測位時刻を送る
+                    for lat, lon, timestamp in track.add(fix["lat"], fix["lon"], fix_time(fix)):
+                        now = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S')
+                        message = f"GPS: lat={lat}, lon={lon}, time={now}"
+                        payload = PAYLOAD_FORMAT.pack(lat, lon, int(timestamp))
+                        logger.info("Queueing %s message to %s:%s with body %s at %s", PROTOCOL, ENDPOINT, PORT, message, now)
+                        scheduler.enqueue(payload)
+
+                # LTE ウィンドウ: キューに溜まったデータを送信する。再送もこの間だけ行い、GNSS ウィンドウ中は止める
+                if reliable is not None:
+                    reliable.resume()
+                try:
+                    await scheduler.lte_window()
+                    if reliable is not None:
+                        await reliable.drain(scheduler.lte_window_length())
+                finally:
+                    if reliable is not None:
+                        reliable.pause()
+                if reliable is not None:
+                    metrics = reliable.metrics()
+                    logger.debug("Reliable UDP metrics: %s", metrics)
+                    retransmits = metrics["retransmits"] - reliable_counted["retransmits"]
+                    acks = metrics["acks"] - reliable_counted["acks"]
+                    if retransmits:
+                        energy_meter.record("telemetry", "udp",
+                                            sent=retransmits * (PAYLOAD_FORMAT.size + RELIABLE_HEADER),
+                                            packets=retransmits)
+                    if acks:
+                        energy_meter.record("acks", "udp", received=acks * ACK_FORMAT.size, packets=acks)
+                    reliable_counted.update(retransmits=metrics["retransmits"], acks=metrics["acks"])
+                # 長時間動かし続けても XTRA が期限切れにならないよう、LTE ウィンドウ中に取り直す
+                if config.UDP_TRANSPORT == "PPP" and time.monotonic() >= next_xtra_check:
+                    next_xtra_check = time.monotonic() + config.XTRA_CHECK_INTERVAL
+                    if await at_scheduler.run(gnss.xtra_expired):
+                        await asyncio.to_thread(gnss.refresh_xtra)
+                logger.debug("Radio scheduler metrics: %s", scheduler.metrics())
+                if config.ENERGY_REPORT_INTERVAL and time.monotonic() >= next_energy_report:
+                    logger.info("Energy: %s", energy_meter.report())
+                    next_energy_report = time.monotonic() + config.ENERGY_REPORT_INTERVAL
 
             except Exception as e:
                 logger.error("Unexpected error in main loop: %s", e)
 
-            await asyncio.sleep(wait_time)
+            await asyncio.sleep(sampler.next_interval(fix, wait_time))
 
     finally:
+        if reliable:
+            reliable.resume()
+            await reliable.drain(5)
+            reliable.close()
+            logger.info("Reliable UDP metrics: %s", reliable.metrics())
         if sock:
             sock.close()
+            modem_sock = None
             logger.info("Socket closed.")
         if coap_protocol:
             await coap_protocol.shutdown()
             logger.info("CoAP protocol context shutdown.")
-        ser.close()
+        gnss.flush_state()
+        logger.info("GNSS TTFF by start type: %s", gnss.report())
+        logger.info("GNSS watchdog: %s", watchdog.metrics())
+        logger.info("Energy: %s", energy_meter.report())
+        energy_meter = None
+        if scheduler:
+            logger.info("Radio scheduler metrics: %s", scheduler.metrics())
+        at_scheduler.close()
+        logger.info("AT scheduler metrics: %s", at_scheduler.metrics())
+        at_scheduler = None
+        modem.close()
         logger.info("Serial port closed.")
+        if tracer:
+            tracer.export(config.AT_TRACE_FILE)
+            logger.info("AT command latency:\n%s", format_summary(tracer.summary()))
 
 async def command_server():
     """
@@ -228,6 +390,7 @@ async def command_server():
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     server_sock.bind(('', COMMAND_PORT))
     server_sock.setblocking(False)
+    mark_startup("command server listening")
 
     while True:
         try:
@@ -274,17 +437,40 @@ async def command_server():
             logger.error("Error in command server: %s", e)
         await asyncio.sleep(0.1)
 
-async def main():
+async def main(profile_startup=False):
     """
     device_main（GPS情報送信）とcommand_server（コマンド受信）を並行実行します。
+    コマンドサーバを先に起動し、モデムの初期化を待たずにコマンドを受け付けます。
+    profile_startup が True の場合は最初のデータグラムを送った時点で終了し、起動時間の内訳を表示します。
     """
-    await asyncio.gather(
-        device_main(),
-        command_server(),
-    )
+    global startup_marks, startup_done
+    if not profile_startup:
+        await asyncio.gather(
+            command_server(),
+            device_main(),
+        )
+        return
+
+    startup_marks = {}
+    startup_done = asyncio.Event()
+    tasks = [asyncio.create_task(command_server()), asyncio.create_task(device_main())]
+    waiter = asyncio.create_task(startup_done.wait())
+    await asyncio.wait(tasks + [waiter], return_when=asyncio.FIRST_COMPLETED)
+    for task in tasks + [waiter]:
+        task.cancel()
+    for result in await asyncio.gather(*tasks, waiter, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.error("Startup failed: %s", result)
+    print(startup_report())
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Send GPS positions from the SIM7080G")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Exit after the first datagram and report import time and time to first send")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.profile_startup))
     except KeyboardInterrupt:
         logger.info("Program terminated by user")
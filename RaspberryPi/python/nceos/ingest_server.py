@@ -0,0 +1,461 @@
+"""
+gps_device_sender.py が送信する GPS データグラムのサーバ側受信サービス
+
+ソケットが読み込み可能になるたびに溜まっているデータグラムをまとめて読み出し
+(recvmmsg 相当)、バッチ単位で NumPy で一括デコードし、
+シーケンス番号で重複を除いてから列指向 (.npz) で保存する。
+デバイスは軌跡を間引いてから送るため、測位時刻 (time) は受信時刻 (received_at) と一致しない。
+バッチ形式を送ってきたデバイスには、処理のたびに選択的 ACK (reliable_udp.pack_ack) を1つ返す。
+デバイスからのテキストの通知 (CONFIG_CHANGED / GNSS_RECOVERY など) はログに出力する。
+しばらく受信のないデバイスの重複除去と ACK の状態は捨てる (アドレスが変わったデバイスの分が溜まらないように)。
+デバイスへのコマンドは COMMAND_UDP_PORT に送り返す。
+
+ペイロード形式:
+    単発: struct.pack('<ffI', lat, lon, 測位時刻の UNIX 秒)  (12 バイト、シーケンス番号なし)
+          struct.pack('<ff', lat, lon)                        (8 バイト、旧形式。測位時刻は受信時刻で代用)
+    バッチ: BATCH_HEADER '<BII' (BATCH_VERSION, epoch, floor) + ('<IffI' seq, lat, lon, 測位時刻) * N
+           (epoch と floor は reliable_udp を参照)
+    通知: UTF-8 のテキスト (例: "CONFIG_CHANGED: INTERVAL=60 seconds, ...")
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+import config  # 設定モジュールとして config.py を読み込む
+from reliable_udp import BATCH_HEADER, BATCH_VERSION, AckTracker, pack_ack, pack_batch
+
+logger = logging.getLogger("ingest")
+
+SINGLE_DTYPE = np.dtype([("lat", "<f4"), ("lon", "<f4"), ("time", "<u4")])
+LEGACY_DTYPE = np.dtype([("lat", "<f4"), ("lon", "<f4")])
+RECORD_DTYPE = np.dtype([("seq", "<u4"), ("lat", "<f4"), ("lon", "<f4"), ("time", "<u4")])
+HEADER_DTYPE = np.dtype([("version", "u1"), ("epoch", "<u4"), ("floor", "<u4")])
+# 受信バッチのフラッシュ条件
+FLUSH_DATAGRAMS = 4096
+FLUSH_INTERVAL = 0.05
+MAX_DATAGRAM_SIZE = 2048
+# デバイスごとに保持する既読シーケンス番号の数
+DEDUPE_WINDOW = 4096
+# 1ファイルあたりの最大レコード数
+STORE_CHUNK_RECORDS = 1_000_000
+# この時間（秒）受信のないデバイスの重複除去と ACK の状態を捨てる。
+# 停止中のデバイスは MAX_SEND_INTERVAL ごとにしか送らず、LTE ウィンドウ待ちで更に遅れるため余裕を持たせる
+DEVICE_IDLE_TIMEOUT = 4 * config.MAX_SEND_INTERVAL
+# 上記の確認間隔（秒）
+EVICT_INTERVAL = 60
+# 保持する直近の通知の数
+NOTIFICATION_HISTORY = 100
+
+
+def is_record(payload):
+    """
+    Returns:
+        bool: 位置レコード (単発・旧形式・バッチ) の形式ならTrue。それ以外は通知として扱う
+    """
+    header = BATCH_HEADER.size
+    return (len(payload) in (SINGLE_DTYPE.itemsize, LEGACY_DTYPE.itemsize)
+            or (len(payload) > header and payload[0] == BATCH_VERSION
+                and (len(payload) - header) % RECORD_DTYPE.itemsize == 0))
+
+
+def decode_datagrams(datagrams):
+    """
+    受信したデータグラムをまとめてデコードする
+    Args:
+        datagrams (list): (payload, addr) のリスト
+    Returns:
+        tuple: (devices, epochs, floors, seqs, lats, lons, times)。単発形式のレコードの seq は -1、
+            epoch と floor は 0。測位時刻のない旧形式の time は 0
+    """
+    header = BATCH_HEADER.size
+    singles = [(payload, addr) for payload, addr in datagrams if len(payload) == SINGLE_DTYPE.itemsize]
+    legacy = [(payload, addr) for payload, addr in datagrams if len(payload) == LEGACY_DTYPE.itemsize]
+    batches = [(payload, addr) for payload, addr in datagrams
+               if len(payload) > header and payload[0] == BATCH_VERSION
+               and (len(payload) - header) % RECORD_DTYPE.itemsize == 0]
+
+    devices, epochs, floors, seqs, lats, lons, times = [], [], [], [], [], [], []
+    for group, dtype in ((singles, SINGLE_DTYPE), (legacy, LEGACY_DTYPE)):
+        if not group:
+            continue
+        decoded = np.frombuffer(b"".join(payload for payload, _ in group), dtype=dtype)
+        devices.extend(f"{addr[0]}:{addr[1]}" for _, addr in group)
+        epochs.append(np.zeros(len(decoded), dtype=np.int64))
+        floors.append(np.zeros(len(decoded), dtype=np.int64))
+        seqs.append(np.full(len(decoded), -1, dtype=np.int64))
+        lats.append(decoded["lat"])
+        lons.append(decoded["lon"])
+        times.append(decoded["time"].astype(np.int64) if "time" in dtype.names else np.zeros(len(decoded), np.int64))
+    if batches:
+        # ヘッダと本文をそれぞれ連結し、1回ずつの frombuffer でデコードする
+        headers = np.frombuffer(b"".join(payload[:header] for payload, _ in batches), dtype=HEADER_DTYPE)
+        decoded = np.frombuffer(b"".join(payload[header:] for payload, _ in batches), dtype=RECORD_DTYPE)
+        counts = [(len(payload) - header) // RECORD_DTYPE.itemsize for payload, _ in batches]
+        for (_, addr), count in zip(batches, counts):
+            devices.extend([f"{addr[0]}:{addr[1]}"] * count)
+        epochs.append(np.repeat(headers["epoch"].astype(np.int64), counts))
+        floors.append(np.repeat(headers["floor"].astype(np.int64), counts))
+        seqs.append(decoded["seq"].astype(np.int64))
+        lats.append(decoded["lat"])
+        lons.append(decoded["lon"])
+        times.append(decoded["time"].astype(np.int64))
+
+    if not devices:
+        empty = np.empty(0, dtype=np.float32)
+        none = np.empty(0, dtype=np.int64)
+        return np.empty(0, dtype=object), none, none, none, empty, empty, none
+    return (np.array(devices, dtype=object), np.concatenate(epochs), np.concatenate(floors), np.concatenate(seqs),
+            np.concatenate(lats), np.concatenate(lons), np.concatenate(times))
+
+
+class Deduplicator:
+    """
+    デバイスごとに最近のシーケンス番号を保持し、再送による重複を除く。
+    epoch が変わったら (デバイスの再起動) そのデバイスの既読番号を捨てる
+    """
+
+    def __init__(self, window=DEDUPE_WINDOW):
+        self.window = window
+        self.seen = {}
+        # デバイス -> 最後にレコードを受信した時刻 (time.monotonic())
+        self.last_seen = {}
+        self.duplicates = 0
+
+    def mask(self, devices, epochs, seqs):
+        """
+        Returns:
+            numpy.ndarray: 保存すべきレコードで True となるマスク
+        """
+        keep = np.ones(len(seqs), dtype=bool)
+        now = time.monotonic()
+        for index in np.flatnonzero(seqs >= 0):
+            device = devices[index]
+            epoch = int(epochs[index])
+            seq = int(seqs[index])
+            self.last_seen[device] = now
+            current, highest, recent = self.seen.get(device, (epoch, -1, set()))
+            if current != epoch:
+                highest, recent = -1, set()
+            if seq in recent or seq <= highest - self.window:
+                keep[index] = False
+                continue
+            recent.add(seq)
+            if seq > highest:
+                highest = seq
+                if len(recent) > 2 * self.window:
+                    recent = {s for s in recent if s > highest - self.window}
+            self.seen[device] = (epoch, highest, recent)
+        self.duplicates += int(len(keep) - keep.sum())
+        return keep
+
+    def evict(self, idle):
+        """
+        idle 秒以上受信のないデバイスの既読番号を捨てる
+        Returns:
+            int: 捨てたデバイス数
+        """
+        threshold = time.monotonic() - idle
+        stale = [device for device, seen in self.last_seen.items() if seen < threshold]
+        for device in stale:
+            self.seen.pop(device, None)
+            del self.last_seen[device]
+        return len(stale)
+
+
+class ColumnStore:
+    """
+    レコードを列ごとにためて .npz ファイルに書き出す
+    """
+
+    def __init__(self, directory, chunk_records=STORE_CHUNK_RECORDS):
+        self.directory = directory
+        self.chunk_records = chunk_records
+        self.columns = {"received_at": [], "time": [], "device": [], "seq": [], "lat": [], "lon": []}
+        self.pending = 0
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, received_at, devices, seqs, lats, lons, times):
+        """
+        Args:
+            times (numpy.ndarray): 測位時刻 (UNIX 秒)。0 のレコード (旧形式) は received_at で代用する
+        """
+        self.columns["received_at"].append(np.full(len(seqs), received_at))
+        self.columns["time"].append(np.where(times > 0, times, int(received_at)))
+        self.columns["device"].append(devices.astype(str))
+        self.columns["seq"].append(seqs)
+        self.columns["lat"].append(lats)
+        self.columns["lon"].append(lons)
+        self.pending += len(seqs)
+        if self.pending >= self.chunk_records:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        path = os.path.join(self.directory, f"gps_{time.strftime('%Y%m%dT%H%M%S')}_{self.written}.npz")
+        np.savez(path, **{name: np.concatenate(chunks) for name, chunks in self.columns.items()})
+        logger.info("Wrote %d records to %s", self.pending, path)
+        self.written += self.pending
+        self.pending = 0
+        for chunks in self.columns.values():
+            chunks.clear()
+
+
+class IngestReceiver:
+    """
+    ソケットが読み込み可能になるたびにカーネルのキューを空になるまで読み出し、
+    件数または時間でまとめて処理する
+    """
+
+    def __init__(self, sock, store, flush_datagrams=FLUSH_DATAGRAMS, flush_interval=FLUSH_INTERVAL,
+                 idle_timeout=DEVICE_IDLE_TIMEOUT):
+        self.sock = sock
+        self.store = store
+        self.flush_datagrams = flush_datagrams
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.dedupe = Deduplicator()
+        self.acks = AckTracker()
+        self.buffer = []
+        self.received = 0
+        self.records = 0
+        # 直近の通知 (受信時刻, デバイス, 本文)
+        self.notifications = deque(maxlen=NOTIFICATION_HISTORY)
+        self.notified = 0
+        self.evicted = 0
+        self._evicted_at = time.monotonic()
+        self._loop = None
+        self._timer = None
+
+    def start(self):
+        self.sock.setblocking(False)
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.sock.fileno(), self.drain)
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.sock.fileno())
+        self.process()
+
+    def drain(self):
+        recvfrom = self.sock.recvfrom
+        append = self.buffer.append
+        while True:
+            try:
+                append(recvfrom(MAX_DATAGRAM_SIZE))
+            except BlockingIOError:
+                break
+            if len(self.buffer) >= self.flush_datagrams:
+                self.process()
+                append = self.buffer.append
+        if self.buffer and self._timer is None:
+            self._timer = self._loop.call_later(self.flush_interval, self.process)
+
+    def process(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.buffer = self.buffer, []
+        if not batch:
+            return
+        self.received += len(batch)
+        records = [(payload, addr) for payload, addr in batch if is_record(payload)]
+        if len(records) != len(batch):
+            self.notify([(payload, addr) for payload, addr in batch if not is_record(payload)])
+            batch = records
+        devices, epochs, floors, seqs, lats, lons, times = decode_datagrams(batch)
+        keep = self.dedupe.mask(devices, epochs, seqs)
+        self.records += int(keep.sum())
+        self.store.append(time.time(), devices[keep], seqs[keep], lats[keep], lons[keep], times[keep])
+        self.acknowledge(batch, devices, epochs, floors, seqs)
+        if time.monotonic() - self._evicted_at >= EVICT_INTERVAL:
+            self._evicted_at = time.monotonic()
+            evicted = self.dedupe.evict(self.idle_timeout)
+            self.acks.evict(self.idle_timeout)
+            if evicted:
+                self.evicted += evicted
+                logger.info("Forgot %d devices idle for more than %ds", evicted, self.idle_timeout)
+
+    def notify(self, datagrams):
+        """
+        位置レコード以外のデータグラム (デバイスからの通知) をログに出力し、直近の分を保持する
+        """
+        for payload, addr in datagrams:
+            device = f"{addr[0]}:{addr[1]}"
+            try:
+                message = payload.decode("utf-8")
+            except UnicodeDecodeError:
+                logger.warning("Ignored malformed datagram from %s (%d bytes)", device, len(payload))
+                continue
+            self.notified += 1
+            self.notifications.append((time.time(), device, message))
+            logger.info("Notification from %s: %s", device, message)
+
+    def acknowledge(self, batch, devices, epochs, floors, seqs):
+        """
+        シーケンス番号付きで送ってきたデバイスに、受信状況の ACK を1つずつ返す (重複も ACK の再送に使う)
+        """
+        numbered = seqs >= 0
+        if not numbered.any():
+            return
+        addrs = {f"{addr[0]}:{addr[1]}": addr for payload, addr in batch if payload[:1] == bytes([BATCH_VERSION])}
+        for device in set(devices[numbered]):
+            selected = numbered & (devices == device)
+            # 1回の処理で届いた中で最後のデータグラムの epoch と、最大の floor を使う
+            epoch = int(epochs[selected][-1])
+            current = selected & (epochs == epoch)
+            self.acks.update(device, epoch, int(floors[current].max()), seqs[current].tolist())
+            addr = addrs.get(device)
+            if addr is None:
+                continue
+            try:
+                self.sock.sendto(pack_ack(*self.acks.ack(device)), addr)
+            except OSError as e:
+                logger.debug("Failed to send ACK to %s: %s", device, e)
+
+
+def send_command(device_ip, command, sock=None):
+    """
+    デバイスの COMMAND_UDP_PORT にコマンド (例: "INTERVAL=60;PROTOCOL=UDP") を送る
+    """
+    own_sock = sock is None
+    if own_sock:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(command.encode("utf-8"), (device_ip, config.COMMAND_UDP_PORT))
+        logger.info("Sent command to %s:%s: %s", device_ip, config.COMMAND_UDP_PORT, command)
+    finally:
+        if own_sock:
+            sock.close()
+
+
+async def serve(host, port, directory):
+    """
+    受信サービスを起動し、停止されるまで受信を続ける
+    """
+    store = ColumnStore(directory)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # バースト時の取りこぼしを減らすため受信バッファを広げる
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind((host, port))
+    receiver = IngestReceiver(sock, store)
+    receiver.start()
+    logger.info("Ingest server listening on %s:%s", host, port)
+    try:
+        while True:
+            await asyncio.sleep(10)
+            logger.info("Received %d datagrams, stored %d records, dropped %d duplicates, %d notifications",
+                        receiver.received, receiver.records, receiver.dedupe.duplicates,
+                        receiver.notified)
+    finally:
+        receiver.stop()
+        store.flush()
+        sock.close()
+
+
+def generate_load(host, port, datagrams, batch_size=1, devices=16):
+    """
+    負荷生成: 単発 (batch_size=1) またはバッチ形式のデータグラムをできるだけ速く送信する
+    """
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(devices)]
+    addr = (host, port)
+    now = int(time.time())
+    single = struct.pack("<ffI", 35.681, 139.767, now)
+    for i in range(datagrams):
+        sock = socks[i % devices]
+        if batch_size == 1:
+            payload = single
+        else:
+            base = (i // devices) * batch_size
+            payload = pack_batch((base + j, 35.681, 139.767, now) for j in range(batch_size))
+        try:
+            sock.sendto(payload, addr)
+        except BlockingIOError:
+            pass
+    for sock in socks:
+        sock.close()
+
+
+def benchmark(datagrams=200_000, batch_size=1, port=0):
+    """
+    ループバック上で負荷生成プロセスから送信し、受信・デコード・保存の処理速度を測定する
+    """
+    import multiprocessing
+    import tempfile
+
+    async def run():
+        store = ColumnStore(tempfile.mkdtemp(prefix="ingest_bench_"))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 32 * 1024 * 1024)
+        sock.bind(("127.0.0.1", port))
+        receiver = IngestReceiver(sock, store)
+        receiver.start()
+        sender = multiprocessing.Process(target=generate_load,
+                                         args=("127.0.0.1", sock.getsockname()[1], datagrams, batch_size))
+        sender.start()
+        # 最初のデータグラムが届いてから受信が止まるまでを計測する
+        while not receiver.received and not receiver.buffer:
+            await asyncio.sleep(0.001)
+        started = time.perf_counter()
+        last = -1
+        while sender.is_alive() or receiver.received + len(receiver.buffer) != last:
+            last = receiver.received + len(receiver.buffer)
+            await asyncio.sleep(0.1)
+        receiver.stop()
+        elapsed = time.perf_counter() - started - 0.1
+        store.flush()
+        sock.close()
+        return receiver, elapsed
+
+    receiver, elapsed = asyncio.run(run())
+    rate = receiver.received / elapsed
+    print(f"sent={datagrams} received={receiver.received} records={receiver.records} "
+          f"duplicates={receiver.dedupe.duplicates} elapsed={elapsed:.2f}s rate={rate:,.0f} datagrams/s")
+
+    # 受信部分を除いたデコード・重複除去の処理速度 (1コア)
+    now = int(time.time())
+    sample = [(struct.pack("<ffI", 35.681, 139.767, now) if batch_size == 1 else
+               pack_batch([(i, 35.681, 139.767, now)]), ("10.0.0.1", 40000 + i % 16)) for i in range(FLUSH_DATAGRAMS)]
+    dedupe = Deduplicator()
+    started = time.perf_counter()
+    rounds = 50
+    for _ in range(rounds):
+        devices, epochs, floors, seqs, lats, lons, times = decode_datagrams(sample)
+        dedupe.mask(devices, epochs, seqs)
+    decode_rate = rounds * len(sample) / (time.perf_counter() - started)
+    print(f"decode+dedupe: {decode_rate:,.0f} datagrams/s")
+    return rate, decode_rate
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingest receiver for gps_device_sender datagrams")
+    parser.add_argument("--host", default="0.0.0.0", help="Listen address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=config.UDP_PORT, help=f"Listen port (default: {config.UDP_PORT})")
+    parser.add_argument("--output", default="ingest_data", help="Directory for columnar output (default: ingest_data)")
+    parser.add_argument("--command", nargs=2, metavar=("DEVICE_IP", "COMMAND"), help="Send a command to a device and exit")
+    parser.add_argument("--benchmark", action="store_true", help="Run the loopback load generator benchmark")
+    parser.add_argument("--datagrams", type=int, default=200_000, help="Datagrams to send in benchmark mode")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Records per datagram in benchmark mode (1 = single 12-byte format)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.command:
+        send_command(*args.command)
+    elif args.benchmark:
+        benchmark(args.datagrams, args.batch_size)
+    else:
+        try:
+            asyncio.run(serve(args.host, args.port, args.output))
+        except KeyboardInterrupt:
+            logger.info("Ingest server stopped by user")
@@ -0,0 +1,433 @@
+"""
+UDP テレメトリの再送制御 (シーケンス番号 + スライディングウィンドウ + 選択的 ACK)
+
+デバイスはメッセージごとにシーケンス番号を付けたバッチ形式のデータグラムを送り、
+ウィンドウ内では ACK を待たずに次を送る。サーバはデバイスごとに
+「ここまで全部受信した番号 (base)」と、その先 64 件の受信状況のビットマップを返す。
+デバイスは欠けた番号だけを RTT から求めたタイムアウト (RFC 6298) で再送する。
+再送を諦めた番号はデータの floor で知らせ、サーバは base を floor まで進める (欠番で止まらない)。
+シーケンス番号は起動ごとに乱数で決める epoch の中で数え、epoch が変わったらサーバは受信状況を捨てる。
+LTE を使えない間 (GNSS ウィンドウ) は pause() で送信と再送を止め、止めていた時間は再送タイムアウトに数えない。
+
+ペイロード形式:
+    データ: BATCH_HEADER '<BII' (BATCH_VERSION, epoch, floor) + ('<IffI' seq, lat, lon, 測位時刻) * N
+            floor 未満の番号は受信済みか再送を諦めたもの
+    ACK:    ACK_FORMAT '<BIIQ' (ACK_VERSION, epoch, base, bitmap)
+            bitmap の bit i は seq = base + 1 + i を受信済みであることを示す (base 自体は未受信)
+"""
+
+import asyncio
+import logging
+import os
+import struct
+import time
+
+logger = logging.getLogger("device")
+
+BATCH_VERSION = 0x03
+BATCH_HEADER = struct.Struct("<BII")
+ACK_VERSION = 0x04
+ACK_FORMAT = struct.Struct("<BIIQ")
+ACK_BITMAP_BITS = 64
+# 同時に ACK 待ちにできるメッセージ数
+WINDOW_SIZE = 32
+# 再送タイムアウト（秒）。CoAP の ACK_TIMEOUT / MAX_RETRANSMIT に合わせる
+INITIAL_RTO = 2.0
+MIN_RTO = 0.5
+MAX_RTO = 60.0
+MAX_RETRANSMIT = 4
+# 後続の番号が届いているのに欠けていると何回報告されたら、タイムアウトを待たずに再送するか
+FAST_RETRANSMIT_THRESHOLD = 3
+# 再送タイマーの確認間隔（秒）
+TIMER_INTERVAL = 0.05
+
+
+def new_epoch():
+    """
+    起動ごとの epoch (0 以外の 32 ビット乱数)
+    """
+    return int.from_bytes(os.urandom(4), "little") or 1
+
+
+def pack_batch(records, epoch=1, floor=0):
+    """
+    (seq, lat, lon, 測位時刻の UNIX 秒) のリストをバッチペイロードにする
+    """
+    body = b"".join(struct.pack("<IffI", *record) for record in records)
+    return BATCH_HEADER.pack(BATCH_VERSION, epoch, floor) + body
+
+
+def pack_ack(epoch, base, bitmap):
+    return ACK_FORMAT.pack(ACK_VERSION, epoch, base, bitmap)
+
+
+def parse_ack(data):
+    """
+    Returns:
+        tuple: (epoch, base, bitmap)。ACK でなければ None
+    """
+    if len(data) != ACK_FORMAT.size or data[0] != ACK_VERSION:
+        return None
+    _, epoch, base, bitmap = ACK_FORMAT.unpack(data)
+    return epoch, base, bitmap
+
+
+class AckTracker:
+    """
+    サーバ側: デバイスごとの受信状況から ACK (epoch, base, bitmap) を作る
+    """
+
+    def __init__(self):
+        # デバイス -> (epoch, base, base より先に受信した番号の集合)
+        self.state = {}
+        # デバイス -> 最後に update() した時刻 (time.monotonic())
+        self.last_seen = {}
+
+    def update(self, device, epoch, floor, seqs):
+        """
+        受信した番号を記録する。epoch が変わったら (デバイスの再起動) それまでの状況を捨てる
+        Args:
+            floor (int): デバイスがもう再送しない番号の上限 (これ未満は欠けていても base を進める)
+        """
+        current, base, received = self.state.get(device, (epoch, 0, set()))
+        if current != epoch:
+            base, received = 0, set()
+        if floor > base:
+            base = floor
+            received = {seq for seq in received if seq >= base}
+        # bitmap で表せる範囲だけを保持する (範囲外はデバイスが再送する)
+        limit = base + 1 + ACK_BITMAP_BITS
+        for seq in seqs:
+            if base <= seq < limit:
+                received.add(seq)
+        while base in received:
+            received.discard(base)
+            base += 1
+        self.state[device] = (epoch, base, received)
+        self.last_seen[device] = time.monotonic()
+
+    def evict(self, idle):
+        """
+        idle 秒以上受信のないデバイスの状況を捨てる。戻ってきたデバイスは floor から数え直す
+        Returns:
+            int: 捨てたデバイス数
+        """
+        threshold = time.monotonic() - idle
+        stale = [device for device, seen in self.last_seen.items() if seen < threshold]
+        for device in stale:
+            del self.state[device]
+            del self.last_seen[device]
+        return len(stale)
+
+    def ack(self, device):
+        epoch, base, received = self.state[device]
+        bitmap = 0
+        for seq in received:
+            offset = seq - base - 1
+            if 0 <= offset < ACK_BITMAP_BITS:
+                bitmap |= 1 << offset
+        return epoch, base, bitmap
+
+
+class _Pending:
+    __slots__ = ("data", "first_sent", "sent_at", "deadline", "retries", "gap_reports")
+
+    def __init__(self, data):
+        self.data = data
+        self.first_sent = None
+        self.sent_at = None
+        self.deadline = None
+        self.retries = 0
+        self.gap_reports = 0
+
+
+class ReliableSender:
+    """
+    デバイス側: ACK 待ちのメッセージを保持し、欠けたものだけを再送する
+    Args:
+        sock (socket.socket): 送信に使う UDP ソケット (ACK も同じソケットで受信する)
+        addr (tuple): 送信先 (host, port)
+        window (int): 同時に ACK 待ちにできるメッセージ数 (1 なら CoAP CON と同じ1往復ずつの送信)
+        epoch (int): シーケンス番号の世代 (省略時は乱数。再起動後の seq 0 を重複と見なされないようにする)
+    """
+
+    def __init__(self, sock, addr, window=WINDOW_SIZE, max_retransmit=MAX_RETRANSMIT, epoch=None):
+        self.sock = sock
+        self.addr = addr
+        self.window = window
+        self.max_retransmit = max_retransmit
+        self.epoch = new_epoch() if epoch is None else epoch
+        self.next_seq = 0
+        self.unacked = {}
+        self.srtt = None
+        self.rttvar = None
+        self.rto = INITIAL_RTO
+        self.stats = {"sent": 0, "retransmits": 0, "fast_retransmits": 0, "acked": 0, "lost": 0, "acks": 0}
+        self._space = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._loop = None
+        self._task = None
+        # pause() した時刻 (time.monotonic())。None なら送信できる
+        self.paused_at = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.sock.setblocking(False)
+        self._loop.add_reader(self.sock.fileno(), self._on_readable)
+        self._task = asyncio.create_task(self._timer())
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.sock.fileno())
+            self._loop = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def pause(self):
+        """
+        送信と再送を止める (GNSS ウィンドウの間など LTE を使えないとき)
+        """
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def resume(self):
+        """
+        送信と再送を再開する。止めていた時間だけ再送タイムアウトと RTT の起点をずらし、
+        止めている間に send() されたメッセージを送信する
+        """
+        if self.paused_at is None:
+            return
+        now = time.monotonic()
+        shift = now - self.paused_at
+        self.paused_at = None
+        for seq, pending in list(self.unacked.items()):
+            if pending.deadline is None:
+                self._transmit(seq)
+                continue
+            pending.deadline += shift
+            if pending.retries == 0:
+                pending.first_sent += shift
+
+    async def send(self, payload):
+        """
+        ペイロード (struct.pack('<ffI', lat, lon, 測位時刻) の 12 バイト) に番号を付けて送信する。
+        ウィンドウが空くまで待つが、ACK は待たない。pause() 中は resume() まで送信しない
+        Returns:
+            int: 付けたシーケンス番号
+        """
+        while not self._has_space():
+            self._space.clear()
+            await self._space.wait()
+        seq = self.next_seq
+        self.next_seq += 1
+        self.unacked[seq] = _Pending(struct.pack("<I", seq) + payload)
+        self._idle.clear()
+        self.stats["sent"] += 1
+        if self.paused_at is None:
+            self._transmit(seq)
+        return seq
+
+    async def drain(self, timeout=None):
+        """
+        送信済みのメッセージがすべて ACK されるか、再送を諦めるまで待つ
+        Returns:
+            bool: timeout 内に ACK 待ちがなくなればTrue
+        """
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _send_datagram(self, data):
+        try:
+            self.sock.sendto(data, self.addr)
+        except OSError as e:
+            # 送信バッファ不足や経路なしはタイムアウトで再送する
+            logger.debug("Reliable UDP send failed: %s", e)
+
+    def _transmit(self, seq, retransmit=False):
+        pending = self.unacked[seq]
+        now = time.monotonic()
+        if retransmit:
+            pending.retries += 1
+            self.stats["retransmits"] += 1
+        else:
+            pending.first_sent = now
+        pending.sent_at = now
+        pending.deadline = now + min(self.rto * (2 ** pending.retries), MAX_RTO)
+        pending.gap_reports = 0
+        # floor は送信のたびに求め直し、再送を諦めた番号をサーバに飛ばさせる
+        floor = min(self.unacked)
+        self._send_datagram(BATCH_HEADER.pack(BATCH_VERSION, self.epoch, floor) + pending.data)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(64)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # 送信先が ICMP で拒否した場合など。次の受信を待つ
+                return
+            self.handle_ack(data)
+
+    def handle_ack(self, data):
+        parsed = parse_ack(data)
+        if parsed is None:
+            return
+        epoch, base, bitmap = parsed
+        if epoch != self.epoch:
+            # 再起動前の送信に対する ACK
+            return
+        self.stats["acks"] += 1
+        now = time.monotonic()
+        highest = base + bitmap.bit_length()
+        for seq in list(self.unacked):
+            if seq < base or (seq > base and (bitmap >> (seq - base - 1)) & 1):
+                pending = self.unacked.pop(seq)
+                self.stats["acked"] += 1
+                # 再送したメッセージの RTT は使わない (Karn のアルゴリズム)
+                if pending.retries == 0:
+                    self._sample_rtt(now - pending.first_sent)
+            elif seq < highest:
+                # 後続の番号は届いているのにこの番号が欠けている
+                pending = self.unacked[seq]
+                pending.gap_reports += 1
+                if (pending.gap_reports >= FAST_RETRANSMIT_THRESHOLD and pending.retries < self.max_retransmit
+                        and self.paused_at is None):
+                    self.stats["fast_retransmits"] += 1
+                    self._transmit(seq, retransmit=True)
+        self._update_events()
+
+    def _sample_rtt(self, rtt):
+        # RFC 6298
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+    def _has_space(self):
+        if len(self.unacked) >= self.window:
+            return False
+        # ACK の bitmap で表せない番号は送らない (欠番の再送中は base + ACK_BITMAP_BITS で止まる)
+        return not self.unacked or self.next_seq - min(self.unacked) < ACK_BITMAP_BITS
+
+    def _update_events(self):
+        if self._has_space():
+            self._space.set()
+        if not self.unacked:
+            self._idle.set()
+
+    async def _timer(self):
+        while True:
+            await asyncio.sleep(TIMER_INTERVAL)
+            if self.paused_at is not None:
+                continue
+            now = time.monotonic()
+            for seq, pending in list(self.unacked.items()):
+                if pending.deadline is None or now < pending.deadline:
+                    continue
+                if pending.retries >= self.max_retransmit:
+                    del self.unacked[seq]
+                    self.stats["lost"] += 1
+                    logger.warning("Giving up on message seq=%d after %d retransmissions", seq, pending.retries)
+                else:
+                    self._transmit(seq, retransmit=True)
+            self._update_events()
+
+    def metrics(self):
+        """
+        Returns:
+            dict: 送信・再送・ACK・喪失の件数、再送率、平滑化 RTT と現在の RTO
+        """
+        sent = self.stats["sent"]
+        return dict(self.stats,
+                    in_flight=len(self.unacked),
+                    paused=self.paused_at is not None,
+                    retransmit_ratio=self.stats["retransmits"] / sent if sent else 0.0,
+                    srtt=self.srtt,
+                    rto=self.rto)
+
+
+class _LossyLink(ReliableSender):
+    """
+    ベンチマーク用: 片道遅延とパケット損失 (データ・ACK の両方向) を模擬する
+    """
+
+    def __init__(self, *args, loss=0.1, delay=0.1, rng=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loss = loss
+        self.delay = delay
+        self.rng = rng
+
+    def _send_datagram(self, data):
+        if self.rng.random() >= self.loss:
+            self._loop.call_later(self.delay, super()._send_datagram, data)
+
+    def handle_ack(self, data):
+        if self.rng.random() >= self.loss:
+            self._loop.call_later(self.delay, super().handle_ack, data)
+
+
+def benchmark(messages=500, loss=0.1, delay=0.1, windows=(1, 8, 32), seed=1):
+    """
+    ループバック上の受信サーバ (ingest_server) に、遅延と損失を模擬したリンクで送信し、
+    ウィンドウサイズごとのスループット・到達率・再送率を比べる (window=1 は CoAP CON 相当)
+    """
+    import random
+    import socket
+    import tempfile
+
+    from ingest_server import ColumnStore, IngestReceiver
+
+    payload = struct.pack("<ffI", 35.681, 139.767, int(time.time()))
+
+    async def run(window):
+        server_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server_sock.bind(("127.0.0.1", 0))
+        receiver = IngestReceiver(server_sock, ColumnStore(tempfile.mkdtemp(prefix="reliable_bench_")),
+                                  flush_interval=0.01)
+        receiver.start()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender = _LossyLink(sock, server_sock.getsockname(), window=window, loss=loss, delay=delay,
+                            rng=random.Random(seed))
+        sender.start()
+        started = time.monotonic()
+        for _ in range(messages):
+            await sender.send(payload)
+        await sender.drain()
+        elapsed = time.monotonic() - started
+        sender.close()
+        receiver.stop()
+        sock.close()
+        server_sock.close()
+        return sender.metrics(), receiver.records, elapsed
+
+    print(f"{messages} messages, {loss:.0%} loss each way, RTT {delay * 2 * 1000:.0f} ms")
+    results = {}
+    for window in windows:
+        metrics, delivered, elapsed = asyncio.run(run(window))
+        results[window] = (messages / elapsed, delivered, metrics)
+        srtt = f"{metrics['srtt'] * 1000:.0f} ms" if metrics["srtt"] is not None else "-"
+        print(f"window={window:3d}: {messages / elapsed:7.1f} msg/s, delivered {delivered}/{messages}, "
+              f"retransmits {metrics['retransmits']} ({metrics['retransmit_ratio']:.0%}), lost {metrics['lost']}, "
+              f"srtt {srtt}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark windowed reliable UDP against stop-and-wait")
+    parser.add_argument("--messages", type=int, default=500, help="Messages per run (default: 500)")
+    parser.add_argument("--loss", type=float, default=0.1, help="Loss probability in each direction (default: 0.1)")
+    parser.add_argument("--delay", type=float, default=0.1, help="One-way delay in seconds (default: 0.1)")
+    args = parser.parse_args()
+
+    benchmark(args.messages, args.loss, args.delay)
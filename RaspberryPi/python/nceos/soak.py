@@ -0,0 +1,270 @@
+"""
+gps_device_sender の長時間稼働試験 (ソークテスト)
+
+疑似モデム (sim7080g.emulator) とローカルの UDP 受信ソケットを相手に、送信間隔を縮めた
+device_main と command_server を動かし続け、一定間隔で次の値を記録する:
+    RSS, 開いているファイルディスクリプタ数, asyncio タスク数, スレッド数, tracemalloc の確保量
+ウォームアップ後の最初の 1/3 と最後の 1/3 の中央値の差が閾値を超えたら失敗とし、
+tracemalloc で増えた確保箇所の上位を表示する。main ループで握りつぶされたエラーも件数を集計する。
+
+例: python soak.py --duration 14400 --csv soak.csv
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from statistics import median
+
+import config
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from sim7080g.emulator import FakeModem
+
+logger = logging.getLogger("soak")
+
+# 許容する増加量 (ウォームアップ後の最初と最後の 1/3 の中央値の差)
+THRESHOLDS = {
+    "rss_kb": 8 * 1024,
+    "traced_kb": 4 * 1024,
+    "fds": 5,
+    "tasks": 5,
+    "threads": 3,
+}
+# 加速した送信間隔（秒）
+SOAK_SEND_INTERVAL = 1
+SOAK_MAX_SEND_INTERVAL = 5
+TOP_ALLOCATIONS = 10
+# 確保箇所の比較から除く、試験側 (疑似モデム・この試験自身) のファイル
+HARNESS_FILES = ("*/sim7080g/emulator.py", os.path.abspath(__file__), tracemalloc.__file__)
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _fix_line(step):
+    # 北東へ移動し続ける測位結果 (停止中と判定されて測位間隔が伸びないよう速度を付ける)
+    utc = time.strftime("%Y%m%d%H%M%S.000", time.gmtime())
+    return f"+CGNSINF: 1,1,{utc},{35.68 + step * 1e-4:.6f},{139.76 + step * 1e-4:.6f},40.0,20.0,45.0"
+
+
+def read_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def count_fds():
+    try:
+        return len(os.listdir("/proc/self/fd")) - 1
+    except OSError:
+        return None
+
+
+class ErrorCounter(logging.Handler):
+    """
+    ERROR 以上のログをメッセージの書式ごとに数える (ループ内で握りつぶされた例外の把握用)
+    """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.counts = Counter()
+
+    def emit(self, record):
+        self.counts[str(record.msg)] += 1
+
+
+def growth(samples, key):
+    """
+    最初の 1/3 と最後の 1/3 の中央値の差。値が取れない項目は None
+    """
+    values = [sample[key] for sample in samples if sample[key] is not None]
+    if len(values) < 3:
+        return None
+    third = len(values) // 3
+    return median(values[-third:]) - median(values[:third])
+
+
+async def run(duration, sample_interval, warmup, command_interval, transport, thresholds, csv_path, verbose=False):
+    workdir = tempfile.mkdtemp(prefix="soak_")
+    fake = FakeModem(responses={"AT+CGNSINF": _fix_line(0)})
+
+    # 受信側のスタンドイン: 送られてきたデータグラムを数えるだけ
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    sink.setblocking(False)
+    received = [0]
+
+    def on_datagram():
+        while True:
+            try:
+                sink.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            received[0] += 1
+
+    config.SERIAL_PORT = fake.start()
+    config.UDP_ENDPOINT, config.UDP_PORT = sink.getsockname()
+    config.UDP_TRANSPORT = transport
+    config.PROTOCOL = "UDP"
+    config.COMMAND_UDP_PORT = _free_port()
+    config.SEND_INTERVAL = SOAK_SEND_INTERVAL
+    config.MIN_SEND_INTERVAL = SOAK_SEND_INTERVAL
+    config.MAX_SEND_INTERVAL = SOAK_MAX_SEND_INTERVAL
+    config.AT_CACHE_FILE = os.path.join(workdir, "at_cache.json")
+    config.GNSS_CACHE_DIR = workdir
+    config.LOG_FILE = None
+    config.AT_TRACE_FILE = None
+    # XTRA は作成直後のキャッシュを置いてダウンロードさせない
+    with open(os.path.join(workdir, "xtra3gr_72h.bin"), "wb") as f:
+        f.write(b"\0" * 1024)
+
+    import gps_device_sender as sender
+
+    errors = ErrorCounter()
+    for name in ("device", "sim7080g"):
+        logging.getLogger(name).addHandler(errors)
+        if not verbose:
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    loop = asyncio.get_running_loop()
+    loop.add_reader(sink.fileno(), on_datagram)
+    app = asyncio.create_task(sender.main())
+
+    async def move():
+        step = 0
+        while True:
+            step += 1
+            fake.responses["AT+CGNSINF"] = _fix_line(step)
+            await asyncio.sleep(1)
+
+    async def send_commands():
+        # 設定変更のたびに notify_config_change が通知を送る
+        commands = ("INTERVAL=1", "INTERVAL=2")
+        index = 0
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            while True:
+                await asyncio.sleep(command_interval)
+                sock.sendto(commands[index % 2].encode(), ("127.0.0.1", config.COMMAND_UDP_PORT))
+                index += 1
+
+    def delivered():
+        # MODEM の場合はホストのソケットを通らないため、疑似モデムが AT+CASEND で受け取ったバイト数を使う
+        return received[0] if transport == "PPP" else len(fake.received)
+
+    helpers = [asyncio.create_task(move()), asyncio.create_task(send_commands())]
+    samples = []
+    baseline = None
+    started = time.monotonic()
+    writer = None
+    csv_file = open(csv_path, "w", newline="") if csv_path else None
+    try:
+        while time.monotonic() - started < duration and not app.done():
+            await asyncio.sleep(sample_interval)
+            elapsed = time.monotonic() - started
+            sample = {
+                "elapsed": round(elapsed, 1),
+                "rss_kb": read_rss_kb(),
+                "traced_kb": tracemalloc.get_traced_memory()[0] // 1024,
+                "fds": count_fds(),
+                "tasks": len(asyncio.all_tasks()),
+                "threads": threading.active_count(),
+                "delivered": delivered(),
+                "errors": sum(errors.counts.values()),
+            }
+            if csv_file:
+                if writer is None:
+                    writer = csv.DictWriter(csv_file, fieldnames=list(sample))
+                    writer.writeheader()
+                writer.writerow(sample)
+                csv_file.flush()
+            if elapsed < warmup:
+                continue
+            if baseline is None:
+                baseline = tracemalloc.take_snapshot()
+            samples.append(sample)
+            logger.info("t=%6.0fs rss=%s KB traced=%d KB fds=%s tasks=%d threads=%d delivered=%d errors=%d",
+                        elapsed, sample["rss_kb"], sample["traced_kb"], sample["fds"], sample["tasks"],
+                        sample["threads"], sample["delivered"], sample["errors"])
+    finally:
+        for task in helpers + [app]:
+            task.cancel()
+        await asyncio.gather(*helpers, app, return_exceptions=True)
+        loop.remove_reader(sink.fileno())
+        sink.close()
+        fake.stop()
+        if csv_file:
+            csv_file.close()
+
+    if app.done() and not app.cancelled() and app.exception() is not None:
+        logger.error("Sender exited early: %r", app.exception())
+        return False
+
+    failed = []
+    unit = "datagrams" if transport == "PPP" else "bytes via AT+CASEND"
+    print(f"\n{len(samples)} samples after {warmup:.0f}s warm-up, {delivered()} {unit} delivered")
+    for key, limit in thresholds.items():
+        value = growth(samples, key)
+        verdict = "n/a" if value is None else ("FAIL" if value > limit else "ok")
+        if verdict == "FAIL":
+            failed.append(key)
+        print(f"  {key:10s} growth {value if value is not None else '-':>8} (limit {limit}) {verdict}")
+    if errors.counts:
+        print("Errors logged by the sender:")
+        for message, count in errors.counts.most_common(TOP_ALLOCATIONS):
+            print(f"  {count:6d}  {message}")
+    if baseline is not None:
+        print("Top allocation growth since warm-up:")
+        exclude = [tracemalloc.Filter(False, pattern) for pattern in HARNESS_FILES]
+        snapshot = tracemalloc.take_snapshot().filter_traces(exclude)
+        for stat in snapshot.compare_to(baseline.filter_traces(exclude), "lineno")[:TOP_ALLOCATIONS]:
+            print(f"  {stat}")
+    if not delivered():
+        print("Nothing reached the stand-in server.")
+        failed.append("delivered")
+    print("RESULT:", "FAIL (" + ", ".join(failed) + ")" if failed else "PASS")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak-test gps_device_sender against local stand-ins")
+    parser.add_argument("--duration", type=float, default=3600, help="Test duration in seconds (default: 3600)")
+    parser.add_argument("--interval", type=float, default=10, help="Sampling interval in seconds (default: 10)")
+    parser.add_argument("--warmup", type=float, default=60, help="Seconds excluded from growth checks (default: 60)")
+    parser.add_argument("--command-interval", type=float, default=5,
+                        help="Seconds between config-change commands (default: 5)")
+    parser.add_argument("--transport", choices=("PPP", "MODEM"), default="PPP",
+                        help="UDP transport to exercise (default: PPP, i.e. host sockets)")
+    parser.add_argument("--csv", help="Write the sampled time series to this CSV file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the sender's INFO logs")
+    for key, limit in THRESHOLDS.items():
+        parser.add_argument(f"--max-{key.replace('_', '-')}", type=int, default=limit,
+                            help=f"Allowed growth of {key} (default: {limit})")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    thresholds = {key: getattr(args, f"max_{key}") for key in THRESHOLDS}
+    ok = asyncio.run(run(args.duration, args.interval, args.warmup, args.command_interval, args.transport,
+                         thresholds, args.csv, args.verbose))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+SIM7080G Cat-M/NB-IoT HAT 共通ライブラリ
+
+import するだけではシリアルポートや GPIO には触れない。
+"""
+
+from .at import ATEngine
+from .gpio import create_backend
+from .modem import Modem
+from .scheduler import ATScheduler
+from .trace import Tracer
+
+__all__ = ["ATEngine", "ATScheduler", "Modem", "Tracer", "create_backend"]
@@ -0,0 +1,164 @@
+"""
+AT コマンドエンジン
+
+固定の sleep で応答を待つ代わりに、最終リザルトコード (OK / ERROR など) や
+期待する文字列を受信した時点で即座に戻る。
+"""
+
+import logging
+import time
+
+from .trace import ATTrace
+
+logger = logging.getLogger("sim7080g")
+
+# 応答の終端とみなすリザルトコード
+FINAL_RESULTS = ("OK\r\n", "ERROR\r\n", "+CME ERROR:", "+CMS ERROR:", "NO CARRIER\r\n")
+
+
+def response_lines(response, command=None):
+    """
+    応答からエコーバックと最終リザルトコードを除いた情報行を返す
+    例: "AT+GSN\r\r\n861234567890123\r\n\r\nOK" -> ["861234567890123"]
+    """
+    lines = []
+    for line in response.splitlines():
+        line = line.strip()
+        if not line or line == command or line in ("OK", "ERROR"):
+            continue
+        lines.append(line)
+    return lines
+
+
+class ATEngine:
+    """
+    シリアルポート1本に対して AT コマンドを送受信する
+    """
+
+    def __init__(self, ser, poll_interval=0.01):
+        self.ser = ser
+        self.poll_interval = poll_interval
+        # コマンドごとに ATTrace を受け取るコールバック (trace.Tracer.record など)
+        self.hooks = []
+        # コマンドを送らずに read_urc() で読んだ文字列を受け取るコールバック (cache.ResponseCache.observe_urc など)
+        self.urc_hooks = []
+        self.first_byte_at = None
+
+    def read_until(self, tokens, timeout):
+        """
+        tokens のいずれかを受信するか timeout 秒経過するまで読み込む
+        Returns:
+            str: 受信した文字列 (タイムアウト時はそれまでに受信した分)
+        """
+        tokens = tuple(token.encode() for token in tokens)
+        self.first_byte_at = None
+        buff = self._read(lambda data: any(token in data for token in tokens), time.monotonic() + timeout)
+        return buff.decode(errors="ignore")
+
+    def read_urc(self, tokens, timeout):
+        """
+        コマンドを送らずに URC を待つ (read_until と同じ)。受信した文字列は urc_hooks にも渡す
+        Returns:
+            str: 受信した文字列
+        """
+        text = self.read_until(tokens, timeout)
+        if text:
+            for hook in self.urc_hooks:
+                hook(text)
+        return text
+
+    def _read(self, done, deadline, buff=b""):
+        """
+        done(受信したバイト列) が True になるか deadline を過ぎるまで読み込む
+        """
+        if buff and done(buff):
+            return buff
+        while True:
+            waiting = self.ser.in_waiting
+            if waiting:
+                if self.first_byte_at is None:
+                    self.first_byte_at = time.monotonic()
+                buff += self.ser.read(waiting)
+                if done(buff):
+                    return buff
+            elif time.monotonic() >= deadline:
+                return buff
+            else:
+                time.sleep(self.poll_interval)
+
+    def read_payload(self, pattern, timeout):
+        """
+        長さ付きの本文 (+CARECV: <長さ>,<本文> など) をバイト列のまま読み込む。
+        本文は文字列に変換すると 0x80 以上のバイトが失われるため、ヘッダの長さ分だけそのまま取り出す
+        Args:
+            pattern (re.Pattern): bytes の正規表現。最初のグループが本文の長さで、一致した直後から本文が始まる
+        Returns:
+            tuple: (ヘッダまでの受信文字列, 本文 bytes, 本文の後に受信済みの文字列)。
+                ヘッダか本文が timeout 内に揃わなければ本文は None
+        """
+        deadline = time.monotonic() + timeout
+        self.first_byte_at = None
+        buff = self._read(lambda data: pattern.search(data) is not None, deadline)
+        match = pattern.search(buff)
+        if match is None:
+            return buff.decode(errors="ignore"), None, ""
+        end = match.end() + int(match.group(1))
+        buff = self._read(lambda data: len(data) >= end, deadline, buff)
+        head = buff[:match.end()].decode(errors="ignore")
+        if len(buff) < end:
+            return head, None, ""
+        return head, buff[match.end():end], buff[end:].decode(errors="ignore")
+
+    def execute(self, command, timeout=1, expect=None, retries=1):
+        """
+        AT コマンドを送信し、応答を返す
+        Args:
+            command (str): 送信するコマンド ("\\r\\n" は不要)
+            timeout (float): 応答待ちの最大時間（秒）
+            expect (str): 最終リザルトコード以外に応答の終端とみなす文字列 (例: ">")
+            retries (int): 応答がない場合の試行回数
+        Returns:
+            str: 応答文字列 (前後の空白は除去)。応答がなければ空文字列
+        """
+        tokens = FINAL_RESULTS + ((expect,) if expect else ())
+        data = (command + "\r\n").encode()
+        sent_at = None
+        for attempt in range(1, retries + 1):
+            self.ser.reset_input_buffer()
+            logger.debug(f"Sending AT command (Attempt {attempt}/{retries}): {command}")
+            if sent_at is None:
+                sent_at = time.monotonic()
+            self.ser.write(data)
+            raw = self.read_until(tokens, timeout)
+            response = raw.strip()
+            if response:
+                logger.debug(f"AT command response: {response}")
+                if self.hooks:
+                    self._emit(command, sent_at, data, raw, attempt, tokens)
+                return response
+            logger.warning(f"No response received for command '{command}' (Attempt {attempt}/{retries}).")
+        if self.hooks:
+            self._emit(command, sent_at, data, "", retries, tokens)
+        return ""
+
+    def _emit(self, command, sent_at, data, raw, attempts, tokens):
+        if "OK\r\n" in raw:
+            outcome = "ok"
+        elif any(token in raw for token in FINAL_RESULTS):
+            outcome = "error"
+        elif any(token in raw for token in tokens):
+            outcome = "prompt"
+        else:
+            outcome = "timeout"
+        trace = ATTrace(command, sent_at, self.first_byte_at, time.monotonic(), len(data) * attempts, len(raw),
+                        attempts, outcome, raw)
+        for hook in self.hooks:
+            hook(trace)
+
+    def write(self, data):
+        """
+        AT コマンド以外の生データ (AT+CASEND の本文など) を送信する
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        self.ser.write(data)
@@ -0,0 +1,111 @@
+"""
+UART のボーレート自動検出・切り替えと RTS/CTS フロー制御
+"""
+
+import logging
+import time
+
+logger = logging.getLogger("sim7080g")
+
+# AT+IPR で切り替える候補 (高速な順)
+CANDIDATE_BAUDRATES = [921600, 460800, 230400, 115200, 57600, 38400, 19200, 9600]
+THROUGHPUT_TEST_ROUNDS = 20  # 各ボーレートでのスループット測定回数
+
+
+def autobaud(modem, candidates=CANDIDATE_BAUDRATES):
+    """
+    候補のボーレートを順に試し、モジュールが応答したボーレートを返す
+    Returns:
+        int: 検出したボーレート。応答がなければ None
+    """
+    logger.info("Detecting modem baud rate...")
+    for rate in candidates:
+        modem.set_baudrate(rate)
+        if modem.probe(timeout=0.1):
+            logger.info(f"Modem responded at {rate} baud.")
+            return rate
+    logger.error("Modem did not respond at any candidate baud rate.")
+    return None
+
+
+def switch_baudrate(modem, rate):
+    """
+    AT+IPR でモジュールのボーレートを変更し、ポート側も追従させる
+    Returns:
+        bool: 新しいボーレートで応答が確認できればTrue
+    """
+    previous = modem.baudrate
+    response = modem.command(f"AT+IPR={rate}", timeout=0.5)
+    if "OK" not in response:
+        logger.warning(f"AT+IPR={rate} rejected: '{response}'")
+        return False
+
+    modem.set_baudrate(rate)
+    if modem.probe():
+        return True
+
+    # 新しいボーレートで応答がない場合は元に戻す
+    logger.warning(f"No response at {rate} baud, reverting to {previous}.")
+    modem.set_baudrate(previous)
+    if not modem.probe():
+        # モジュールは新しいレートに切り替わっているがホスト側で受信できない
+        modem.set_baudrate(rate)
+        modem.command(f"AT+IPR={previous}", timeout=0.5)
+        modem.set_baudrate(previous)
+    return False
+
+
+def measure_throughput(modem, rounds=THROUGHPUT_TEST_ROUNDS):
+    """
+    ATI を繰り返し送信し、現在のボーレートでの実効スループット (byte/s) を測定する
+    Returns:
+        float: スループット。応答欠落や化けがあった場合は 0.0 (不安定と判断)
+    """
+    transferred = 0
+    start = time.monotonic()
+    for _ in range(rounds):
+        response = modem.command("ATI", timeout=1)
+        if not response.endswith("OK"):
+            return 0.0
+        transferred += len("ATI\r\n") + len(response)
+    return transferred / (time.monotonic() - start)
+
+
+def enable_flow_control(modem):
+    """
+    AT+IFC=2,2 でモジュールの RTS/CTS ハードウェアフロー制御を有効にし、ポート側も合わせる
+    """
+    response = modem.command("AT+IFC=2,2", timeout=0.5)
+    if "OK" not in response:
+        logger.warning(f"Failed to enable RTS/CTS flow control: '{response}'")
+        return False
+    modem.set_rtscts(True)
+    logger.info("RTS/CTS hardware flow control enabled.")
+    return True
+
+
+def negotiate_baudrate(modem, candidates=CANDIDATE_BAUDRATES):
+    """
+    候補のボーレートごとにスループットを測定し、最も速く安定したレートに切り替える
+    Returns:
+        int: 選択したボーレート
+    """
+    results = {modem.baudrate: measure_throughput(modem)}
+    for rate in sorted(candidates):
+        if rate <= modem.baudrate:
+            continue
+        if not switch_baudrate(modem, rate):
+            break
+        throughput = measure_throughput(modem)
+        results[rate] = throughput
+        logger.info(f"Throughput at {rate} baud: {throughput:.0f} B/s")
+        if throughput == 0.0:
+            break
+
+    best = max(results, key=results.get)
+    if modem.baudrate != best and not switch_baudrate(modem, best):
+        best = modem.baudrate
+    # 次回起動時もこのレートで応答するよう保存
+    modem.command("AT&W", timeout=0.5)
+    logger.info(f"Selected baud rate: {best}")
+    return best
@@ -0,0 +1,138 @@
+"""
+依存関係グラフによる起動手順の並列実行
+
+各手順 (Step) に前提となる手順を指定し、前提がすべて終わった手順から並列に実行する。
+手順が例外を出すか False を返すと、それに依存する手順は実行しない。
+終了後に各手順の開始時刻・所要時間とクリティカルパスを表示できる。
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger("sim7080g")
+
+
+class Step:
+    __slots__ = ("name", "fn", "after", "started", "finished", "result", "state")
+
+    def __init__(self, name, fn, after=()):
+        self.name = name
+        self.fn = fn
+        self.after = tuple(after)
+        self.started = None
+        self.finished = None
+        self.result = None
+        # pending / running / done / failed / skipped
+        self.state = "pending"
+
+    @property
+    def duration(self):
+        return self.finished - self.started if self.started is not None and self.finished is not None else 0.0
+
+
+class BringUp:
+    """
+    起動手順の依存関係グラフ
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.started = None
+        self.finished = None
+
+    def add(self, name, fn, after=()):
+        """
+        Args:
+            name (str): 手順名
+            fn (callable): 引数なしで呼ぶ関数。False を返すと失敗扱い
+            after (tuple): 先に完了している必要がある手順名
+        """
+        for dependency in after:
+            if dependency not in self.steps:
+                raise ValueError(f"Unknown dependency {dependency!r} for step {name!r}")
+        self.steps[name] = Step(name, fn, after)
+
+    def result(self, name):
+        return self.steps[name].result
+
+    def _ready(self, step):
+        return step.state == "pending" and all(self.steps[name].state == "done" for name in step.after)
+
+    def _blocked(self, step):
+        return step.state == "pending" and any(self.steps[name].state in ("failed", "skipped")
+                                               for name in step.after)
+
+    def _call(self, step):
+        step.started = time.monotonic()
+        try:
+            step.result = step.fn()
+        finally:
+            step.finished = time.monotonic()
+        return step.result
+
+    def run(self):
+        """
+        すべての手順を実行する
+        Returns:
+            bool: すべての手順が成功したらTrue
+        """
+        self.started = time.monotonic()
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(len(self.steps), 1), thread_name_prefix="bringup") as executor:
+            while True:
+                for step in self.steps.values():
+                    if self._blocked(step):
+                        step.state = "skipped"
+                        logger.warning(f"Bring-up step '{step.name}' skipped (dependency failed).")
+                    elif self._ready(step):
+                        step.state = "running"
+                        running[executor.submit(self._call, step)] = step
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        ok = future.result() is not False
+                    except Exception as e:
+                        logger.error(f"Bring-up step '{step.name}' failed: {e}")
+                        ok = False
+                    step.state = "done" if ok else "failed"
+                    if not ok:
+                        logger.error(f"Bring-up step '{step.name}' did not succeed.")
+        self.finished = time.monotonic()
+        return all(step.state == "done" for step in self.steps.values())
+
+    def critical_path(self):
+        """
+        最後に終わった手順から、それぞれ最後に終わった前提手順をたどった経路
+        Returns:
+            list: Step のリスト (実行順)
+        """
+        finished = [step for step in self.steps.values() if step.finished is not None]
+        if not finished:
+            return []
+        step = max(finished, key=lambda s: s.finished)
+        path = [step]
+        while step.after:
+            step = max((self.steps[name] for name in step.after), key=lambda s: s.finished or 0)
+            path.append(step)
+        return path[::-1]
+
+    def report(self):
+        """
+        Returns:
+            str: 手順ごとの開始時刻・所要時間とクリティカルパスの表
+        """
+        critical = {step.name for step in self.critical_path()}
+        lines = [f"{'step':16s} {'state':8s} {'start':>8s} {'duration':>9s}"]
+        for step in sorted(self.steps.values(), key=lambda s: s.started if s.started is not None else float("inf")):
+            start = f"{step.started - self.started:7.2f}s" if step.started is not None else "       -"
+            marker = " *" if step.name in critical else ""
+            lines.append(f"{step.name:16s} {step.state:8s} {start} {step.duration:8.2f}s{marker}")
+        total = (self.finished or time.monotonic()) - self.started
+        sequential = sum(step.duration for step in self.steps.values())
+        lines.append(f"critical path (*): {' -> '.join(step.name for step in self.critical_path())}")
+        lines.append(f"wall time {total:.2f}s, sum of steps {sequential:.2f}s")
+        return "\n".join(lines)
@@ -0,0 +1,191 @@
+"""
+変化の少ない AT 問い合わせの応答キャッシュ
+
+ICCID・IMEI・ファームウェア版数や AT+CGDCONT? / AT+COPS? の応答をコマンドごとの TTL で保持し、
+有効期間内の問い合わせはシリアル通信なしで返す。ATEngine のフックとして全コマンドを監視し、
+対応する設定コマンド (AT+CGDCONT= など) や URC (+CEREG: など) を見たらキャッシュを捨てる。
+コマンドの応答の外で読んだ URC (ATEngine.read_urc) も urc_hooks で受け取る。
+path を指定すると TTL の切れていない応答をファイルに保存し、次回起動時に読み込む。
+ICCID は電源断中の SIM の差し替えに備え、ホストの起動 (boot_id) ごとに1回はモジュールへ問い合わせる。
+"""
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger("sim7080g")
+
+# コマンドごとの TTL（秒）。None は無期限 (モジュールの再起動や SIM の差し替えまで有効。AT+CCID は PER_BOOT_COMMANDS も参照)
+DEFAULT_TTLS = {
+    "AT+CCID": None,
+    "AT+GSN": None,
+    "AT+CGSN": None,
+    "AT+CGMR": None,
+    "ATI": None,
+    "AT+CGDCONT?": 3600,
+    "AT+COPS?": 30,
+}
+# 設定コマンド (前方一致) -> 無効にする問い合わせ
+SET_INVALIDATES = {
+    "AT+CGDCONT=": ("AT+CGDCONT?",),
+    "AT+COPS=": ("AT+COPS?",),
+    "AT+CNMP=": ("AT+COPS?",),
+    "AT+CMNB=": ("AT+COPS?",),
+    "AT+CFUN=": ("AT+COPS?", "AT+CGDCONT?"),
+}
+# URC -> 無効にする問い合わせ
+URC_INVALIDATES = {
+    "+CEREG:": ("AT+COPS?",),
+    "+CGREG:": ("AT+COPS?",),
+    "+CPIN: NOT READY": ("AT+CCID", "AT+COPS?"),
+}
+# モジュールの再起動を示す URC (揮発する設定のキャッシュをすべて捨てる)
+RESET_URCS = ("RDY", "NORMAL POWER DOWN")
+# モジュールの再起動でも変わらない問い合わせ (モジュール自体の識別情報)
+IDENTITY_COMMANDS = ("AT+GSN", "AT+CGSN", "AT+CGMR", "ATI")
+# SIM の情報。SIM は電源を切って差し替えるため、ファイルのキャッシュはホストの起動が同じ間だけ使う
+PER_BOOT_COMMANDS = ("AT+CCID",)
+# ホストの起動ごとに変わる ID (Linux)
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+
+
+def boot_id():
+    """
+    Returns:
+        str: ホストの起動ごとの ID。取得できなければ None
+    """
+    try:
+        with open(BOOT_ID_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class ResponseCache:
+    """
+    Modem.command の前段に置く問い合わせ応答のキャッシュ
+    Args:
+        modem (Modem): 対象のモデム (生成時に modem.at のフックへ登録する)
+        path (str): 保存先の JSON ファイル (None なら保存しない)
+        ttls (dict): DEFAULT_TTLS を上書きする TTL
+    """
+
+    def __init__(self, modem, path=None, ttls=None):
+        self.modem = modem
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        # コマンド -> (取得時刻 time.time(), 応答)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.boot_id = boot_id()
+        self._load()
+        modem.at.hooks.append(self.observe)
+        modem.at.urc_hooks.append(self.observe_urc)
+
+    def _load(self):
+        if not self.path:
+            return
+        entries = {}
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            same_boot = self.boot_id is not None and stored["boot_id"] == self.boot_id
+            for command, (fetched_at, response) in stored["entries"].items():
+                if command in PER_BOOT_COMMANDS and not same_boot:
+                    continue
+                if command in self.ttls and self._fresh(command, fetched_at):
+                    entries[command] = (fetched_at, response)
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            # 壊れたファイルや古い形式は空のキャッシュとして扱う
+            logger.debug(f"Ignoring AT response cache {self.path}: {e}")
+            return
+        self.entries = entries
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"boot_id": self.boot_id, "entries": self.entries}, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save AT response cache: {e}")
+
+    def _fresh(self, command, fetched_at):
+        ttl = self.ttls.get(command)
+        return ttl is None or time.time() - fetched_at < ttl
+
+    def command(self, command, timeout=1, expect=None, retries=1):
+        """
+        キャッシュ対象の問い合わせは有効期間内ならキャッシュから返し、それ以外は Modem.command に渡す
+        """
+        if command in self.ttls:
+            entry = self.entries.get(command)
+            if entry is not None and self._fresh(command, entry[0]):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        response = self.modem.command(command, timeout=timeout, expect=expect, retries=retries)
+        if command in self.ttls and self.ttls[command] != 0 and "OK" in response:
+            self.entries[command] = (time.time(), response)
+            self._save()
+        return response
+
+    def invalidate(self, *commands):
+        """
+        指定した問い合わせ (省略時はすべて) のキャッシュを捨てる
+        """
+        targets = commands or tuple(self.entries)
+        removed = [command for command in targets if self.entries.pop(command, None) is not None]
+        if removed:
+            logger.debug(f"AT response cache invalidated: {', '.join(removed)}")
+            self._save()
+
+    def reset(self):
+        """
+        モジュールのリセット後に呼ぶ。モジュールの識別情報 (IMEI など) 以外のキャッシュを捨てる
+        """
+        targets = [command for command in self.entries if command not in IDENTITY_COMMANDS]
+        if targets:
+            self.invalidate(*targets)
+
+    def observe(self, trace):
+        """
+        ATEngine のフック。設定コマンドと応答中の URC からキャッシュを無効にする
+        """
+        targets = self._urc_targets(trace.response)
+        for prefix, queries in SET_INVALIDATES.items():
+            if trace.command.startswith(prefix):
+                targets.update(queries)
+        # 問い合わせ自身の応答に含まれる状態 (例: AT+CEREG? の "+CEREG:") では無効にしない
+        targets.discard(trace.command)
+        if targets:
+            self.invalidate(*targets)
+
+    def observe_urc(self, text):
+        """
+        ATEngine の urc_hooks。コマンドの応答の外で読んだ URC からキャッシュを無効にする
+        """
+        targets = self._urc_targets(text)
+        if targets:
+            self.invalidate(*targets)
+
+    def _urc_targets(self, text):
+        targets = set()
+        for urc, queries in URC_INVALIDATES.items():
+            if urc in text:
+                targets.update(queries)
+        if any(line.strip() in RESET_URCS for line in text.splitlines()):
+            targets.update(command for command in self.entries if command not in IDENTITY_COMMANDS)
+        return targets
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
@@ -0,0 +1,251 @@
+"""
+疑似端末 (pty) 上で動く SIM7080G のスタンドイン
+
+ハードウェアなしでベンチマークや動作確認を行うためのもの。
+応答は本物と同じくエコーバック付きで返し、latency で無線区間の遅延を模擬する。
+"""
+
+import os
+import pty
+import threading
+import time
+import tty
+
+
+class FakeModem:
+    """
+    AT コマンドに応答する疑似モデム。start() が返すデバイス名を Modem の port に渡して使う
+    """
+
+    def __init__(self, iccid="89882280000000000000", imei="860000000000000", latency=0.0, responses=None,
+                 udp_echo=False):
+        self.iccid = iccid
+        self.imei = imei
+        self.latency = latency
+        # True の場合、UDP ソケットに AT+CASEND で送られた本文をエコーサーバの応答として受信キューに積む
+        self.udp_echo = udp_echo
+        # 接続 cid -> 受信キュー (AT+CARECV は同じ cid のキューから取り出す)
+        self.inbox = {}
+        self.pdp_active = False
+        # モジュールのリセット (AT+CFUN=1,1) で PDP コンテキストが失われ、AT+CNACT で有効化し直すまで AT+CAOPEN は失敗する
+        self.pdp_lost = False
+        # AT+CAOPEN で開いたソケットと、リセットで失われたソケット (開き直すまで AT+CASEND は ERROR)
+        self.sockets = set()
+        self.lost_sockets = set()
+        # 接続 cid -> プロトコル ("UDP" / "TCP")
+        self.protocols = {}
+        self.resets = 0
+        # コマンド -> 情報行 (最終リザルトコード OK の前に返す文字列) の上書き
+        self.responses = dict(responses or {})
+        self.commands = []
+        self.received = b""
+        # AT+CFSWFILE で書き込まれたデータ
+        self.file_data = b""
+        # AT+SH* の HTTP クライアント状態。AT+SHREQ で実際に URL へリクエストを送る
+        self.http_url = None
+        self.http_headers = {}
+        self.http_body = b""
+        self.http_response = b""
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """
+        pty を作成して応答スレッドを起動する
+        Returns:
+            str: スレーブ側のデバイス名 (例: /dev/pts/3)
+        """
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return os.ttyname(self._slave)
+
+    def stop(self):
+        self._running = False
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+
+    def _send(self, text):
+        if isinstance(text, str):
+            text = text.encode()
+        os.write(self._master, text)
+
+    def _read_exact(self, size, buff):
+        while len(buff) < size:
+            buff += os.read(self._master, 4096)
+        return buff[:size], buff[size:]
+
+    def _run(self):
+        buff = b""
+        while self._running:
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            buff += data
+            while b"\r" in buff:
+                line, buff = buff.split(b"\r", 1)
+                buff = buff.lstrip(b"\n")
+                command = line.decode(errors="ignore").strip()
+                if not command:
+                    continue
+                self.commands.append(command)
+                if self.latency:
+                    time.sleep(self.latency)
+                try:
+                    buff = self._handle(command, buff)
+                except OSError:
+                    return
+
+    def _handle(self, command, buff):
+        """
+        1コマンド分の応答を返す。本文を伴うコマンドでは buff から本文を取り出す
+        Returns:
+            bytes: 未処理の受信データ
+        """
+        echo = command + "\r\r\n"
+        upper = command.upper()
+        if command in self.responses:
+            body = self.responses[command]
+            self._send(echo + (body + "\r\n\r\n" if body else "") + "OK\r\n")
+        elif upper == "AT+CCID":
+            self._send(echo + self.iccid + "\r\n\r\nOK\r\n")
+        elif upper in ("AT+GSN", "AT+CGSN"):
+            self._send(echo + self.imei + "\r\n\r\nOK\r\n")
+        elif upper == "ATI":
+            self._send(echo + "SIM7080 R14.18\r\n\r\nOK\r\n")
+        elif upper == "AT+CSQ":
+            self._send(echo + "+CSQ: 20,99\r\n\r\nOK\r\n")
+        elif upper.startswith("AT+CASEND=") and command.split("=", 1)[1].split(",")[0] in self.lost_sockets:
+            self._send(echo + "ERROR\r\n")
+        elif upper.startswith(("AT+CASEND=", "AT+SMPUB=")):
+            # 本文の長さを受け取り "> " プロンプトの後に本文を受信する
+            fields = command.split("=", 1)[1].split(",")
+            size = int(fields[1])
+            self._send(echo + "> ")
+            payload, buff = self._read_exact(size, buff)
+            self.received += payload
+            self._send("\r\nOK\r\n")
+            if self.udp_echo and upper.startswith("AT+CASEND=") and self.protocols.get(fields[0]) == "UDP":
+                if self.latency:
+                    time.sleep(self.latency)
+                self.inbox.setdefault(fields[0], []).append(payload)
+                self._send(f"\r\n+CADATAIND: {fields[0]}\r\n")
+        elif upper.startswith("AT+CFSWFILE="):
+            size = int(command.split("=", 1)[1].split(",")[3])
+            self._send(echo + "DOWNLOAD\r\n")
+            payload, buff = self._read_exact(size, buff)
+            self.file_data += payload
+            self._send("\r\nOK\r\n")
+        elif upper.startswith("AT+SHCONF="):
+            key, value = command.split("=", 1)[1].split(",", 1)
+            if key.strip('"').upper() == "URL":
+                self.http_url = value.strip('"')
+            self._send(echo + "OK\r\n")
+        elif upper == "AT+SHCHEAD":
+            self.http_headers = {}
+            self._send(echo + "OK\r\n")
+        elif upper.startswith("AT+SHAHEAD="):
+            key, value = command.split("=", 1)[1].split(",", 1)
+            self.http_headers[key.strip('"')] = value.strip('"')
+            self._send(echo + "OK\r\n")
+        elif upper.startswith("AT+SHBOD="):
+            size = int(command.split("=", 1)[1].split(",")[0])
+            self._send(echo + ">")
+            self.http_body, buff = self._read_exact(size, buff)
+            self._send("\r\nOK\r\n")
+        elif upper.startswith("AT+SHREQ="):
+            path, kind = command.split("=", 1)[1].rsplit(",", 1)
+            method = {"1": "GET", "2": "PUT", "3": "POST", "4": "PATCH", "5": "HEAD"}[kind.strip()]
+            self._send(echo + "OK\r\n")
+            status, self.http_response = self._http_request(method, path.strip('"'))
+            self.http_body = b""
+            self._send(f'\r\n+SHREQ: "{method}",{status},{len(self.http_response)}\r\n')
+        elif upper.startswith("AT+SHREAD="):
+            start, size = (int(field) for field in command.split("=", 1)[1].split(","))
+            data = self.http_response[start:start + size]
+            self._send(echo.encode() + b"OK\r\n\r\n" + f"+SHREAD: {len(data)}\r\n".encode() + data + b"\r\n")
+        elif upper == "AT+CNACT?":
+            self._send(echo + f"+CNACT: 0,{int(self.pdp_active)},\"10.0.0.2\"\r\n\r\nOK\r\n")
+        elif upper == "AT+CFUN=1,1":
+            self.resets += 1
+            self.pdp_active = False
+            self.pdp_lost = True
+            self.lost_sockets |= self.sockets
+            self.sockets = set()
+            self.inbox = {}
+            self._send(echo + "OK\r\n")
+            time.sleep(0.1)
+            self._send("\r\nRDY\r\n")
+        elif upper.startswith("AT+CNACT="):
+            self.pdp_active = command.endswith(",1")
+            self.pdp_lost = self.pdp_lost and not self.pdp_active
+            state = "ACTIVE" if self.pdp_active else "DEACTIVE"
+            self._send(echo + f"OK\r\n\r\n+APP PDP: 0,{state}\r\n")
+        elif upper.startswith("AT+CAOPEN="):
+            fields = command.split("=", 1)[1].split(",")
+            cid = fields[0]
+            if self.pdp_lost:
+                self._send(echo + f"+CAOPEN: {cid},1\r\n\r\nOK\r\n")
+            else:
+                self.sockets.add(cid)
+                self.lost_sockets.discard(cid)
+                self.protocols[cid] = fields[2].strip('"').upper()
+                self.inbox.pop(cid, None)
+                self._send(echo + f"+CAOPEN: {cid},0\r\n\r\nOK\r\n")
+        elif upper.startswith("AT+CACLOSE="):
+            cid = command.split("=", 1)[1]
+            self.sockets.discard(cid)
+            self.protocols.pop(cid, None)
+            self.inbox.pop(cid, None)
+            self._send(echo + "OK\r\n")
+        elif upper.startswith("AT+CARECV="):
+            inbox = self.inbox.get(command.split("=", 1)[1].split(",")[0])
+            data = inbox.pop(0) if inbox else b""
+            self._send(echo.encode() + f"+CARECV: {len(data)},".encode() + data + b"\r\n\r\nOK\r\n")
+        elif upper.startswith("AT+SNPING4="):
+            # 応答ごとに "+SNPING4: <番号>,<IP>,<RTT ms>" の URC を返す (RTT は latency の往復分)
+            count = int(command.split("=", 1)[1].split(",")[1])
+            self._send(echo + "OK\r\n")
+            for seq in range(1, count + 1):
+                if self.latency:
+                    time.sleep(self.latency * 2)
+                self._send(f"\r\n+SNPING4: {seq},127.0.0.1,{max(int(self.latency * 2000), 1)}\r\n")
+        elif upper.startswith("AT+CDNSGIP="):
+            host = command.split("=", 1)[1].split(",")[0].strip('"')
+            self._send(echo + "OK\r\n")
+            if self.latency:
+                time.sleep(self.latency * 2)
+            self._send(f'\r\n+CDNSGIP: 1,"{host}","127.0.0.1"\r\n')
+        else:
+            self._send(echo + "OK\r\n")
+        return buff
+
+    def _http_request(self, method, path):
+        """
+        Returns:
+            tuple: (ステータスコード, 応答本文)。接続できなければ SIM7080G と同じく 601 (ネットワークエラー)
+        """
+        import urllib.error
+        import urllib.request
+
+        if self.latency:
+            time.sleep(self.latency * 2)
+        request = urllib.request.Request(self.http_url + path, data=self.http_body if method != "GET" else None,
+                                         headers=self.http_headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except OSError:
+            return 601, b""
@@ -0,0 +1,317 @@
+"""
+消費電力量と通信量の見積もり (機能ごと)
+
+送受信のたびに record() でバイト数を記録し、ATEngine のフックで GNSS の電源 (AT+CGNSPWR)、
+PSM の設定 (AT+CPSMS)、モジュールの電源断 (NORMAL POWER DOWN / RDY) を追跡する。
+PWRKEY による電源の入り切りは Modem.power_hooks で受け取る。
+無線は送受信の後 RRC_TAIL 秒間は接続状態に留まるものとして接続時間を求め、
+状態ごとの電流値から機能 (subsystem) ごとの mAh と課金対象のバイト数を見積もる。
+電流値はデータシートの代表値による概算なので、絶対値より設定変更の前後比較に使う。
+"""
+
+import logging
+import time
+
+logger = logging.getLogger("sim7080g")
+
+# 状態ごとの平均電流 (mA)。SIM7080G の代表値 (Cat-M, 3.8V)
+CURRENTS = {
+    "tx": 190.0,
+    "rx": 50.0,
+    # 送受信後の接続状態 (RRC connected) の待機
+    "active": 25.0,
+    # 接続を切ってページングを待つ状態 (eDRX なし)
+    "idle": 1.5,
+    "psm": 0.004,
+    "gnss": 30.0,
+    "off": 0.0,
+}
+# 最後の送受信から RRC 接続が解放されるまでの時間（秒）
+RRC_TAIL = 10.0
+# PSM 有効時、アイドル状態から PSM に入るまでの時間 (T3324)（秒）
+PSM_ACTIVE_TIMER = 60.0
+# 実効スループット (bps)。送受信にかかる時間の見積もりに使う
+UPLINK_BPS = 100_000
+DOWNLINK_BPS = 200_000
+# 1データグラムあたりのヘッダ (IPv4 20 + UDP 8)。CoAP はヘッダとオプション分を加える
+PACKET_OVERHEAD = {"udp": 28, "modem": 28, "coap": 28 + 20}
+# 機能に割り当てない待機電流の集計名
+BASELINE = "baseline"
+
+
+class _Usage:
+    __slots__ = ("sent", "received", "packets", "billable", "airtime", "active", "charge")
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.packets = 0
+        self.billable = 0
+        # 送受信にかかった時間と、それによって延びた接続状態の時間（秒）
+        self.airtime = 0.0
+        self.active = 0.0
+        # mA 秒
+        self.charge = 0.0
+
+
+class EnergyMeter:
+    """
+    機能ごとの通信量・無線時間・電荷量の集計
+    Args:
+        psm (bool): PSM を使っているか (AT+CPSMS=1 / 0 を見たら切り替わる)
+        currents (dict): CURRENTS を上書きする電流値 (mA)
+    """
+
+    def __init__(self, psm=False, currents=None, rrc_tail=RRC_TAIL, clock=time.monotonic):
+        self.psm = psm
+        self.currents = dict(CURRENTS)
+        if currents:
+            self.currents.update(currents)
+        self.rrc_tail = rrc_tail
+        self.clock = clock
+        self.started = clock()
+        self.usage = {}
+        # 状態ごとの累計時間（秒）
+        self.durations = {"active": 0.0, "idle": 0.0, "psm": 0.0, "gnss": 0.0, "off": 0.0}
+        # RRC 接続が解放される時刻と、アイドルを数え始める時刻
+        self.radio_until = self.started
+        self.gnss_since = None
+        self.off_since = None
+
+    def attach(self, engine, modem=None):
+        """
+        ATEngine のフックに登録する。modem を渡すと PWRKEY による電源の入り切りも追跡する
+        Returns:
+            EnergyMeter: self
+        """
+        engine.hooks.append(self.observe)
+        engine.urc_hooks.append(self.observe_urc)
+        if modem is not None:
+            modem.power_hooks.append(self.power_changed)
+        return self
+
+    def _subsystem(self, name):
+        usage = self.usage.get(name)
+        if usage is None:
+            usage = self.usage[name] = _Usage()
+        return usage
+
+    def _close_gap(self, now):
+        """
+        前回の接続状態が終わってから now までをアイドル / PSM / 電源断として数える
+        """
+        if now <= self.radio_until:
+            return
+        gap = now - self.radio_until
+        self.radio_until = now
+        if self.off_since is not None:
+            return
+        if self.psm:
+            self.durations["idle"] += min(gap, PSM_ACTIVE_TIMER)
+            self.durations["psm"] += max(gap - PSM_ACTIVE_TIMER, 0.0)
+        else:
+            self.durations["idle"] += gap
+
+    def record(self, subsystem, transport="udp", sent=0, received=0, packets=1):
+        """
+        送受信を記録する
+        Args:
+            subsystem (str): 機能名 ("telemetry" / "notifications" / "acks" など)
+            transport (str): "udp" / "modem" / "coap" (ヘッダの見積もりに使う)
+            sent (int): 送信したペイロードのバイト数
+            received (int): 受信したペイロードのバイト数
+            packets (int): データグラム数。ヘッダは sent があれば送信、なければ受信として数える
+                (送信と受信は別々に記録する)
+        """
+        now = self.clock()
+        usage = self._subsystem(subsystem)
+        usage.sent += sent
+        usage.received += received
+        usage.packets += packets
+        overhead = PACKET_OVERHEAD.get(transport, PACKET_OVERHEAD["udp"]) * packets
+        usage.billable += sent + received + overhead
+        # ヘッダはデータと同じ向きに数える (受信だけの ACK を送信電流で数えない)
+        uplink = sent + overhead if sent else 0
+        downlink = received if sent else received + overhead
+        tx = uplink * 8 / UPLINK_BPS
+        rx = downlink * 8 / DOWNLINK_BPS
+        usage.airtime += tx + rx
+        usage.charge += tx * self.currents["tx"] + rx * self.currents["rx"]
+
+        # 接続状態の延長分をこの送受信を起こした機能に割り当てる
+        self._close_gap(now)
+        until = now + tx + rx + self.rrc_tail
+        extended = until - max(self.radio_until, now)
+        if extended > 0:
+            usage.active += extended
+            usage.charge += extended * self.currents["active"]
+            self.durations["active"] += extended
+            self.radio_until = until
+
+    def observe(self, trace):
+        """
+        ATEngine のフック。GNSS の電源、PSM の設定、モジュールの電源断を追跡する
+        """
+        now = self.clock()
+        command = trace.command.upper()
+        if trace.outcome == "ok":
+            if command == "AT+CGNSPWR=1":
+                self.gnss_on(now)
+            elif command == "AT+CGNSPWR=0":
+                self.gnss_off(now)
+            elif command.startswith("AT+CPSMS="):
+                self.psm = command.split("=", 1)[1].startswith("1")
+        if "NORMAL POWER DOWN" in trace.response:
+            self.power_off()
+        elif trace.outcome in ("ok", "error"):
+            # 応答が返ってきたので電源は入っている
+            self.power_on()
+
+    def observe_urc(self, text):
+        """
+        ATEngine の urc_hooks。コマンドの外で読んだ NORMAL POWER DOWN / RDY を追跡する
+        """
+        lines = [line.strip() for line in text.splitlines()]
+        if "NORMAL POWER DOWN" in lines:
+            self.power_off()
+        elif "RDY" in lines:
+            self.power_on()
+
+    def power_changed(self, powered):
+        """
+        Modem.power_hooks。PWRKEY で電源を入れた / 切ったときに呼ばれる
+        """
+        if powered:
+            self.power_on()
+        else:
+            self.power_off()
+
+    def gnss_on(self, now=None):
+        """
+        GNSS の電源が入ったことを記録する (既に入っていれば何もしない)
+        Args:
+            now (float): 時刻 (clock() と同じ基準)。None なら現在時刻
+        """
+        if self.gnss_since is None:
+            self.gnss_since = self.clock() if now is None else now
+
+    def gnss_off(self, now=None):
+        """
+        GNSS の電源が切れたことを記録し、電源が入っていた時間を加算する
+        Args:
+            now (float): 時刻 (clock() と同じ基準)。None なら現在時刻
+        """
+        if self.gnss_since is not None:
+            self.durations["gnss"] += (self.clock() if now is None else now) - self.gnss_since
+            self.gnss_since = None
+
+    def power_off(self):
+        """
+        モジュールの電源が切れたことを記録する (既に切れていれば何もしない)
+        """
+        if self.off_since is not None:
+            return
+        now = self.clock()
+        self._close_gap(now)
+        self.gnss_off(now)
+        self.off_since = now
+
+    def power_on(self):
+        """
+        モジュールの電源が入ったことを記録する (既に入っていれば何もしない)
+        """
+        if self.off_since is None:
+            return
+        now = self.clock()
+        self.durations["off"] += now - self.off_since
+        self.off_since = None
+        self.radio_until = now
+
+    def counters(self):
+        """
+        Returns:
+            dict: "<機能>.<項目>" 形式の累計値 (バイト数・秒・mAh)
+        """
+        now = self.clock()
+        durations = dict(self.durations)
+        if self.gnss_since is not None:
+            durations["gnss"] += now - self.gnss_since
+        # 最後の接続状態の後の未確定のアイドル時間
+        if self.off_since is not None:
+            durations["off"] += now - self.off_since
+        elif now > self.radio_until:
+            gap = now - self.radio_until
+            if self.psm:
+                durations["idle"] += min(gap, PSM_ACTIVE_TIMER)
+                durations["psm"] += max(gap - PSM_ACTIVE_TIMER, 0.0)
+            else:
+                durations["idle"] += gap
+
+        counters = {"elapsed": now - self.started}
+        for state, seconds in durations.items():
+            counters[f"radio.{state}_s"] = seconds
+        total = 0.0
+        for name, usage in self.usage.items():
+            mah = usage.charge / 3600
+            total += mah
+            counters.update({f"{name}.sent": usage.sent, f"{name}.received": usage.received,
+                             f"{name}.packets": usage.packets, f"{name}.billable_bytes": usage.billable,
+                             f"{name}.airtime_s": usage.airtime, f"{name}.active_s": usage.active,
+                             f"{name}.mAh": mah})
+        gnss = durations["gnss"] * self.currents["gnss"] / 3600
+        baseline = (durations["idle"] * self.currents["idle"] + durations["psm"] * self.currents["psm"]
+                    + durations["off"] * self.currents["off"]) / 3600
+        counters.update({"gnss.on_s": durations["gnss"], "gnss.mAh": gnss, f"{BASELINE}.mAh": baseline})
+        counters["total.mAh"] = total + gnss + baseline
+        counters["total.billable_bytes"] = sum(usage.billable for usage in self.usage.values())
+        return counters
+
+    def report(self):
+        """
+        Returns:
+            str: 1行の集計 (例: "telemetry 2.1KB 0.412mAh | gnss 340s 2.833mAh | ... | avg 1.90mA")
+        """
+        counters = self.counters()
+        parts = [f"{name} {counters[f'{name}.billable_bytes'] / 1024:.1f}KB {counters[f'{name}.mAh']:.3f}mAh"
+                 for name in sorted(self.usage)]
+        parts.append(f"gnss {counters['gnss.on_s']:.0f}s {counters['gnss.mAh']:.3f}mAh")
+        parts.append(f"{BASELINE} {counters[f'{BASELINE}.mAh']:.3f}mAh")
+        hours = counters["elapsed"] / 3600
+        average = counters["total.mAh"] / hours if hours else 0.0
+        parts.append(f"total {counters['total.billable_bytes'] / 1024:.1f}KB {counters['total.mAh']:.3f}mAh "
+                     f"avg {average:.2f}mA over {counters['elapsed'] / 60:.0f}min")
+        return " | ".join(parts)
+
+
+def project(interval, hours=24, payload=8, gnss_seconds=5.0, psm=False, transport="udp"):
+    """
+    送信間隔 interval 秒で hours 時間動かした場合の見積もり (測位 gnss_seconds 秒 + 送信1件を繰り返す)
+    Returns:
+        dict: counters() の値
+    """
+    now = [0.0]
+    meter = EnergyMeter(psm=psm, clock=lambda: now[0])
+    while now[0] < hours * 3600:
+        meter.gnss_on()
+        now[0] += gnss_seconds
+        meter.gnss_off()
+        meter.record("telemetry", transport, sent=payload)
+        now[0] += max(interval - gnss_seconds, 0.0)
+    return meter.counters()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Project daily data and charge for different send intervals")
+    parser.add_argument("intervals", nargs="*", type=float, default=[10, 60, 300, 900, 3600],
+                        help="Send intervals in seconds (default: 10 60 300 900 3600)")
+    parser.add_argument("--gnss-seconds", type=float, default=5.0, help="GNSS on-time per fix (default: 5)")
+    parser.add_argument("--psm", action="store_true", help="Assume PSM between transmissions")
+    args = parser.parse_args()
+
+    for interval in args.intervals:
+        counters = project(interval, gnss_seconds=args.gnss_seconds, psm=args.psm)
+        print(f"interval {interval:6.0f}s: {counters['total.billable_bytes'] / 1024:8.1f} KB/day, "
+              f"{counters['total.mAh']:7.1f} mAh/day (telemetry {counters['telemetry.mAh']:6.1f}, "
+              f"gnss {counters['gnss.mAh']:6.1f}, idle {counters[f'{BASELINE}.mAh']:5.1f})")
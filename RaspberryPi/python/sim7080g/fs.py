@@ -0,0 +1,38 @@
+"""
+モジュール内蔵ファイルシステム (AT+CFS*) への書き込み
+"""
+
+import logging
+
+logger = logging.getLogger("sim7080g")
+
+# AT+CFSWFILE 1回あたりの最大書き込みサイズ
+FS_CHUNK_SIZE = 10240
+# 書き込み先ディレクトリ (3: /customer/)
+CUSTOMER_DIR = 3
+
+
+def write_file(modem, name, data, directory=CUSTOMER_DIR):
+    """
+    data をモジュールのファイル name に書き込む (既存のファイルは上書き)
+    Returns:
+        bool: すべて書き込めたらTrue
+    """
+    modem.command("AT+CFSINIT")
+    try:
+        for offset in range(0, len(data), FS_CHUNK_SIZE):
+            chunk = data[offset:offset + FS_CHUNK_SIZE]
+            mode = 0 if offset == 0 else 1  # 0: 上書き, 1: 追記
+            with modem.lock:
+                response = modem.command(f'AT+CFSWFILE={directory},"{name}",{mode},{len(chunk)},10000',
+                                         timeout=5, expect="DOWNLOAD")
+                if "DOWNLOAD" not in response:
+                    logger.error(f"AT+CFSWFILE was not accepted: '{response}'")
+                    return False
+                modem.write(chunk)
+                if "OK" not in modem.at.read_until(("OK\r\n", "ERROR\r\n"), 10):
+                    logger.error(f"Failed to write {name} to the module file system.")
+                    return False
+    finally:
+        modem.command("AT+CFSTERM")
+    return True
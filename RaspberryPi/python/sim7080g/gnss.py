@@ -0,0 +1,347 @@
+"""
+GNSS のアシストスタート (XTRA) と TTFF 計測
+
+XTRA (衛星軌道の予測データ) を通信可能なときにダウンロードしてディスクにキャッシュし、
+モジュールのファイルシステムへ書き込んで AT+CGNSCPY / AT+CGNSXTRA で有効化する。
+最後に測位した位置と時刻を保存しておき、次回の起動方式 (hot / warm / cold) の選択に使う。
+"""
+
+import calendar
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from .at import response_lines
+from .fs import write_file
+
+logger = logging.getLogger("sim7080g")
+
+XTRA_URL = "http://iot2.xtracloud.net/xtra3gr_72h.bin"
+CACHE_DIR = "/var/cache/sim7080g"
+XTRA_FILE = "xtra3gr_72h.bin"
+STATE_FILE = "gnss_state.json"
+# XTRA は72時間有効。期限切れ前に余裕を持って更新する
+XTRA_MAX_AGE = 24 * 3600
+# 最後の測位からこの時間以内ならホットスタート
+HOT_START_MAX_AGE = 2 * 3600
+# 最終測位位置をファイルに書き込む最短間隔（秒）。測位ごとに SD カードへ書き込まない
+STATE_SAVE_INTERVAL = 300
+# XTRA をダウンロードする最低の電波強度 (AT+CSQ の RSSI)
+MIN_DOWNLOAD_RSSI = 10
+# 起動方式ごとに保持する TTFF の件数
+TTFF_SAMPLES = 100
+START_COMMANDS = {"hot": "AT+CGNSHOT", "warm": "AT+CGNSWARM", "cold": "AT+CGNSCOLD"}
+
+
+def parse_cgnsinf(response):
+    """
+    AT+CGNSINF の応答を解析する
+    Returns:
+        dict: run, fix, utc, lat, lon, alt, speed (km/h), course (度)。応答がなければ None
+    """
+    for line in response_lines(response, "AT+CGNSINF"):
+        if not line.startswith("+CGNSINF:"):
+            continue
+        fields = line.split(":", 1)[1].strip().split(",")
+        fields += [""] * (8 - len(fields))
+
+        def number(value):
+            try:
+                return float(value)
+            except ValueError:
+                return None
+
+        return {
+            "run": fields[0] == "1",
+            "fix": fields[1] == "1",
+            "utc": fields[2] or None,
+            "lat": number(fields[3]),
+            "lon": number(fields[4]),
+            "alt": number(fields[5]),
+            "speed": number(fields[6]),
+            "course": number(fields[7]),
+        }
+    return None
+
+
+def fix_time(fix):
+    """
+    AT+CGNSINF の UTC 時刻 (yyyyMMddhhmmss.sss) を UNIX 時刻に変換する
+    Returns:
+        float: UNIX 時刻。時刻がない・解析できなければ None
+    """
+    utc = fix.get("utc") if fix else None
+    if not utc:
+        return None
+    try:
+        seconds = calendar.timegm(time.strptime(utc[:14], "%Y%m%d%H%M%S"))
+        return seconds + float("0" + utc[14:]) if utc[14:] else float(seconds)
+    except ValueError:
+        return None
+
+
+def parse_cgnsxtra(response):
+    """
+    AT+CGNSXTRA の応答 (モジュール上の XTRA の状態) を解析する
+    例: '+CGNSXTRA: 3,72,"2024/05/01,00:00:00"' (作成からの経過時間, 有効時間 (いずれも時間), 書き込み時刻)
+    Returns:
+        tuple: (経過時間, 有効時間)。XTRA の情報がなければ None
+    """
+    for line in response_lines(response, "AT+CGNSXTRA"):
+        if not line.startswith("+CGNSXTRA:"):
+            continue
+        fields = line.split(":", 1)[1].strip().split(",")
+        try:
+            return int(fields[0]), int(fields[1])
+        except (IndexError, ValueError):
+            return None
+    return None
+
+
+class AssistedGnss:
+    """
+    XTRA キャッシュと最終測位位置を使って GNSS を起動し、TTFF を記録する
+    """
+
+    def __init__(self, modem, cache_dir=CACHE_DIR, xtra_url=XTRA_URL):
+        self.modem = modem
+        self.cache_dir = cache_dir
+        self.xtra_url = xtra_url
+        self.xtra_path = os.path.join(cache_dir, XTRA_FILE)
+        self.state_path = os.path.join(cache_dir, STATE_FILE)
+        self.state = self._load_state()
+        self.start_type = None
+        self.started_at = None
+        # 次回の start() で使う起動方式 (GnssWatchdog のリセット後。None なら choose_start() で選ぶ)
+        self.next_start = None
+        # 状態ファイルを保存した時刻 (time.monotonic()) と、未保存の更新があるか
+        self.state_saved_at = None
+        self.state_dirty = False
+        # このプロセスで XTRA の書き込みを確認済みか (新しくダウンロードしたら再確認する)
+        self.xtra_ready = False
+        # モジュールが書き込んだ XTRA の期限切れを報告したか (キャッシュが新しくてもダウンロードし直す)
+        self.xtra_stale = False
+        self.ttff = {start_type: deque(maxlen=TTFF_SAMPLES) for start_type in START_COMMANDS}
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+        self.state_saved_at = time.monotonic()
+        self.state_dirty = False
+
+    def flush_state(self):
+        """
+        まだ保存していない最終測位位置を書き込む (終了時に呼ぶ)
+        """
+        if self.state_dirty:
+            self._save_state()
+
+    def xtra_age(self):
+        """
+        Returns:
+            float: キャッシュした XTRA の経過時間（秒）。キャッシュがなければ None
+        """
+        try:
+            return time.time() - os.path.getmtime(self.xtra_path)
+        except OSError:
+            return None
+
+    def signal_ok(self):
+        response = self.modem.command("AT+CSQ")
+        for line in response_lines(response, "AT+CSQ"):
+            if line.startswith("+CSQ:"):
+                rssi = int(line.split(":", 1)[1].split(",")[0])
+                return rssi != 99 and rssi >= MIN_DOWNLOAD_RSSI
+        return False
+
+    def xtra_expired(self):
+        """
+        XTRA をダウンロードし直す必要があるか。キャッシュが XTRA_MAX_AGE を過ぎているか、
+        モジュールが書き込んだ XTRA の有効期限切れを報告していればTrue。
+        モジュール上の XTRA が失われているだけなら、次の start() で書き込み直させる
+        """
+        age = self.xtra_age()
+        if age is None or age >= XTRA_MAX_AGE or self.xtra_stale:
+            return True
+        if self.xtra_ready:
+            status = parse_cgnsxtra(self.modem.command("AT+CGNSXTRA"))
+            if status is not None and status[0] >= status[1]:
+                logger.info(f"XTRA on the module expired ({status[0]}h old, valid for {status[1]}h), "
+                            "downloading it again.")
+                self.xtra_ready = False
+                self.xtra_stale = True
+                return True
+            if status is None or status[0] < 0:
+                logger.info("XTRA on the module is no longer valid, injecting it again on the next start.")
+                self.xtra_ready = False
+        return False
+
+    def refresh_xtra(self, force=False):
+        """
+        キャッシュが古く電波状態が良い場合に XTRA をダウンロードする
+        Returns:
+            bool: キャッシュが有効な状態ならTrue
+        """
+        age = self.xtra_age()
+        if not force and not self.xtra_stale and age is not None and age < XTRA_MAX_AGE:
+            return True
+        if not force and not self.signal_ok():
+            logger.info("Signal too weak to download XTRA, keeping cached data.")
+            return age is not None
+        # urllib.request は ssl / http.client まで読み込み重いため、ダウンロードするときだけ import する
+        import urllib.request
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.xtra_path + ".tmp"
+        try:
+            with urllib.request.urlopen(self.xtra_url, timeout=60) as response, open(tmp, "wb") as f:
+                f.write(response.read())
+            os.replace(tmp, self.xtra_path)
+            self.xtra_ready = False
+            self.xtra_stale = False
+        except OSError as e:
+            logger.error(f"Failed to download XTRA: {e}")
+            return age is not None
+        logger.info(f"Downloaded XTRA data ({os.path.getsize(self.xtra_path)} bytes).")
+        return True
+
+    def inject_xtra(self):
+        """
+        キャッシュした XTRA をモジュールに書き込み、有効化する。同じ内容は再度書き込まない
+        Returns:
+            bool: XTRA が有効ならTrue
+        """
+        try:
+            with open(self.xtra_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        if self.state.get("xtra_injected") == digest and self._xtra_valid():
+            return True
+
+        if not write_file(self.modem, "Xtra3.bin", data):
+            return False
+
+        if "OK" not in self.modem.command("AT+CGNSCPY", timeout=5):
+            logger.error("AT+CGNSCPY failed.")
+            return False
+        if "OK" not in self.modem.command("AT+CGNSXTRA=1"):
+            logger.error("AT+CGNSXTRA=1 failed.")
+            return False
+        self.state["xtra_injected"] = digest
+        self._save_state()
+        logger.info("XTRA data injected.")
+        return True
+
+    def _xtra_valid(self):
+        """
+        モジュール上の XTRA が有効期間内か (経過時間が負のときはモジュールの時刻が合っていないので無効とみなす)
+        """
+        status = parse_cgnsxtra(self.modem.command("AT+CGNSXTRA"))
+        if status is None:
+            return False
+        elapsed, duration = status
+        return 0 <= elapsed < duration
+
+    def choose_start(self):
+        """
+        最終測位からの経過時間と XTRA の状態から起動方式を選ぶ
+        """
+        last_fix = self.state.get("last_fix")
+        if last_fix and time.time() - last_fix["time"] < HOT_START_MAX_AGE:
+            return "hot"
+        age = self.xtra_age()
+        if age is not None and age < 72 * 3600 and self.state.get("xtra_injected"):
+            return "warm"
+        return "cold"
+
+    def start(self):
+        """
+        GNSS の電源を入れ、選んだ方式で測位を開始する
+        Returns:
+            str: 起動方式 ("hot" / "warm" / "cold")
+        """
+        if not self.xtra_ready and self.xtra_age() is not None:
+            self.xtra_ready = self.inject_xtra()
+        self.start_type = self.next_start or self.choose_start()
+        self.next_start = None
+        self.modem.command("AT+CGNSPWR=1")
+        self.modem.command(START_COMMANDS[self.start_type])
+        self.started_at = time.monotonic()
+        logger.info(f"GNSS started ({self.start_type} start).")
+        return self.start_type
+
+    def stop(self):
+        """
+        GNSS の電源を切り、無線を LTE に明け渡す
+        """
+        self.modem.command("AT+CGNSPWR=0")
+        self.started_at = None
+
+    def record_fix(self, fix):
+        """
+        測位結果を最終位置として保存し、起動後最初の測位であれば TTFF を記録する
+        """
+        if not fix or not fix["fix"] or fix["lat"] is None or fix["lon"] is None:
+            return
+        if self.started_at is not None:
+            ttff = time.monotonic() - self.started_at
+            self.ttff[self.start_type].append(ttff)
+            logger.info(f"GNSS first fix after {ttff:.1f}s ({self.start_type} start).")
+            self.started_at = None
+        self.state["last_fix"] = {"lat": fix["lat"], "lon": fix["lon"], "time": time.time()}
+        self.state_dirty = True
+        if self.state_saved_at is None or time.monotonic() - self.state_saved_at >= STATE_SAVE_INTERVAL:
+            self._save_state()
+
+    def read_fix(self):
+        """
+        AT+CGNSINF で現在の測位結果を取得し、記録する
+        Returns:
+            dict: parse_cgnsinf の結果 (測位できていなければ fix が False)
+        """
+        fix = parse_cgnsinf(self.modem.command("AT+CGNSINF"))
+        self.record_fix(fix)
+        return fix
+
+    def wait_fix(self, timeout=300, interval=1):
+        """
+        測位できるまで AT+CGNSINF をポーリングする
+        Returns:
+            dict: 測位結果。timeout 内に測位できなければ None
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            fix = self.read_fix()
+            if fix and fix["fix"]:
+                return fix
+            time.sleep(interval)
+        return None
+
+    def report(self):
+        """
+        Returns:
+            dict: 起動方式ごとの TTFF の件数・平均・最大（秒）
+        """
+        return {
+            start_type: {
+                "count": len(values),
+                "mean": sum(values) / len(values) if values else None,
+                "max": max(values) if values else None,
+            }
+            for start_type, values in self.ttff.items()
+        }
@@ -0,0 +1,168 @@
+"""
+PWRKEY 制御用の GPIO バックエンド
+
+RPi.GPIO / gpiozero / sysfs / mock を同じインターフェース (on/off/read/close) で扱う。
+出力 (PWRKEY) と入力 (STATUS) のどちらにも使える。
+各ライブラリはバックエンド生成時に初めて import されるため、
+このモジュールを import してもハードウェアには触れない。
+"""
+
+import os
+from time import sleep
+
+
+class GpioBackend:
+    """
+    GPIO ピン1本を操作するバックエンドの基底クラス
+    """
+
+    def __init__(self, pin, output=True):
+        self.pin = pin
+        self.output = output
+
+    def on(self):
+        raise NotImplementedError
+
+    def off(self):
+        raise NotImplementedError
+
+    def read(self):
+        """
+        入力ピンの状態を返す (HIGH で True)
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RPiGPIOBackend(GpioBackend):
+    """
+    RPi.GPIO を使うバックエンド (従来の Raspberry Pi 向けデモと同じ制御)
+    """
+
+    def __init__(self, pin, output=True):
+        super().__init__(pin, output)
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+        GPIO.setup(pin, GPIO.OUT if output else GPIO.IN)
+
+    def on(self):
+        self._gpio.output(self.pin, self._gpio.HIGH)
+
+    def off(self):
+        self._gpio.output(self.pin, self._gpio.LOW)
+
+    def read(self):
+        return bool(self._gpio.input(self.pin))
+
+    def close(self):
+        self._gpio.cleanup(self.pin)
+
+
+class GpioZeroBackend(GpioBackend):
+    """
+    gpiozero を使うバックエンド (Raspberry Pi 5 など RPi.GPIO が使えない環境向け)
+    """
+
+    def __init__(self, pin, output=True):
+        super().__init__(pin, output)
+        from gpiozero import DigitalInputDevice, OutputDevice
+        if output:
+            self._device = OutputDevice(pin, active_high=True, initial_value=False)
+        else:
+            self._device = DigitalInputDevice(pin)
+
+    def on(self):
+        self._device.on()
+
+    def off(self):
+        self._device.off()
+
+    def read(self):
+        return bool(self._device.value)
+
+    def close(self):
+        self._device.close()
+
+
+class SysfsBackend(GpioBackend):
+    """
+    /sys/class/gpio を直接操作するバックエンド (pi_gpio_init.sh と同じ手順)
+    """
+
+    SYSFS_ROOT = "/sys/class/gpio"
+
+    def __init__(self, pin, output=True):
+        super().__init__(pin, output)
+        self._path = os.path.join(self.SYSFS_ROOT, f"gpio{pin}")
+        if not os.path.exists(self._path):
+            with open(os.path.join(self.SYSFS_ROOT, "export"), "w") as f:
+                f.write(str(pin))
+            sleep(0.1)
+        with open(os.path.join(self._path, "direction"), "w") as f:
+            f.write("out" if output else "in")
+        if output:
+            self.off()
+
+    def _write(self, value):
+        with open(os.path.join(self._path, "value"), "w") as f:
+            f.write(value)
+
+    def on(self):
+        self._write("1")
+
+    def off(self):
+        self._write("0")
+
+    def read(self):
+        with open(os.path.join(self._path, "value")) as f:
+            return f.read().strip() == "1"
+
+
+class MockBackend(GpioBackend):
+    """
+    ハードウェアなしで動作させるためのバックエンド。出力の変化を history に記録する。
+    入力として使う場合は value を書き換えて状態を与える
+    """
+
+    def __init__(self, pin, output=True):
+        super().__init__(pin, output)
+        self.value = 0
+        self.history = []
+
+    def on(self):
+        self.value = 1
+        self.history.append(1)
+
+    def off(self):
+        self.value = 0
+        self.history.append(0)
+
+    def read(self):
+        return bool(self.value)
+
+
+BACKENDS = {
+    "rpi": RPiGPIOBackend,
+    "gpiozero": GpioZeroBackend,
+    "sysfs": SysfsBackend,
+    "mock": MockBackend,
+}
+
+
+def create_backend(name, pin, output=True):
+    """
+    名前からバックエンドを生成する
+    Args:
+        name (str): "rpi" / "gpiozero" / "sysfs" / "mock"
+        pin (int): BCM ピン番号
+        output (bool): 出力ピンとして使う場合はTrue、入力ピンとして使う場合はFalse
+    """
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown GPIO backend: {name!r} (choose from {', '.join(BACKENDS)})")
+    return backend_class(pin, output)
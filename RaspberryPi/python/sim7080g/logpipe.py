@@ -0,0 +1,281 @@
+"""
+ノンブロッキングのログ出力
+
+ログレコードはキューに積むだけで呼び出し元に戻り、専用の書き込みスレッドがまとめて
+ファイルへ書き出す (1バッチにつき1回の flush)。ハンドラのレベル未満 (DEBUG) のレコードは
+メモリ上のリングバッファにだけ保持し、ERROR 以上が出たときにだけディスクへ書き出す。
+同じ警告の繰り返しは RateLimitFilter で間引く (ERROR 以上は間引かない)。
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from logging.handlers import QueueHandler, TimedRotatingFileHandler
+
+DEFAULT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+# 書き込みスレッドが1回にまとめるレコード数と待ち時間（秒）
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 1.0
+# ファイルのバッファサイズ (これを超えるとバッチの途中でも書き出される)
+BATCH_BYTES = 64 * 1024
+# エラー時に書き出す直近の DEBUG レコード数
+DEBUG_RING_SIZE = 1000
+# 同じ警告を繰り返し出力しない間隔（秒）
+RATE_LIMIT_INTERVAL = 60
+# RateLimitFilter が覚えておくメッセージの最大数 (f-string のメッセージは値ごとに別のキーになる)
+RATE_LIMIT_KEYS = 1000
+
+
+class BatchFlushMixin:
+    """
+    レコードごとの flush を行わず、commit() でまとめて書き出すファイルハンドラ
+    """
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=BATCH_BYTES, encoding=self.encoding, errors=self.errors)
+
+    def flush(self):
+        # 書き出しは commit() (書き込みスレッドのバッチ終了時) とバッファ溢れに任せる
+        pass
+
+    def commit(self):
+        self.acquire()
+        try:
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+        finally:
+            self.release()
+
+
+class BatchFileHandler(BatchFlushMixin, logging.FileHandler):
+    pass
+
+
+class BatchTimedRotatingFileHandler(BatchFlushMixin, TimedRotatingFileHandler):
+    pass
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    levels に含まれるレベルの同じメッセージを interval 秒に1回だけ通し、間引いた件数を次の出力に付ける。
+    ERROR 以上を間引くとエラーが隠れ、リングバッファの書き出しも起きなくなるため既定では WARNING だけ
+    Args:
+        interval (float): 同じメッセージを通す最短間隔（秒）
+        levels (tuple): 間引く対象のレベル
+        max_keys (int): 覚えておくメッセージの最大数
+    """
+
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, levels=(logging.WARNING,), max_keys=RATE_LIMIT_KEYS):
+        super().__init__()
+        self.interval = interval
+        self.levels = frozenset(levels)
+        self.max_keys = max_keys
+        self.last = {}
+        self.next_prune = time.monotonic() + interval
+
+    def filter(self, record):
+        if record.levelno not in self.levels:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        if now >= self.next_prune or len(self.last) >= self.max_keys:
+            self._prune(now)
+        last_time, suppressed = self.last.get(key, (None, 0))
+        if last_time is not None and now - last_time < self.interval:
+            self.last[key] = (last_time, suppressed + 1)
+            return False
+        self.last[key] = (now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} (suppressed {suppressed} similar messages)"
+        return True
+
+    def _prune(self, now):
+        # interval を過ぎたメッセージは次に来たら通すので覚えておく必要はない
+        self.next_prune = now + self.interval
+        self.last = {key: value for key, value in self.last.items() if now - value[0] < self.interval}
+        if len(self.last) >= self.max_keys:
+            # それでも多ければ新しい方の半分だけ残す (毎回整理し直さないように余裕を空ける)
+            newest = sorted(self.last.items(), key=lambda item: item[1][0])[-(self.max_keys // 2):]
+            self.last = dict(newest)
+
+
+class LogPipeline:
+    """
+    キューと書き込みスレッドでログを非同期に出力する
+    Args:
+        handlers (list): 書き出し先のハンドラ
+        level (int): ハンドラへ書き出す最低レベル。これ未満はリングバッファにだけ残す
+        ring_handlers (list): エラー時にリングバッファを書き出すハンドラ (省略時は handlers)
+    """
+
+    def __init__(self, handlers, level=logging.INFO, ring_handlers=None, ring_size=DEBUG_RING_SIZE,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.handlers = list(handlers)
+        self.level = level
+        self.ring_handlers = list(ring_handlers) if ring_handlers is not None else self.handlers
+        self.ring = deque(maxlen=ring_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.queue_handler = QueueHandler(self.queue)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+        for handler in self.handlers:
+            handler.close()
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            self._write([record for record in batch if record is not None])
+            if stop:
+                return
+
+    def _write(self, batch):
+        touched = set()
+        for record in batch:
+            if record.levelno < self.level:
+                self.ring.append(record)
+                continue
+            if record.levelno >= logging.ERROR and self.ring:
+                # エラーの直前の DEBUG レコードを書き出す
+                for handler in self.ring_handlers:
+                    for debug_record in self.ring:
+                        handler.emit(debug_record)
+                    touched.add(handler)
+                self.ring.clear()
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                    touched.add(handler)
+        for handler in touched:
+            if hasattr(handler, "commit"):
+                handler.commit()
+            else:
+                handler.flush()
+
+
+def setup_logging(logger_names, file_handler=None, console=True, level=logging.INFO, fmt=DEFAULT_FORMAT,
+                  ring_size=DEBUG_RING_SIZE, rate_limit=RATE_LIMIT_INTERVAL):
+    """
+    指定したロガーの出力を LogPipeline 経由にする
+    Args:
+        logger_names (list): 対象のロガー名
+        file_handler (logging.Handler): ファイル出力 (BatchFileHandler など)。None ならファイルに書かない
+        console (bool): 標準出力にも出すか
+        level (int): 書き出す最低レベル (これ未満はエラー時のみ書き出す)
+        rate_limit (float): 同じ警告を繰り返さない間隔（秒）。None で無効
+    Returns:
+        LogPipeline: 起動済みのパイプライン (終了時に自動で stop される)
+    """
+    formatter = logging.Formatter(fmt)
+    handlers = []
+    if file_handler is not None:
+        handlers.append(file_handler)
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # リングバッファはファイルがあればファイルにだけ書き出す
+    ring_handlers = [file_handler] if file_handler is not None else handlers
+    pipeline = LogPipeline(handlers, level=level, ring_handlers=ring_handlers, ring_size=ring_size)
+    if rate_limit:
+        pipeline.queue_handler.addFilter(RateLimitFilter(rate_limit))
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        logger.setLevel(logging.DEBUG if ring_size else level)
+        logger.addHandler(pipeline.queue_handler)
+        logger.propagate = False
+    atexit.register(pipeline.stop)
+    return pipeline.start()
+
+
+def benchmark(lines=2000, write_latency=0.002):
+    """
+    ファイル書き込みが遅い (SD カード相当) 場合のイベントループの停止時間を、
+    同期出力と LogPipeline で比較する
+    """
+    import asyncio
+    import os
+    import tempfile
+
+    class SlowFileHandler(logging.FileHandler):
+        def flush(self):
+            super().flush()
+            time.sleep(write_latency)
+
+    class SlowBatchFileHandler(BatchFileHandler):
+        def commit(self):
+            super().commit()
+            time.sleep(write_latency)
+
+    async def measure(logger):
+        stalls = []
+
+        async def ticker():
+            while True:
+                started = time.perf_counter()
+                await asyncio.sleep(0.001)
+                stalls.append(max(time.perf_counter() - started - 0.001, 0))
+
+        task = asyncio.create_task(ticker())
+        for i in range(lines):
+            logger.warning("Modem is not ready yet. Retrying...")
+            logger.debug("AT command response: %d", i)
+            logger.info("Sending AT command: %d", i)
+            if i % 10 == 0:
+                await asyncio.sleep(0)
+        task.cancel()
+        return max(stalls), sum(stalls)
+
+    directory = tempfile.mkdtemp(prefix="logpipe_bench_")
+    sync_logger = logging.getLogger("bench.sync")
+    sync_logger.propagate = False
+    sync_logger.setLevel(logging.DEBUG)
+    sync_handler = SlowFileHandler(os.path.join(directory, "sync.log"))
+    sync_logger.addHandler(sync_handler)
+    before = asyncio.run(measure(sync_logger))
+    sync_handler.close()
+
+    pipeline = setup_logging(["bench.pipeline"], SlowBatchFileHandler(os.path.join(directory, "pipeline.log")),
+                             console=False)
+    after = asyncio.run(measure(logging.getLogger("bench.pipeline")))
+    pipeline.stop()
+
+    print(f"synchronous: max stall {before[0] * 1000:.1f}ms, total stall {before[1] * 1000:.0f}ms")
+    print(f"pipeline:    max stall {after[0] * 1000:.1f}ms, total stall {after[1] * 1000:.0f}ms")
+    return before, after
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure event-loop stall time caused by logging")
+    parser.add_argument("--lines", type=int, default=2000, help="Log iterations (default: 2000)")
+    parser.add_argument("--latency", type=float, default=0.002, help="Simulated write latency in seconds (default: 0.002)")
+    args = parser.parse_args()
+
+    benchmark(args.lines, args.latency)
@@ -0,0 +1,255 @@
+"""
+1台のホストから複数の SIM7080G を扱うマネージャ
+
+各ポートのモジュールを ICCID / IMEI で識別し、モデムごとに専用のワーカースレッドを
+割り当てる。asyncio のイベントループ1つから submit() で処理を投入すると、
+正常なモデムのうち処理中の件数が最も少ないものに振り分けられる。
+"""
+
+import asyncio
+import glob
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .at import response_lines
+from .modem import Modem
+
+logger = logging.getLogger("sim7080g")
+
+# 自動検出の対象とするデバイス名
+DISCOVERY_PATTERNS = ["/dev/ttyUSB*", "/dev/ttyACM*"]
+# 連続でこの回数失敗したモデムは振り分け対象から外す
+MAX_CONSECUTIVE_FAILURES = 3
+
+
+def query_identity(modem):
+    """
+    AT+CCID / AT+GSN でモジュールの ICCID と IMEI を取得する
+    Returns:
+        tuple: (iccid, imei)。取得できなかった項目は None
+    """
+    identity = []
+    for command in ("AT+CCID", "AT+GSN"):
+        lines = response_lines(modem.command(command, timeout=1), command)
+        value = lines[0].split(":", 1)[-1].strip().strip('"') if lines else None
+        identity.append(value or None)
+    return tuple(identity)
+
+
+def discover(ports=None, baudrate=115200, gpio="mock"):
+    """
+    ポートを走査して応答したモジュールを Modem として返す。
+    USB 接続では1台のモジュールが複数のポートを持つため、IMEI が重複するポートは除外する
+    Args:
+        ports (list): 走査するポート。None の場合は DISCOVERY_PATTERNS から探す
+        baudrate (int): 走査時のボーレート
+        gpio (str): 生成する Modem の GPIO バックエンド (USB 接続では PWRKEY を持たないため mock)
+    Returns:
+        list: (Modem, iccid, imei) のリスト
+    """
+    if ports is None:
+        ports = sorted(port for pattern in DISCOVERY_PATTERNS for port in glob.glob(pattern))
+
+    found = []
+    seen = set()
+    for port in ports:
+        modem = Modem(port, baudrate, timeout=0.5, gpio=gpio)
+        try:
+            if not modem.probe(attempts=2, timeout=0.3):
+                modem.close()
+                continue
+            iccid, imei = query_identity(modem)
+        except Exception as e:
+            logger.debug(f"Skipping {port}: {e}")
+            modem.close()
+            continue
+        key = imei or iccid or port
+        if key in seen:
+            modem.close()
+            continue
+        seen.add(key)
+        logger.info(f"Discovered modem on {port}: ICCID={iccid}, IMEI={imei}")
+        found.append((modem, iccid, imei))
+    return found
+
+
+class ModemHandle:
+    """
+    マネージャが管理するモデム1台分の状態 (専用ワーカーと稼働統計)
+    """
+
+    def __init__(self, modem, iccid=None, imei=None):
+        self.modem = modem
+        self.iccid = iccid
+        self.imei = imei
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"modem-{imei or modem.port}")
+        self.in_flight = 0
+        self.completed = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.busy_time = 0.0
+
+    @property
+    def name(self):
+        return self.imei or self.iccid or self.modem.port
+
+    @property
+    def healthy(self):
+        return self.consecutive_failures < MAX_CONSECUTIVE_FAILURES
+
+    def record(self, ok, elapsed):
+        self.busy_time += elapsed
+        if ok:
+            self.completed += 1
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.modem.close()
+
+
+class ModemManager:
+    """
+    複数モデムへの処理の振り分けと健全性の管理を行う
+    """
+
+    def __init__(self, handles):
+        self.handles = list(handles)
+        self._started = time.monotonic()
+
+    @classmethod
+    def from_discovery(cls, ports=None, baudrate=115200, gpio="mock"):
+        return cls(ModemHandle(modem, iccid, imei) for modem, iccid, imei in discover(ports, baudrate, gpio))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def pick(self):
+        """
+        正常なモデムのうち処理中の件数が最も少ないものを返す
+        """
+        healthy = [handle for handle in self.handles if handle.healthy]
+        if not healthy:
+            raise RuntimeError("No healthy modem available")
+        return min(healthy, key=lambda handle: (handle.in_flight, handle.completed))
+
+    async def submit(self, fn, *args):
+        """
+        fn(modem, *args) をいずれかのモデムのワーカーで実行し、結果を返す
+        """
+        handle = self.pick()
+        handle.in_flight += 1
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        ok = False
+        try:
+            result = await loop.run_in_executor(handle.executor, fn, handle.modem, *args)
+            ok = True
+            return result
+        finally:
+            handle.in_flight -= 1
+            handle.record(ok, time.monotonic() - started)
+
+    async def health_check(self):
+        """
+        全モデムに AT を送り、応答したモデムを正常な状態に戻す
+        """
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(handle.executor, handle.modem.probe) for handle in self.handles
+        ), return_exceptions=True)
+        for handle, result in zip(self.handles, results):
+            if result is True:
+                handle.consecutive_failures = 0
+            else:
+                handle.consecutive_failures = MAX_CONSECUTIVE_FAILURES
+                logger.warning(f"Modem {handle.name} failed health check: {result}")
+
+    def stats(self):
+        """
+        モデムごとの統計と全体のスループットを返す
+        """
+        elapsed = time.monotonic() - self._started
+        completed = sum(handle.completed for handle in self.handles)
+        return {
+            "modems": {
+                handle.name: {
+                    "port": handle.modem.port,
+                    "healthy": handle.healthy,
+                    "completed": handle.completed,
+                    "failures": handle.failures,
+                    "utilization": handle.busy_time / elapsed if elapsed else 0.0,
+                }
+                for handle in self.handles
+            },
+            "completed": completed,
+            "throughput": completed / elapsed if elapsed else 0.0,
+        }
+
+    def close(self):
+        for handle in self.handles:
+            handle.close()
+
+
+def send_payload(modem, payload, cid=0):
+    """
+    AT+CASEND でペイロードを1件送信する (接続済みのソケット cid を使用)
+    """
+    with modem.lock:
+        if ">" not in modem.command(f"AT+CASEND={cid},{len(payload)}", timeout=2, expect=">"):
+            raise RuntimeError(f"AT+CASEND was not accepted on {modem.port}")
+        modem.write(payload)
+        if "OK" not in modem.at.read_until(("OK\r\n", "ERROR\r\n"), 5):
+            raise RuntimeError(f"Payload was not confirmed on {modem.port}")
+
+
+def benchmark(modem_counts=(1, 2, 4), messages=200, payload_size=64, latency=0.02):
+    """
+    疑似モデムを使い、モデム数ごとの送信スループットを測定する
+    Returns:
+        dict: モデム数 -> messages/s
+    """
+    from .emulator import FakeModem
+
+    payload = bytes(payload_size)
+    results = {}
+    for count in modem_counts:
+        fakes = [FakeModem(iccid=f"8988228000000000{i:04d}", imei=f"86000000000{i:04d}", latency=latency)
+                 for i in range(count)]
+        ports = [fake.start() for fake in fakes]
+        with ModemManager.from_discovery(ports) as manager:
+            async def run():
+                await asyncio.gather(*(manager.submit(send_payload, payload) for _ in range(messages)))
+            started = time.monotonic()
+            asyncio.run(run())
+            results[count] = messages / (time.monotonic() - started)
+        for fake in fakes:
+            fake.stop()
+        print(f"{count} modem(s): {results[count]:.1f} messages/s")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SIM7080G multi-modem manager")
+    parser.add_argument("--benchmark", action="store_true", help="Measure aggregate throughput with pseudo-tty modems")
+    parser.add_argument("--modems", type=int, nargs="+", default=[1, 2, 4], help="Modem counts to benchmark (default: 1 2 4)")
+    parser.add_argument("--messages", type=int, default=200, help="Messages per benchmark run (default: 200)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated per-command latency in seconds (default: 0.02)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.benchmark:
+        benchmark(args.modems, args.messages, latency=args.latency)
+    else:
+        for modem, iccid, imei in discover():
+            print(f"{modem.port}: ICCID={iccid} IMEI={imei}")
+            modem.close()
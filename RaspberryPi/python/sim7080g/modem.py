@@ -0,0 +1,290 @@
+"""
+SIM7080G モジュールを操作する Modem クラス
+"""
+
+import logging
+import threading
+import time
+from time import sleep
+
+import serial
+
+from .at import ATEngine
+from .gpio import create_backend
+
+logger = logging.getLogger("sim7080g")
+
+# PWRKEY のパルス幅（秒）
+POWER_ON_PULSE = 1
+POWER_DOWN_PULSE = 2
+# 起動/停止完了を待つ最大時間（秒）。状態が確認できた時点で打ち切る
+BOOT_TIMEOUT = 15
+SHUTDOWN_TIMEOUT = 10
+# check_start で PWRKEY をパルスする最大回数
+START_ATTEMPTS = 3
+# 起動完了を示す URC
+READY_URCS = ("RDY", "+CPIN: READY")
+
+
+class Modem:
+    """
+    SIM7080G 1台分のシリアルポートと PWRKEY をまとめて扱う。
+    シリアルポートと GPIO は最初に使われた時点で開かれる。
+    """
+
+    def __init__(self, port="/dev/ttyS0", baudrate=9600, timeout=1, power_key=4, gpio="rpi", rtscts=False,
+                 status_pin=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.power_key = power_key
+        self.gpio_backend = gpio
+        self.rtscts = rtscts
+        self.status_pin = status_pin
+        self._serial = None
+        self._at = None
+        self._gpio = None
+        self._status = None
+        # シリアルポートを使う操作の排他 (スレッドをまたいで共有する場合。複数手順の操作は with modem.lock で囲む)
+        self.lock = threading.RLock()
+        # PWRKEY で電源を入れた / 切ったときに呼ぶ関数 (引数は電源が入っていれば True。energy.EnergyMeter など)
+        self.power_hooks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def serial(self):
+        if self._serial is None:
+            self._serial = serial.Serial(self.port, self.baudrate, timeout=self.timeout, rtscts=self.rtscts)
+            self._serial.reset_input_buffer()
+        return self._serial
+
+    @property
+    def at(self):
+        if self._at is None:
+            self._at = ATEngine(self.serial)
+        elif self._serial is None:
+            # close_serial() の後: フックを登録した ATEngine はそのまま使い、開き直したポートに差し替える
+            self._at.ser = self.serial
+        return self._at
+
+    @property
+    def gpio(self):
+        if self._gpio is None:
+            self._gpio = create_backend(self.gpio_backend, self.power_key)
+        return self._gpio
+
+    @property
+    def status(self):
+        """
+        STATUS ピンの入力バックエンド。status_pin が未設定なら None
+        """
+        if self._status is None and self.status_pin is not None:
+            self._status = create_backend(self.gpio_backend, self.status_pin, output=False)
+        return self._status
+
+    def command(self, command, timeout=1, expect=None, retries=1):
+        """
+        AT コマンドを送信して応答文字列を返す
+        """
+        with self.lock:
+            return self.at.execute(command, timeout=timeout, expect=expect, retries=retries)
+
+    def send_at(self, command, back="OK", timeout=1):
+        """
+        AT コマンドを送信し、応答に back が含まれるかを返す
+        """
+        response = self.command(command, timeout=timeout, expect=back)
+        if back in response:
+            logger.info(response)
+            return True
+        if response:
+            logger.error(f"{command} back:\t{response}")
+        else:
+            logger.error(f"{command} no response")
+        return False
+
+    def write(self, data):
+        """
+        生データを送信する (AT+CASEND / AT+SMPUB の本文など)
+        """
+        with self.lock:
+            self.at.write(data)
+
+    def probe(self, attempts=3, timeout=0.5):
+        """
+        "AT" を送信し、OK が返るかを確認する
+        """
+        with self.lock:
+            for _ in range(attempts):
+                if "OK" in self.at.execute("AT", timeout=timeout):
+                    return True
+        return False
+
+    def set_baudrate(self, rate):
+        """
+        ホスト側のボーレートを変更する (モジュール側の変更は baud.switch_baudrate を使う)
+        """
+        self.baudrate = rate
+        if self._serial is not None:
+            self._serial.baudrate = rate
+
+    def set_rtscts(self, enabled):
+        """
+        ホスト側の RTS/CTS フロー制御を切り替える
+        """
+        self.rtscts = enabled
+        if self._serial is not None:
+            self._serial.rtscts = enabled
+
+    def is_powered(self):
+        """
+        モジュールが起動しているかを返す。
+        STATUS ピンがあればその状態を、なければ "AT" 1回分の応答で判断する
+        """
+        if self.status is not None:
+            return self.status.read()
+        try:
+            return self.probe(attempts=2, timeout=0.3)
+        except OSError as e:
+            # USB 接続ではモジュールが停止・再起動中だとポートが存在しない (serial.SerialException は OSError)
+            logger.debug(f"Serial port unavailable: {e}")
+            self.close_serial()
+            return False
+
+    def wait_ready(self, timeout=BOOT_TIMEOUT):
+        """
+        起動完了 (RDY / +CPIN: READY の URC、または AT への応答) を待つ
+        Returns:
+            bool: timeout 秒以内に起動が確認できればTrue
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.status is not None and not self.status.read():
+                sleep(0.1)
+                continue
+            try:
+                urc = self.at.read_urc(READY_URCS, 0.5)
+                if any(token in urc for token in READY_URCS) or self.probe(attempts=1, timeout=0.3):
+                    return True
+            except OSError as e:
+                # 再起動したモジュールが USB に現れるまではポートを開けない。閉じて開き直しを繰り返す
+                logger.debug(f"Serial port unavailable: {e}")
+                self.close_serial()
+                sleep(0.5)
+        return False
+
+    def _pulse(self, duration):
+        self.gpio.on()
+        sleep(duration)
+        self.gpio.off()
+
+    def power_on(self, force=False, wait=True):
+        """
+        モジュールが停止している場合のみ PWRKEY をパルスして起動する。
+        起動中のモジュールに PWRKEY を入れると停止してしまうため、force=True 以外では確認を行う
+        Args:
+            force (bool): 状態確認を省略して PWRKEY をパルスする
+            wait (bool): 起動完了まで待つ (False の場合は呼び出し側で確認する)
+        Returns:
+            bool: 起動が確認できればTrue
+        """
+        if not force and self.is_powered():
+            logger.info("SIM7080X is already running.")
+            return True
+        logger.info("SIM7080X is starting...")
+        started = time.monotonic()
+        self._pulse(POWER_ON_PULSE)
+        if not wait:
+            self._notify_power(True)
+            return True
+        if not self.wait_ready():
+            logger.error("SIM7080X did not become ready after power on.")
+            return False
+        self._notify_power(True)
+        logger.info(f"Power On sequence complete ({time.monotonic() - started:.1f}s).")
+        return True
+
+    def power_down(self):
+        """
+        モジュールが起動している場合のみ PWRKEY をパルスして停止する
+        """
+        if not self.is_powered():
+            logger.info("SIM7080X is already off.")
+            return
+        logger.info("SIM7080X is logging off...")
+        self._pulse(POWER_DOWN_PULSE)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.status is not None:
+                if not self.status.read():
+                    break
+                sleep(0.1)
+            else:
+                try:
+                    if "NORMAL POWER DOWN" in self.at.read_urc(("NORMAL POWER DOWN",), 0.5):
+                        break
+                except OSError:
+                    # USB 接続ではポートが消えた時点で停止している
+                    self.close_serial()
+                    break
+        self._notify_power(False)
+        logger.info("Goodbye.")
+
+    def _notify_power(self, powered):
+        for hook in self.power_hooks:
+            try:
+                hook(powered)
+            except Exception as e:
+                logger.warning(f"Power state hook failed: {e}")
+
+    def check_start(self, attempts=START_ATTEMPTS):
+        """
+        モジュールが AT に応答するまで待ち、停止していれば起動する
+        Args:
+            attempts (int): PWRKEY をパルスする最大回数
+        Raises:
+            RuntimeError: attempts 回起動しても応答しない
+        """
+        for attempt in range(1, attempts + 1):
+            if self.power_on():
+                return
+            logger.warning(f"SIM7080X not responding after power on (attempt {attempt}/{attempts}).")
+            # 起動が遅れているだけのモジュールに PWRKEY を入れ直すと停止してしまう。
+            # もう一度起動完了を待ち、それでも応答しなければ次の power_on で状態を確かめてからパルスする
+            if self.wait_ready():
+                self._notify_power(True)
+                return
+        raise RuntimeError(f"SIM7080X did not start after {attempts} power on attempts")
+
+    def close_serial(self):
+        """
+        シリアルポートだけを閉じる。次に使うときに開き直す。
+        モジュールを再起動すると USB のポートが作り直されるため、リセットの前後で呼ぶ。
+        ATEngine と登録されたフックは残す
+        """
+        if self._serial is not None:
+            try:
+                self._serial.close()
+            except OSError as e:
+                logger.debug(f"Failed to close serial port: {e}")
+            self._serial = None
+
+    def close(self):
+        """
+        シリアルポートと GPIO を解放する
+        """
+        if self._serial is not None:
+            self._serial.close()
+            self._serial = None
+            self._at = None
+        if self._gpio is not None:
+            self._gpio.close()
+            self._gpio = None
+        if self._status is not None:
+            self._status.close()
+            self._status = None
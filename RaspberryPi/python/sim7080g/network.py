@@ -0,0 +1,89 @@
+"""
+ネットワーク登録の監視
+
+AT+CEREG=1 / AT+CGREG=1 で登録状態の URC を有効にし、+CEREG: / +CGREG: を受信した時点で
+登録完了を判定する。ATEngine のフックで他のコマンドの応答に混ざった URC も拾う。
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("sim7080g")
+
+# 登録済みを示す stat (1: ホーム, 5: ローミング)
+REGISTERED = ("1", "5")
+REGISTRATION_URCS = ("+CEREG:", "+CGREG:")
+# URC を待つ1回あたりの時間（秒）。この間だけシリアルポートを占有する
+URC_SLICE = 0.5
+# URC を取りこぼした場合に備えて状態を問い合わせる間隔（秒）
+QUERY_INTERVAL = 10
+
+
+def parse_registration(line, query=False):
+    """
+    +CEREG: / +CGREG: の行から stat を取り出す
+    例: URC "+CEREG: 1" -> "1"、問い合わせの応答 "+CEREG: 1,5" -> "5"
+    """
+    fields = line.split(":", 1)[1].strip().split(",")
+    stat = fields[1] if query and len(fields) > 1 else fields[0]
+    return stat.strip().strip('"')
+
+
+class RegistrationWatcher:
+    """
+    LTE (+CEREG) / パケット (+CGREG) の登録状態を URC で追跡する
+    """
+
+    def __init__(self, modem):
+        self.modem = modem
+        self.registered = threading.Event()
+        self.status = {}
+        modem.at.hooks.append(self.observe)
+
+    def observe(self, trace):
+        self._scan(trace.response, trace.command)
+
+    def _scan(self, text, command=None):
+        for line in text.splitlines():
+            line = line.strip()
+            for prefix in REGISTRATION_URCS:
+                if not line.startswith(prefix):
+                    continue
+                stat = parse_registration(line, query=command == f"AT{prefix[:-1]}?")
+                name = prefix[1:-1]
+                if self.status.get(name) != stat:
+                    logger.info(f"{name} registration status: {stat}")
+                self.status[name] = stat
+                if stat in REGISTERED:
+                    self.registered.set()
+
+    def enable(self):
+        """
+        登録状態の URC を有効にし、現在の状態を取得する
+        """
+        for command in ("AT+CEREG=1", "AT+CGREG=1", "AT+CEREG?", "AT+CGREG?"):
+            self.modem.command(command)
+
+    def wait(self, timeout=60):
+        """
+        登録が完了するまで URC を待つ。待機中も他のスレッドがモデムを使えるよう、短い区間ごとにロックを離す
+        Returns:
+            bool: 登録できたらTrue
+        """
+        deadline = time.monotonic() + timeout
+        next_query = time.monotonic() + QUERY_INTERVAL
+        tokens = tuple(f"{prefix} {stat}\r\n" for prefix in REGISTRATION_URCS for stat in REGISTERED)
+        while not self.registered.is_set():
+            now = time.monotonic()
+            if now >= deadline:
+                return False
+            if now >= next_query:
+                self.modem.command("AT+CEREG?")
+                next_query = now + QUERY_INTERVAL
+                continue
+            with self.modem.lock:
+                # read_urc は受信した URC を他のフック (応答キャッシュの無効化など) にも渡す
+                self._scan(self.modem.at.read_urc(tokens, min(URC_SLICE, deadline - now)))
+            time.sleep(0.05)
+        return True
@@ -0,0 +1,330 @@
+"""
+PPP 接続プロファイル (peers ファイルと chat スクリプト) の生成
+
+PPPProfile の設定から /etc/ppp/peers と chat スクリプトを組み立て、内容が変わったときだけ書き換える。
+benchmark() は pppd 同士を pty でつないだループバック (サーバ側はネットワーク名前空間) で
+プロファイルごとの接続時間とスループットを比較する。
+"""
+
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, replace
+from typing import Optional
+
+logger = logging.getLogger("sim7080g")
+
+PPP_PEER_FILE = "/etc/ppp/peers/sim7080g"
+CHAT_CONNECT_FILE = "/etc/chatscripts/chat-connect"
+CHAT_DISCONNECT_FILE = "/etc/chatscripts/chat-disconnect"
+CHAT_ABORTS = ("BUSY", "NO CARRIER", "ERROR", "NO DIALTONE")
+
+
+@dataclass
+class PPPProfile:
+    """
+    PPP 接続の設定。None の項目は peers ファイルに書かない (pppd の既定値を使う)
+    """
+
+    device: str = "/dev/ttyAMA0"
+    baudrate: int = 115200
+    # RTS/CTS (crtscts / nocrtscts)。配線されていないボードで有効にすると送信が止まるため既定は無効
+    rtscts: Optional[bool] = False
+    apn: str = "iot.1nce.net"
+    plmn: str = "44020"
+    mtu: Optional[int] = None
+    mru: Optional[int] = None
+    # Van Jacobson TCP/IP ヘッダ圧縮 (False で novj / novjccomp)
+    vj_compression: bool = True
+    lcp_echo_interval: Optional[int] = None
+    lcp_echo_failure: Optional[int] = None
+    # 接続スクリプト完了後、相手の LCP パケットを待つ時間 (ms)
+    connect_delay: Optional[int] = None
+    # chat の各応答待ち時間と、ATD*99# の CONNECT 待ち時間（秒）
+    chat_timeout: Optional[int] = 10
+    dial_timeout: Optional[int] = 30
+    persist: bool = True
+
+    def __post_init__(self):
+        for name in ("baudrate", "mtu", "mru", "lcp_echo_interval", "lcp_echo_failure", "connect_delay",
+                     "chat_timeout", "dial_timeout"):
+            value = getattr(self, name)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                raise ValueError(f"{name} must be a non-negative integer, got {value!r}")
+        for name in ("mtu", "mru"):
+            value = getattr(self, name)
+            if value is not None and not 128 <= value <= 16384:
+                raise ValueError(f"{name} must be between 128 and 16384, got {value}")
+        if (self.lcp_echo_interval is None) != (self.lcp_echo_failure is None):
+            raise ValueError("lcp_echo_interval and lcp_echo_failure must be set together")
+
+    def link_options(self):
+        """
+        Returns:
+            list: リンク層の pppd オプション (peers ファイルとベンチマークで共通)
+        """
+        options = []
+        if self.mtu is not None:
+            options += ["mtu", str(self.mtu)]
+        if self.mru is not None:
+            options += ["mru", str(self.mru)]
+        if not self.vj_compression:
+            options += ["novj", "novjccomp"]
+        if self.lcp_echo_interval is not None:
+            options += ["lcp-echo-interval", str(self.lcp_echo_interval),
+                        "lcp-echo-failure", str(self.lcp_echo_failure)]
+        if self.connect_delay is not None:
+            options += ["connect-delay", str(self.connect_delay)]
+        return options
+
+
+# よく使う設定。legacy は以前の固定の peers ファイル (9600 bps、フロー制御の指定なし) と同じ内容
+PROFILES = {
+    "legacy": PPPProfile(baudrate=9600, rtscts=None, chat_timeout=None, dial_timeout=None),
+    "tuned": PPPProfile(mtu=1280, mru=1280, vj_compression=False, lcp_echo_interval=30, lcp_echo_failure=4,
+                        connect_delay=500),
+    "keepalive": PPPProfile(mtu=1280, mru=1280, vj_compression=False, lcp_echo_interval=10, lcp_echo_failure=3),
+    "vj": PPPProfile(mtu=1280, mru=1280, vj_compression=True, lcp_echo_interval=30, lcp_echo_failure=4),
+}
+
+
+def render_peers(profile, connect_file=CHAT_CONNECT_FILE, disconnect_file=CHAT_DISCONNECT_FILE):
+    lines = [
+        f"{profile.device} {profile.baudrate}",
+    ]
+    if profile.rtscts is not None:
+        lines.append("crtscts" if profile.rtscts else "nocrtscts")
+    lines += [
+        f"connect '/usr/sbin/chat -v -f {connect_file}'",
+        f"disconnect '/usr/sbin/chat -v -f {disconnect_file}'",
+        "noauth",
+        "defaultroute",
+        "usepeerdns",
+    ]
+    if profile.persist:
+        lines.append("persist")
+    options = profile.link_options()
+    # "mtu 1280" のように値を取るオプションは1行にまとめる
+    index = 0
+    while index < len(options):
+        if index + 1 < len(options) and options[index + 1].isdigit():
+            lines.append(f"{options[index]} {options[index + 1]}")
+            index += 2
+        else:
+            lines.append(options[index])
+            index += 1
+    lines += ['user ""', 'password ""']
+    return "\n".join(lines) + "\n"
+
+
+def render_chat_connect(profile):
+    lines = [f"ABORT '{abort}'" for abort in CHAT_ABORTS]
+    if profile.chat_timeout is not None:
+        lines.append(f"TIMEOUT {profile.chat_timeout}")
+    lines += [
+        "'' AT",
+        "OK ATZ",
+        f'OK AT+CGDCONT=1,"IP","{profile.apn}"',
+        f'OK AT+COPS=1,2,"{profile.plmn}"',
+    ]
+    if profile.dial_timeout is not None:
+        lines.append(f"TIMEOUT {profile.dial_timeout}")
+    lines += ["OK ATD*99#", "CONNECT ''"]
+    return "\n".join(lines) + "\n"
+
+
+def render_chat_disconnect(profile):
+    lines = ["ABORT 'ERROR'"]
+    if profile.chat_timeout is not None:
+        lines.append(f"TIMEOUT {profile.chat_timeout}")
+    lines += ["'' +++", 'SAY "Disconnecting the modem\\n"', "'' ATH", "OK"]
+    return "\n".join(lines) + "\n"
+
+
+def write_if_changed(path, content):
+    """
+    内容が異なる場合だけ書き換える (一時ファイル経由で置き換える)
+    Returns:
+        bool: 書き換えたらTrue
+    """
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return True
+
+
+def write_profile(profile, peer_file=PPP_PEER_FILE, connect_file=CHAT_CONNECT_FILE,
+                  disconnect_file=CHAT_DISCONNECT_FILE):
+    """
+    peers ファイルと chat スクリプトを書き出す
+    Returns:
+        list: 書き換えたファイルのパス
+    """
+    files = {
+        peer_file: render_peers(profile, connect_file, disconnect_file),
+        connect_file: render_chat_connect(profile),
+        disconnect_file: render_chat_disconnect(profile),
+    }
+    changed = [path for path, content in files.items() if write_if_changed(path, content)]
+    for path in files:
+        logger.info(f"{path} {'updated' if path in changed else 'unchanged'}.")
+    return changed
+
+
+_SINK = """
+import socket, sys
+server = socket.socket()
+server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+server.bind((sys.argv[1], int(sys.argv[2])))
+server.listen(1)
+while True:
+    conn, _ = server.accept()
+    total = 0
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        total += len(data)
+    conn.sendall(str(total).encode())
+    conn.close()
+"""
+
+
+def _interface_with(address):
+    output = subprocess.run(["ip", "-o", "-4", "addr"], stdout=subprocess.PIPE, text=True).stdout
+    for line in output.splitlines():
+        if f"inet {address}" in line:
+            return line.split()[1]
+    return None
+
+
+def measure(profile, size=1024 * 1024, namespace="pppbench", local_ip="10.64.64.2", remote_ip="10.64.64.1",
+            port=5001, timeout=20):
+    """
+    pppd 同士を pty でつなぎ (相手側はネットワーク名前空間 namespace 内)、接続時間とスループットを測る。
+    root 権限と pppd / iproute2 が必要
+    Returns:
+        tuple: (接続時間（秒）, bytes/s)。失敗した項目は None
+    """
+    options = profile.link_options()
+    peer = " ".join(["ip", "netns", "exec", namespace, "pppd", "notty", "local", "noauth", "nodetach",
+                     "nodefaultroute", "noipdefault", f"{remote_ip}:{local_ip}"] + options)
+    client = subprocess.Popen(["pppd", "pty", peer, "local", "noauth", "nodetach", "nodefaultroute",
+                               f"{local_ip}:{remote_ip}"] + options,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sink = None
+    try:
+        started = time.monotonic()
+        while _interface_with(local_ip) is None:
+            if time.monotonic() - started > timeout or client.poll() is not None:
+                return None, None
+            time.sleep(0.01)
+        connect_time = time.monotonic() - started
+
+        sink = subprocess.Popen(["ip", "netns", "exec", namespace, sys.executable, "-c", _SINK, remote_ip, str(port)])
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                sock = socket.create_connection((remote_ip, port), timeout=timeout)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    return connect_time, None
+                time.sleep(0.05)
+        with sock:
+            started = time.perf_counter()
+            sock.sendall(bytes(size))
+            sock.shutdown(socket.SHUT_WR)
+            received = int(sock.recv(64) or 0)
+            elapsed = time.perf_counter() - started
+        return connect_time, (received / elapsed if received == size else None)
+    finally:
+        for process in (sink, client):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+
+def modeled_throughput(profile, payload=1024 * 1024):
+    """
+    UART 上のフレーミング (HDLC 風の8バイト + エスケープ) と TCP/IP ヘッダから見た実効スループット (bytes/s)。
+    VJ 圧縮時の TCP/IP ヘッダは約 5 バイトとして見積もる
+    """
+    from .udp import ppp_frame_size
+
+    mtu = profile.mtu or 1500
+    header = 5 if profile.vj_compression else 40
+    segment = mtu - 40
+    packets = -(-payload // segment)
+    uart = packets * ppp_frame_size(segment, ip_header=header, udp_header=0)
+    return payload / (uart * 10 / profile.baudrate)
+
+
+def benchmark(names=None, size=1024 * 1024, namespace="pppbench"):
+    """
+    プロファイルごとに接続時間とスループットを比較する。
+    pppd がない環境や root でない場合は UART フレーミングからの見積もりのみ表示する
+    """
+    names = names or list(PROFILES)
+    can_measure = shutil.which("pppd") is not None and os.geteuid() == 0
+    if can_measure:
+        subprocess.run(["ip", "netns", "add", namespace], stderr=subprocess.DEVNULL)
+    else:
+        print("pppd or root privileges not available: showing modeled UART throughput only")
+    results = {}
+    try:
+        for name in names:
+            profile = PROFILES[name]
+            connect_time, throughput = measure(profile, size, namespace) if can_measure else (None, None)
+            modeled = modeled_throughput(profile)
+            results[name] = {"connect_time": connect_time, "throughput": throughput, "modeled": modeled}
+            measured = (f"connect {connect_time * 1000:7.1f}ms " if connect_time is not None else "connect       - ") + \
+                (f"throughput {throughput / 1024:9.1f}KB/s " if throughput is not None else "throughput         - ")
+            print(f"{name:10s} {measured}modeled @{profile.baudrate}bps {modeled / 1024:6.2f}KB/s "
+                  f"[{' '.join(profile.link_options()) or 'pppd defaults'}]")
+    finally:
+        if can_measure:
+            subprocess.run(["ip", "netns", "delete", namespace], stderr=subprocess.DEVNULL)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate or benchmark SIM7080G PPP profiles")
+    parser.add_argument("--profile", default="tuned", choices=sorted(PROFILES), help="Profile to write (default: tuned)")
+    parser.add_argument("--baudrate", type=int, help="Override the profile baud rate")
+    parser.add_argument("--rtscts", action="store_true",
+                        help="Write crtscts (only if the RTS/CTS lines are wired to the module)")
+    parser.add_argument("--print", action="store_true", help="Print the generated files instead of writing them")
+    parser.add_argument("--benchmark", action="store_true", help="Compare profiles over a local pppd-over-pty loopback")
+    parser.add_argument("--size", type=int, default=1024 * 1024, help="Bytes to transfer per benchmark run")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.benchmark:
+        benchmark(size=args.size)
+    else:
+        selected = PROFILES[args.profile]
+        if args.baudrate:
+            selected = replace(selected, baudrate=args.baudrate)
+        if args.rtscts:
+            selected = replace(selected, rtscts=True)
+        if args.print:
+            print(render_peers(selected), render_chat_connect(selected), render_chat_disconnect(selected), sep="\n")
+        else:
+            write_profile(selected)
@@ -0,0 +1,392 @@
+"""
+セルラー回線の遅延・スループット計測
+
+- ICMP RTT: AT+SNPING4
+- UDP エコー RTT: PPP (Linux ソケット) と内蔵スタック (ModemUDPSocket)
+- TCP 送信スループット: PPP と内蔵スタック (AT+CAOPEN "TCP" + AT+CASEND)
+- DNS 解決時間: PPP (getaddrinfo) と内蔵スタック (AT+CDNSGIP)
+
+Campaign で定期的に繰り返し、パーセンタイルを集計して CSV (または Parquet) に書き出す。
+ローカルのエコーサーバ (serve_echo) と疑似モデムを使えば再現性のある基準値が取れる。
+"""
+
+import csv
+import logging
+import re
+import socket
+import socketserver
+import threading
+import time
+
+from .udp import OPEN_TIMEOUT, SEND_TIMEOUT, ModemUDPSocket
+
+logger = logging.getLogger("sim7080g")
+
+# AT+CASEND 1回あたりの最大長
+CASEND_CHUNK = 1460
+# AT+SNPING4 が応答なしの場合に返す RTT (ms)
+SNPING_TIMEOUT_RTT = 60000
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """
+    最近傍法のパーセンタイル (values はソート済み)
+    """
+    if not values:
+        return None
+    index = max(int(len(values) * percent / 100 + 0.5) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def snping(modem, host, count=4, size=16, timeout_ms=1000):
+    """
+    AT+SNPING4 で ICMP エコーを送る
+    Returns:
+        list: 応答ごとの RTT（秒）。応答がなければ None
+    """
+    with modem.lock:
+        response = modem.command(f'AT+SNPING4="{host}",{count},{size},{timeout_ms}', timeout=2)
+        if "OK" not in response:
+            logger.error(f"AT+SNPING4 failed: '{response}'")
+            return [None] * count
+        deadline = time.monotonic() + count * (timeout_ms / 1000 + 1)
+        replies = {}
+        buff = response
+        while len(replies) < count and time.monotonic() < deadline:
+            for seq, rtt in re.findall(r"\+SNPING4: (\d+),[^,]*,(\d+)", buff):
+                replies[int(seq)] = int(rtt)
+            if len(replies) >= count:
+                break
+            buff += modem.at.read_until(("\r\n",), deadline - time.monotonic())
+    return [replies[seq] / 1000 if seq in replies and replies[seq] < SNPING_TIMEOUT_RTT else None
+            for seq in range(1, count + 1)]
+
+
+def udp_echo_ppp(host, port, count=4, size=16, timeout=2):
+    """
+    Linux ソケット (PPP 経由) で UDP エコーの RTT を測る
+    """
+    results = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        for seq in range(count):
+            payload = seq.to_bytes(4, "big") + bytes(max(size - 4, 0))
+            started = time.perf_counter()
+            sock.sendto(payload, (host, port))
+            try:
+                while True:
+                    data, _ = sock.recvfrom(65536)
+                    if data[:4] == payload[:4]:
+                        results.append(time.perf_counter() - started)
+                        break
+            except socket.timeout:
+                results.append(None)
+    return results
+
+
+def udp_echo_modem(modem, host, port, count=4, size=16, timeout=2, cid=1):
+    """
+    内蔵スタック (AT+CAOPEN "UDP") で UDP エコーの RTT を測る
+    """
+    sock = ModemUDPSocket(modem, cid=cid)
+    results = []
+    try:
+        for seq in range(count):
+            payload = seq.to_bytes(4, "big") + bytes(max(size - 4, 0))
+            started = time.perf_counter()
+            try:
+                sock.sendto(payload, (host, port))
+                data, _ = sock.recvfrom(1460, timeout=timeout)
+                if data != payload:
+                    raise OSError(f"echo mismatch ({len(data)} of {len(payload)} bytes)")
+                results.append(time.perf_counter() - started)
+            except (OSError, TimeoutError) as e:
+                logger.debug(f"UDP echo via modem failed: {e}")
+                results.append(None)
+    finally:
+        sock.close()
+    return results
+
+
+def tcp_throughput_ppp(host, port, size=64 * 1024, timeout=30):
+    """
+    Linux ソケットで size バイトを送り、受信側が全量を受け取るまでのスループットを測る
+    Returns:
+        list: [bytes/s]。失敗時は [None]
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            started = time.perf_counter()
+            sock.sendall(bytes(size))
+            sock.shutdown(socket.SHUT_WR)
+            # シンクサーバは受信したバイト数を返して閉じる
+            reply = sock.recv(64)
+            elapsed = time.perf_counter() - started
+        if int(reply or 0) != size:
+            return [None]
+        return [size / elapsed]
+    except (OSError, ValueError) as e:
+        logger.debug(f"TCP throughput via PPP failed: {e}")
+        return [None]
+
+
+def tcp_throughput_modem(modem, host, port, size=16 * 1024, cid=2, pdp_index=0):
+    """
+    内蔵スタック (AT+CAOPEN "TCP" + AT+CASEND) で size バイトを送るスループットを測る
+    (UART とコマンドの往復を含む。モジュールが受け付けた時点を完了とする)
+    """
+    opener = ModemUDPSocket(modem, cid=cid, pdp_index=pdp_index)
+    if not opener.activate():
+        return [None]
+    with modem.lock:
+        response = modem.command(f'AT+CAOPEN={cid},{pdp_index},"TCP","{host}",{port}', timeout=OPEN_TIMEOUT,
+                                 expect="+CAOPEN:")
+        if f"+CAOPEN: {cid},0" not in response:
+            logger.error(f"AT+CAOPEN (TCP) failed: '{response}'")
+            return [None]
+        try:
+            started = time.perf_counter()
+            sent = 0
+            while sent < size:
+                chunk = min(CASEND_CHUNK, size - sent)
+                if ">" not in modem.command(f"AT+CASEND={cid},{chunk}", timeout=SEND_TIMEOUT, expect=">"):
+                    return [None]
+                modem.write(bytes(chunk))
+                if "OK" not in modem.at.read_until(("OK\r\n", "ERROR\r\n"), SEND_TIMEOUT):
+                    return [None]
+                sent += chunk
+            elapsed = time.perf_counter() - started
+        finally:
+            modem.command(f"AT+CACLOSE={cid}", timeout=OPEN_TIMEOUT)
+    return [size / elapsed]
+
+
+def dns_ppp(host):
+    """
+    getaddrinfo (PPP 経由のリゾルバ) の解決時間
+    """
+    started = time.perf_counter()
+    try:
+        socket.getaddrinfo(host, None, socket.AF_INET)
+    except OSError:
+        return [None]
+    return [time.perf_counter() - started]
+
+
+def dns_modem(modem, host, timeout=10):
+    """
+    AT+CDNSGIP (内蔵スタックのリゾルバ) の解決時間
+    """
+    with modem.lock:
+        started = time.perf_counter()
+        response = modem.command(f'AT+CDNSGIP="{host}",1,{timeout * 1000}', timeout=2)
+        if "OK" not in response:
+            return [None]
+        # 結果は URC "+CDNSGIP: 1,<ホスト名>,<IP>" (失敗時は "+CDNSGIP: 0,<エラー>")
+        if "+CDNSGIP:" not in response:
+            response += modem.at.read_until(("+CDNSGIP: 1", "+CDNSGIP: 0"), timeout)
+        elapsed = time.perf_counter() - started
+    return [elapsed] if "+CDNSGIP: 1" in response else [None]
+
+
+class Campaign:
+    """
+    計測を interval 秒ごとに rounds 回繰り返し、結果を1サンプル1行で保持する
+    Args:
+        probes (dict): 計測名 -> 引数なしで呼ぶと値のリスト (None は失敗) を返す関数
+    """
+
+    def __init__(self, probes, interval=60, rounds=10):
+        self.probes = probes
+        self.interval = interval
+        self.rounds = rounds
+        # (time, round, probe, sample, value)
+        self.rows = []
+
+    def run(self):
+        next_round = time.monotonic()
+        for round_index in range(self.rounds):
+            for name, probe in self.probes.items():
+                try:
+                    values = probe()
+                except Exception as e:
+                    logger.error(f"Probe {name} failed: {e}")
+                    values = [None]
+                now = time.time()
+                for sample, value in enumerate(values):
+                    self.rows.append((now, round_index, name, sample, value))
+            next_round += self.interval
+            if round_index + 1 < self.rounds:
+                time.sleep(max(next_round - time.monotonic(), 0))
+        return self
+
+    def summary(self):
+        """
+        Returns:
+            dict: 計測名 -> {count, lost, p50, p90, p99, max}
+        """
+        result = {}
+        for name in self.probes:
+            values = [row[4] for row in self.rows if row[2] == name]
+            ok = sorted(value for value in values if value is not None)
+            stats = {"count": len(values), "lost": len(values) - len(ok)}
+            for percent in PERCENTILES:
+                stats[f"p{percent}"] = percentile(ok, percent)
+            stats["max"] = ok[-1] if ok else None
+            result[name] = stats
+        return result
+
+    def write(self, path):
+        """
+        path の拡張子が .parquet なら Parquet (pyarrow が必要)、それ以外は CSV で書き出す
+        """
+        columns = ("time", "round", "probe", "sample", "value")
+        if path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.table({column: [row[i] for row in self.rows] for i, column in enumerate(columns)})
+            pq.write_table(table, path, compression="zstd")
+            return
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in self.rows:
+                writer.writerow((f"{row[0]:.3f}", row[1], row[2], row[3], "" if row[4] is None else f"{row[4]:.6g}"))
+
+
+def format_summary(summary):
+    lines = [f"{'probe':16s} {'count':>6s} {'lost':>5s} {'p50':>12s} {'p90':>12s} {'p99':>12s} {'max':>12s}"]
+    for name, stats in summary.items():
+        # スループット (bytes/s) はそのまま、それ以外は ms で表示する
+        throughput = name.startswith("tcp")
+
+        def fmt(value):
+            if value is None:
+                return f"{'-':>12s}"
+            return f"{value / 1024:9.1f}KB/s" if throughput else f"{value * 1000:10.1f}ms"
+
+        lines.append(f"{name:16s} {stats['count']:6d} {stats['lost']:5d} "
+                     + " ".join(fmt(stats[key]) for key in ("p50", "p90", "p99", "max")))
+    return "\n".join(lines)
+
+
+class _EchoHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        sock.sendto(data, self.client_address)
+
+
+class _SinkHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        total = 0
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                break
+            total += len(data)
+        self.request.sendall(str(total).encode())
+
+
+def serve_echo(host="127.0.0.1", port=0):
+    """
+    UDP エコーと TCP シンク (受信したバイト数を返す) を同じポート番号で起動する
+    Returns:
+        tuple: (port, stop 関数)
+    """
+    udp = socketserver.ThreadingUDPServer((host, port), _EchoHandler)
+    port = udp.server_address[1]
+    tcp = socketserver.ThreadingTCPServer((host, port), _SinkHandler)
+    for server in (udp, tcp):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        for server in (udp, tcp):
+            server.shutdown()
+            server.server_close()
+
+    return port, stop
+
+
+def build_probes(modem, host, port, dns_host, count=4, size=16):
+    probes = {
+        "icmp_snping": lambda: snping(modem, host, count, size),
+        "udp_ppp": lambda: udp_echo_ppp(host, port, count, size),
+        "udp_modem": lambda: udp_echo_modem(modem, host, port, count, size),
+        "tcp_ppp": lambda: tcp_throughput_ppp(host, port),
+        "tcp_modem": lambda: tcp_throughput_modem(modem, host, port),
+        "dns_ppp": lambda: dns_ppp(dns_host),
+        "dns_modem": lambda: dns_modem(modem, dns_host),
+    }
+    return probes
+
+
+def local_check(rounds=3, latency=0.0, host="127.0.0.1"):
+    """
+    ローカルのエコーサーバと疑似モデムで rounds 回の計測を続けて行い、どの計測も失敗しないか確かめる
+    (前の回の送信が後の回の受信に混ざらないことの確認)
+    Returns:
+        bool: 失敗したサンプルがなければTrue
+    """
+    from .emulator import FakeModem
+    from .modem import Modem
+
+    port, stop_echo = serve_echo(host)
+    fake = FakeModem(latency=latency, udp_echo=True)
+    try:
+        with Modem(fake.start(), gpio="mock") as modem:
+            campaign = Campaign(build_probes(modem, host, port, "localhost"), interval=0, rounds=rounds).run()
+    finally:
+        fake.stop()
+        stop_echo()
+    summary = campaign.summary()
+    print(format_summary(summary))
+    lost = {name: stats["lost"] for name, stats in summary.items() if stats["lost"]}
+    print(f"{rounds} rounds: " + (f"LOST {lost}" if lost else "no samples lost"))
+    return not lost
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .modem import Modem
+
+    parser = argparse.ArgumentParser(description="Cellular latency and throughput probe campaign")
+    parser.add_argument("--port", default="/dev/ttyUSB2", help="Modem AT port (default: /dev/ttyUSB2)")
+    parser.add_argument("--baudrate", type=int, default=115200, help="Serial baud rate (default: 115200)")
+    parser.add_argument("--host", default="127.0.0.1", help="Echo server address (UDP echo + TCP sink)")
+    parser.add_argument("--echo-port", type=int, default=7, help="Echo server port (default: 7)")
+    parser.add_argument("--dns-host", default="localhost", help="Name to resolve in DNS probes")
+    parser.add_argument("--rounds", type=int, default=5, help="Campaign rounds (default: 5)")
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between rounds (default: 60)")
+    parser.add_argument("--output", default="probe_results.csv", help="Output file (.csv or .parquet)")
+    parser.add_argument("--local", action="store_true",
+                        help="Use a local echo server and a pty modem stand-in instead of real hardware")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in modem latency in seconds (--local)")
+    parser.add_argument("--check", action="store_true",
+                        help="With --local, run --rounds rounds back to back and fail if any sample is lost")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if args.local and args.check:
+        raise SystemExit(0 if local_check(args.rounds, args.latency, args.host) else 1)
+    stop_echo = fake = None
+    if args.local:
+        from .emulator import FakeModem
+
+        args.echo_port, stop_echo = serve_echo(args.host)
+        fake = FakeModem(latency=args.latency, udp_echo=True)
+        args.port = fake.start()
+    try:
+        with Modem(args.port, args.baudrate, gpio="mock") as modem:
+            campaign = Campaign(build_probes(modem, args.host, args.echo_port, args.dns_host),
+                                interval=args.interval, rounds=args.rounds).run()
+        campaign.write(args.output)
+        print(format_summary(campaign.summary()))
+        print(f"{len(campaign.rows)} samples written to {args.output}")
+    finally:
+        if fake is not None:
+            fake.stop()
+        if stop_echo is not None:
+            stop_echo()
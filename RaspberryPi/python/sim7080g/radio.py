@@ -0,0 +1,146 @@
+"""
+GNSS と LTE の無線時間を切り替えるスケジューラ
+
+SIM7080G は GNSS と LTE の通信を同時に行えないため、GNSS ウィンドウで測位してから
+GNSS を止め、LTE ウィンドウでキューに溜めたデータを送信する。
+各ウィンドウの長さは観測した TTFF と送信時間に合わせて調整する。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger("sim7080g")
+
+# GNSS ウィンドウの長さの範囲（秒）と、観測した測位時間に対する余裕
+MIN_GNSS_WINDOW = 5
+MAX_GNSS_WINDOW = 180
+GNSS_WINDOW_MARGIN = 1.5
+# LTE ウィンドウの長さの範囲（秒）
+MIN_LTE_WINDOW = 2
+MAX_LTE_WINDOW = 60
+# 指数移動平均の重み
+EWMA_ALPHA = 0.3
+# 送信待ちキューの上限 (超えた分は古いものから捨てる)
+QUEUE_SIZE = 100
+# 遅延統計として保持する件数
+DELAY_SAMPLES = 500
+
+
+class RadioScheduler:
+    """
+    GNSS ウィンドウと LTE ウィンドウを交互に開く
+    Args:
+        gnss (AssistedGnss): start() / stop() を持つ GNSS 制御
+        read_fix (callable): 測位結果 (dict または None) を返すブロッキング関数
+        send (callable): ペイロードを1件送信するコルーチン関数
+        run (callable): ブロッキング関数を実行するコルーチン関数 (省略時は asyncio.to_thread。
+            ATScheduler と共有する場合は優先度付きで実行する関数を渡す)
+    """
+
+    def __init__(self, gnss, read_fix, send, poll_interval=1, run=None):
+        self.gnss = gnss
+        self.read_fix = read_fix
+        self.send = send
+        self.run = run or asyncio.to_thread
+        self.poll_interval = poll_interval
+        self.queue = deque(maxlen=QUEUE_SIZE)
+        self.fix_time = None
+        self.send_time = None
+        self.attempts = 0
+        self.fixes = 0
+        self.sent = 0
+        self.dropped = 0
+        self.delays = deque(maxlen=DELAY_SAMPLES)
+
+    @staticmethod
+    def _ewma(current, sample):
+        return sample if current is None else current + EWMA_ALPHA * (sample - current)
+
+    def gnss_window_length(self):
+        if self.fix_time is None:
+            return MAX_GNSS_WINDOW
+        return min(max(self.fix_time * GNSS_WINDOW_MARGIN, MIN_GNSS_WINDOW), MAX_GNSS_WINDOW)
+
+    def lte_window_length(self):
+        per_message = self.send_time if self.send_time is not None else 1
+        return min(max(per_message * len(self.queue) * GNSS_WINDOW_MARGIN, MIN_LTE_WINDOW), MAX_LTE_WINDOW)
+
+    async def gnss_window(self):
+        """
+        GNSS を起動して測位できるかウィンドウが閉じるまでポーリングし、GNSS を止める
+        Returns:
+            dict: 測位結果。測位できなければ None
+        """
+        window = self.gnss_window_length()
+        self.attempts += 1
+        opened = time.monotonic()
+        await self.run(self.gnss.start)
+        fix = None
+        try:
+            while time.monotonic() - opened < window:
+                result = await self.run(self.read_fix)
+                if result and result["fix"] and result["lat"] is not None and result["lon"] is not None:
+                    fix = result
+                    break
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            await self.run(self.gnss.stop)
+
+        elapsed = time.monotonic() - opened
+        if fix is not None:
+            self.fixes += 1
+            self.fix_time = self._ewma(self.fix_time, elapsed)
+        else:
+            # 測位できなかった場合は次回のウィンドウを広げる
+            self.fix_time = self._ewma(self.fix_time, window / GNSS_WINDOW_MARGIN * 2)
+            logger.warning(f"No GNSS fix within {window:.0f}s window.")
+        return fix
+
+    def enqueue(self, payload, created_at=None):
+        """
+        LTE ウィンドウで送信するペイロードをキューに積む
+        """
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((payload, created_at if created_at is not None else time.monotonic()))
+
+    async def lte_window(self):
+        """
+        キューのペイロードをウィンドウが閉じるまで送信する
+        Returns:
+            int: 送信した件数
+        """
+        window = self.lte_window_length()
+        opened = time.monotonic()
+        sent = 0
+        while self.queue and time.monotonic() - opened < window:
+            payload, created_at = self.queue[0]
+            started = time.monotonic()
+            await self.send(payload)
+            finished = time.monotonic()
+            self.queue.popleft()
+            self.send_time = self._ewma(self.send_time, finished - started)
+            self.delays.append(finished - created_at)
+            sent += 1
+        self.sent += sent
+        return sent
+
+    def metrics(self):
+        """
+        Returns:
+            dict: 測位成功率、送信件数、エンドツーエンド遅延、現在のウィンドウ長
+        """
+        delays = sorted(self.delays)
+        return {
+            "fix_success_rate": self.fixes / self.attempts if self.attempts else None,
+            "fix_attempts": self.attempts,
+            "sent": self.sent,
+            "queued": len(self.queue),
+            "dropped": self.dropped,
+            "delay_p50": delays[len(delays) // 2] if delays else None,
+            "delay_max": delays[-1] if delays else None,
+            "gnss_window": self.gnss_window_length(),
+            "lte_window": self.lte_window_length(),
+        }
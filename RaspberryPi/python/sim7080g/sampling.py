@@ -0,0 +1,218 @@
+"""
+移動状態に応じた測位間隔の調整と、送信前の軌跡の間引き
+
+AdaptiveSampler は +CGNSINF の速度・進行方向から次の測位までの間隔を決める。
+停止中は間隔を伸ばし、移動中や進行方向が変わったときは短くする。
+TrackFilter は許容誤差内に収まる点を捨てるストリーミング型の線分近似
+(Douglas-Peucker のオープニングウィンドウ版 + 不感帯) で、送信する点だけを返す。
+"""
+
+import math
+import time
+
+EARTH_RADIUS = 6371000.0
+# これ以下の速度 (km/h) は停止とみなす (GNSS のノイズ対策)
+STATIONARY_SPEED = 2.0
+# 進行方向がこれ以上変わったら最短間隔で測位する（度）
+COURSE_CHANGE = 30.0
+# 移動中に1回の測位間隔で進む距離の目安（メートル）
+MOVING_DISTANCE = 100.0
+# 間引き時に保持する候補点の上限
+MAX_WINDOW = 64
+
+
+def local_xy(origin, point):
+    """
+    origin を原点とした平面座標 (メートル) に変換する (短距離向けの正距円筒近似)
+    """
+    lat0 = math.radians(origin[0])
+    x = math.radians(point[1] - origin[1]) * math.cos(lat0) * EARTH_RADIUS
+    y = math.radians(point[0] - origin[0]) * EARTH_RADIUS
+    return x, y
+
+
+def distance(a, b):
+    x, y = local_xy(a, b)
+    return math.hypot(x, y)
+
+
+def segment_distance(start, end, point):
+    """
+    point から線分 start-end までの距離（メートル）
+    """
+    ex, ey = local_xy(start, end)
+    px, py = local_xy(start, point)
+    length = ex * ex + ey * ey
+    if length == 0:
+        return math.hypot(px, py)
+    t = max(0.0, min(1.0, (px * ex + py * ey) / length))
+    return math.hypot(px - t * ex, py - t * ey)
+
+
+class AdaptiveSampler:
+    """
+    速度と進行方向の変化から次の測位間隔（秒）を決める
+    """
+
+    def __init__(self, min_interval=10, max_interval=3600):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = None
+        self.last_course = None
+
+    def next_interval(self, fix, base_interval):
+        """
+        Args:
+            fix (dict): parse_cgnsinf の結果 (None の場合は base_interval を返す)
+            base_interval (float): 設定上の送信間隔 (移動中の上限として使う)
+        """
+        if not fix or not fix.get("fix"):
+            self.interval = base_interval
+            return base_interval
+        speed = fix.get("speed") or 0.0
+        course = fix.get("course")
+
+        if speed < STATIONARY_SPEED:
+            # 停止中は前回の間隔から倍々で伸ばす
+            previous = self.interval or base_interval
+            self.interval = min(max(previous * 2, base_interval), self.max_interval)
+            self.last_course = None
+            return self.interval
+
+        turned = False
+        if course is not None and self.last_course is not None:
+            delta = abs(course - self.last_course) % 360
+            turned = min(delta, 360 - delta) >= COURSE_CHANGE
+        self.last_course = course
+
+        if turned:
+            self.interval = self.min_interval
+        else:
+            # MOVING_DISTANCE 進むのにかかる時間を目安にする
+            self.interval = min(max(MOVING_DISTANCE / (speed / 3.6), self.min_interval), base_interval)
+        return self.interval
+
+
+class TrackFilter:
+    """
+    許容誤差 tolerance (メートル) 以内で軌跡を再現できる点だけを残すストリーミングフィルタ。
+    停止中でも max_age 秒ごとに1点は送る
+    """
+
+    def __init__(self, tolerance=10.0, max_age=3600):
+        self.tolerance = tolerance
+        self.max_age = max_age
+        self.anchor = None
+        self.anchor_time = None
+        self.window = []
+
+    def add(self, lat, lon, timestamp=None):
+        """
+        Returns:
+            list: 送信すべき (lat, lon, timestamp) のリスト (空の場合は送信不要)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        point = (lat, lon, timestamp)
+        if self.anchor is None:
+            self.anchor = point
+            self.anchor_time = timestamp
+            return [point]
+
+        if timestamp - self.anchor_time >= self.max_age:
+            # 候補点を捨てる前に anchor-point の線分から許容誤差を超える点を確かめ、最も離れた点から送る
+            result = []
+            while self.window:
+                worst = max(self.window, key=lambda candidate: segment_distance(self.anchor, point, candidate))
+                if segment_distance(self.anchor, point, worst) <= self.tolerance:
+                    break
+                result += self._emit(worst, [worst])
+            return result + self._emit(point, [point])
+
+        # 不感帯: 最後に送った点から動いていなければ捨てる
+        if not self.window and distance(self.anchor, point) <= self.tolerance:
+            return []
+
+        # 候補点がすべて anchor-point の線分から許容誤差内なら、中間点は不要
+        if len(self.window) < MAX_WINDOW and all(
+                segment_distance(self.anchor, point, candidate) <= self.tolerance for candidate in self.window):
+            self.window.append(point)
+            return []
+
+        # 直前の候補点までを1本の線分として確定し、その点を送る
+        last = self.window[-1] if self.window else point
+        emitted = self._emit(last, [last])
+        if last is not point:
+            self.window.append(point)
+        return emitted
+
+    def _emit(self, point, result):
+        self.anchor = point
+        self.anchor_time = point[2]
+        self.window = [candidate for candidate in self.window if candidate[2] > point[2]]
+        return result
+
+    def flush(self):
+        """
+        保留中の最後の点を返す (終了時に呼ぶ)
+        """
+        if not self.window:
+            return []
+        last = self.window[-1]
+        return self._emit(last, [last])
+
+
+def simulate(hours=24, parked_ratio=0.8, tolerance=10.0, base_interval=300, seed=1):
+    """
+    駐車と走行を含む疑似軌跡で、固定間隔送信と比較した送信件数と最大誤差を表示する
+    """
+    import random
+
+    rng = random.Random(seed)
+    sampler = AdaptiveSampler()
+    track = TrackFilter(tolerance=tolerance)
+    lat, lon, course = 35.681, 139.767, 90.0
+    now = 0.0
+    end = hours * 3600
+    fixes = []
+    sent = []
+    fixed_interval_messages = end // base_interval
+    while now < end:
+        moving = (now / end) >= parked_ratio
+        speed = rng.uniform(30, 50) if moving else 0.0
+        if moving and rng.random() < 0.1:
+            course = (course + rng.choice((-90, 90))) % 360
+        fix = {"fix": True, "speed": speed, "course": course}
+        interval = sampler.next_interval(fix, base_interval)
+        noise = 3 / EARTH_RADIUS * 180 / math.pi
+        reported = (lat + rng.gauss(0, noise), lon + rng.gauss(0, noise))
+        fixes.append((reported[0], reported[1], now))
+        sent.extend(track.add(reported[0], reported[1], now))
+        # 次の測位までの移動
+        step = speed / 3.6 * interval
+        lat += step * math.cos(math.radians(course)) / EARTH_RADIUS * 180 / math.pi
+        lon += step * math.sin(math.radians(course)) / (EARTH_RADIUS * math.cos(math.radians(lat))) * 180 / math.pi
+        now += interval
+    sent.extend(track.flush())
+
+    # 送信した点を結んだ折れ線と、測位した全点との最大誤差
+    error = 0.0
+    for point in fixes:
+        for start, end_point in zip(sent, sent[1:]):
+            if start[2] <= point[2] <= end_point[2]:
+                error = max(error, segment_distance(start, end_point, point))
+                break
+    print(f"fixed interval: {fixed_interval_messages} messages")
+    print(f"adaptive: {len(fixes)} fixes, {len(sent)} messages, max error {error:.1f} m (tolerance {tolerance} m)")
+    return len(sent), error
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate adaptive sampling and track simplification")
+    parser.add_argument("--hours", type=float, default=24, help="Simulated duration in hours (default: 24)")
+    parser.add_argument("--parked", type=float, default=0.8, help="Fraction of the time parked (default: 0.8)")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Track error bound in metres (default: 10)")
+    args = parser.parse_args()
+
+    simulate(args.hours, args.parked, args.tolerance)
@@ -0,0 +1,221 @@
+"""
+優先度付きの AT コマンドスケジューラ
+
+複数のタスク (送信・ヘルスチェック・GNSS・コマンドサーバ) が1台のモデムを共有するとき、
+コマンドをキューに積み、専用スレッドが優先度の高い順に1件ずつ実行する。
+期限 (deadline) を過ぎたコマンドは実行せずに TimeoutError とし、キャンセルされたコマンドは捨てる。
+同じ問い合わせ (AT+CSQ など) は実行待ちの1件、または COALESCE_WINDOW 秒以内の結果にまとめる。
+まとめた呼び出しはそれぞれ自分の期限を持ち、期限を過ぎた呼び出しだけが TimeoutError になる。
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from .trace import LatencyHistogram
+
+logger = logging.getLogger("sim7080g")
+
+# 優先度クラス (値が小さいほど先に実行する)
+PRIORITIES = {"urgent": 0, "send": 1, "gnss": 2, "poll": 3}
+# 同じ問い合わせの結果を使い回す時間（秒）
+COALESCE_WINDOW = 1.0
+# "?" で終わらないが状態を読むだけのコマンド
+QUERY_COMMANDS = ("AT", "AT+CSQ", "AT+CCID", "AT+GSN", "AT+CGSN", "AT+CGNSINF", "ATI")
+
+
+def is_query(command):
+    """
+    状態を変えない問い合わせコマンドか (まとめて実行してよいか)
+    """
+    return command.endswith("?") or command in QUERY_COMMANDS
+
+
+class _Job:
+    __slots__ = ("priority", "command", "kwargs", "fn", "args", "submitted_at", "waiters", "done")
+
+    def __init__(self, priority, command=None, kwargs=None, fn=None, args=()):
+        self.priority = priority
+        self.command = command
+        self.kwargs = kwargs or {}
+        self.fn = fn
+        self.args = args
+        self.submitted_at = time.monotonic()
+        # (Future, 実行開始の期限 (time.monotonic()) または None) のリスト
+        self.waiters = []
+        self.done = False
+
+    def add_waiter(self, future, deadline):
+        self.waiters.append((future, time.monotonic() + deadline if deadline is not None else None))
+
+
+class ATScheduler:
+    """
+    モデム1台の前段に置くコマンドスケジューラ
+    Args:
+        modem (Modem): 対象のモデム (実行中は modem.lock を保持する)
+        coalesce_window (float): 同じ問い合わせの結果を使い回す時間（秒）
+    """
+
+    def __init__(self, modem, coalesce_window=COALESCE_WINDOW):
+        self.modem = modem
+        self.coalesce_window = coalesce_window
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        # 実行待ちの問い合わせ (コマンド -> _Job) と直近の結果 (コマンド -> (時刻, 応答))
+        self.pending = {}
+        self.recent = {}
+        self.stats = {name: {"submitted": 0, "executed": 0, "coalesced": 0, "expired": 0, "cancelled": 0,
+                             "wait": LatencyHistogram()} for name in PRIORITIES}
+        self.closed = False
+        self._thread = threading.Thread(target=self._run, name="at-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, command, priority="poll", timeout=1, expect=None, retries=1, deadline=None):
+        """
+        AT コマンドをキューに積む
+        Args:
+            priority (str): PRIORITIES のいずれか
+            deadline (float): この秒数以内に実行を開始できなければ TimeoutError にする
+        Returns:
+            concurrent.futures.Future: 応答文字列 (Modem.command と同じ)。cancel() で取り消せる
+        """
+        future = Future()
+        stats = self.stats[priority]
+        with self.condition:
+            stats["submitted"] += 1
+            if is_query(command):
+                recent = self.recent.get(command)
+                if recent is not None and time.monotonic() - recent[0] < self.coalesce_window:
+                    stats["coalesced"] += 1
+                    future.set_result(recent[1])
+                    return future
+                job = self.pending.get(command)
+                if job is not None:
+                    stats["coalesced"] += 1
+                    # 期限は呼び出しごとに持つ (先に積まれた呼び出しの期限は引き継がない)
+                    job.add_waiter(future, deadline)
+                    if PRIORITIES[priority] < job.priority:
+                        # より急ぐ呼び出しが来たら、同じジョブを高い優先度でも積み直す
+                        job.priority = PRIORITIES[priority]
+                        self._push(job)
+                    return future
+            job = _Job(PRIORITIES[priority], command=command,
+                       kwargs={"timeout": timeout, "expect": expect, "retries": retries})
+            job.add_waiter(future, deadline)
+            if is_query(command):
+                self.pending[command] = job
+            self._push(job)
+        return future
+
+    def call(self, fn, *args, priority="poll", deadline=None):
+        """
+        fn(*args) をモデムを占有した状態で実行する (プロンプトを挟むコマンドなど複数手順の操作用)
+        Returns:
+            concurrent.futures.Future: fn の戻り値
+        """
+        future = Future()
+        with self.condition:
+            self.stats[priority]["submitted"] += 1
+            job = _Job(PRIORITIES[priority], fn=fn, args=args)
+            job.add_waiter(future, deadline)
+            self._push(job)
+        return future
+
+    async def command(self, command, priority="poll", timeout=1, expect=None, retries=1, deadline=None):
+        """
+        submit() の asyncio 版。await しているタスクがキャンセルされるとコマンドも取り消される
+        """
+        return await asyncio.wrap_future(self.submit(command, priority, timeout, expect, retries, deadline))
+
+    async def run(self, fn, *args, priority="poll", deadline=None):
+        """
+        call() の asyncio 版 (asyncio.to_thread の代わりに使う)
+        """
+        return await asyncio.wrap_future(self.call(fn, *args, priority=priority, deadline=deadline))
+
+    def _push(self, job):
+        heapq.heappush(self.heap, (job.priority, next(self.counter), job))
+        self.condition.notify()
+
+    def _next(self):
+        with self.condition:
+            while True:
+                while not self.heap and not self.closed:
+                    self.condition.wait()
+                if self.closed and not self.heap:
+                    return None
+                _, _, job = heapq.heappop(self.heap)
+                if job.done:
+                    continue
+                job.done = True
+                if job.command is not None and self.pending.get(job.command) is job:
+                    del self.pending[job.command]
+                return job
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            name = next(name for name, value in PRIORITIES.items() if value == job.priority)
+            stats = self.stats[name]
+            waiters = [(future, deadline) for future, deadline in job.waiters if future.set_running_or_notify_cancel()]
+            if not waiters:
+                stats["cancelled"] += len(job.waiters)
+                continue
+            started = time.monotonic()
+            # 期限を過ぎた呼び出しだけを TimeoutError にし、残りの呼び出しのために実行する
+            expired = [future for future, deadline in waiters if deadline is not None and started > deadline]
+            if expired:
+                stats["expired"] += len(expired)
+                label = job.command or getattr(job.fn, "__name__", "call")
+                logger.warning(f"AT scheduler: '{label}' missed its deadline for {len(expired)} caller(s).")
+                for future in expired:
+                    future.set_exception(TimeoutError(f"'{label}' was not started before its deadline"))
+                if len(expired) == len(waiters):
+                    continue
+            waiters = [future for future, deadline in waiters if deadline is None or started <= deadline]
+            stats["wait"].record(started - job.submitted_at)
+            stats["executed"] += 1
+            try:
+                with self.modem.lock:
+                    if job.command is not None:
+                        result = self.modem.command(job.command, **job.kwargs)
+                    else:
+                        result = job.fn(*job.args)
+            except Exception as e:
+                for future in waiters:
+                    future.set_exception(e)
+                continue
+            if job.command is not None and result and is_query(job.command):
+                with self.condition:
+                    self.recent[job.command] = (time.monotonic(), result)
+            for future in waiters:
+                future.set_result(result)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: 優先度クラス -> 件数 (submitted / executed / coalesced / expired / cancelled) と待ち時間の統計
+        """
+        result = {}
+        for name, stats in self.stats.items():
+            entry = {key: value for key, value in stats.items() if key != "wait"}
+            entry["wait"] = stats["wait"].summary()
+            result[name] = entry
+        return result
+
+    def close(self):
+        """
+        キューに残ったコマンドを実行し終えてからスレッドを止める
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self._thread.join()
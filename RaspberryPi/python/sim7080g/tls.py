@@ -0,0 +1,229 @@
+"""
+内蔵スタック (AT+SM* の MQTT / AT+CA* の TCP) の TLS 設定
+
+証明書はモジュールのファイルシステムへ一度だけ書き込み、SHA-256 をディスクに記録して
+内容が変わらない限り再送しない。AT+CSSLCFG で SSL コンテキストを設定し、
+セッション再開 (resumption) を有効にして再接続時のフルハンドシェイクを省く。
+接続ごとにハンドシェイク時間を計測し、フル / 再開に分けて集計する。
+モジュールは再開できたかもバイト数も報告しないため、フル / 再開の区別は有効なセッションを
+保存しているかからの推定、バイト数は見積もりとして集計する (metrics() のキー名も inferred / estimated)。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from .fs import write_file
+from .trace import LatencyHistogram
+
+logger = logging.getLogger("sim7080g")
+
+STATE_FILE = "/var/cache/sim7080g/tls_state.json"
+# AT+CSSLCFG="SSLVERSION" の値 (3: TLS 1.2)
+TLS_VERSION = 3
+# 再開できるセッションの有効期間（秒）。これより古いセッションはフルハンドシェイクとみなす
+SESSION_LIFETIME = 3600
+# ハンドシェイクで送受信するバイト数の見積もり (モジュールはバイト数を報告しないため)
+# フル: ClientHello/ServerHello/鍵交換/Finished の固定分 + サーバ証明書チェーン
+FULL_HANDSHAKE_BYTES = 1500
+RESUMED_HANDSHAKE_BYTES = 350
+# サーバ証明書チェーンのサイズが分からない場合の見積もり
+SERVER_CHAIN_BYTES = 3000
+HANDSHAKE_TIMEOUT = 60
+
+
+class TlsContext:
+    """
+    SSL コンテキスト1つ分の証明書と設定
+    Args:
+        modem (Modem): 対象のモデム
+        ca_cert (str): CA 証明書 (PEM) のローカルパス
+        client_cert (str): クライアント証明書のローカルパス (相互認証しない場合は None)
+        client_key (str): クライアント秘密鍵のローカルパス
+        sni (str): SNI に使うホスト名
+        index (int): SSL コンテキスト番号
+        state_path (str): 書き込み済み証明書のハッシュとセッション情報の保存先
+        resumption (bool): セッション再開を有効にする
+    """
+
+    def __init__(self, modem, ca_cert=None, client_cert=None, client_key=None, sni=None, index=0,
+                 state_path=STATE_FILE, resumption=True, server_chain_bytes=SERVER_CHAIN_BYTES):
+        self.modem = modem
+        self.ca_cert = ca_cert
+        self.client_cert = client_cert
+        self.client_key = client_key
+        self.sni = sni
+        self.index = index
+        self.state_path = state_path
+        self.resumption = resumption
+        self.server_chain_bytes = server_chain_bytes
+        self.state = self._load_state()
+        # resumption が有効なことをモジュールが受け付けたか
+        self.resumption_enabled = False
+        # 推定したハンドシェイクの種類 ("full" / "resumed") ごとの所要時間と回数
+        self.handshakes = {"full": LatencyHistogram(), "resumed": LatencyHistogram()}
+        self.counts = {"full": 0, "resumed": 0}
+        self.stats = {"failed": 0, "estimated_bytes": 0, "uploaded": 0, "upload_skipped": 0}
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+    @staticmethod
+    def module_name(path):
+        return os.path.basename(path) if path else None
+
+    def upload_certificates(self, force=False):
+        """
+        証明書と鍵をモジュールへ書き込み、AT+CSSLCFG="CONVERT" で取り込む。
+        前回書き込んだ内容と同じファイルは書き込まない
+        Returns:
+            bool: すべての証明書がモジュール上で使える状態ならTrue
+        """
+        certificates = self.state.setdefault("certificates", {})
+        # 書き込んだファイルのハッシュ。CONVERT が成功するまでは記録しない (失敗したら次回も書き込み直す)
+        uploaded = {}
+        for path in (self.ca_cert, self.client_cert, self.client_key):
+            if path is None:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            name = self.module_name(path)
+            digest = hashlib.sha256(data).hexdigest()
+            if not force and certificates.get(name) == digest:
+                self.stats["upload_skipped"] += 1
+                continue
+            if not write_file(self.modem, name, data):
+                return False
+            uploaded[name] = digest
+            self.stats["uploaded"] += 1
+            logger.info(f"Uploaded {name} to the module ({len(data)} bytes).")
+
+        ca = self.module_name(self.ca_cert)
+        cert = self.module_name(self.client_cert)
+        key = self.module_name(self.client_key)
+        changed = set(uploaded)
+        if ca in changed:
+            if "OK" not in self.modem.command(f'AT+CSSLCFG="CONVERT",2,"{ca}"', timeout=5):
+                logger.error(f"Failed to convert CA certificate {ca}.")
+                return False
+        if cert and (changed & {cert, key}):
+            if "OK" not in self.modem.command(f'AT+CSSLCFG="CONVERT",1,"{cert}","{key}"', timeout=5):
+                logger.error(f"Failed to convert client certificate {cert}.")
+                return False
+        if changed:
+            certificates.update(uploaded)
+            # 証明書が変わったら以前のセッションは使えない
+            self.state.pop("sessions", None)
+            self._save_state()
+        return True
+
+    def configure(self):
+        """
+        証明書を用意し、SSL コンテキスト (バージョン・SNI・セッション再開) を設定する
+        Returns:
+            bool: 設定できたらTrue
+        """
+        if not self.upload_certificates():
+            return False
+        commands = [f'AT+CSSLCFG="SSLVERSION",{self.index},{TLS_VERSION}']
+        if self.sni:
+            commands.append(f'AT+CSSLCFG="SNI",{self.index},"{self.sni}"')
+        for command in commands:
+            if "OK" not in self.modem.command(command):
+                logger.error(f"{command} failed.")
+                return False
+        if self.resumption:
+            # ファームウェアによっては対応していない。その場合は毎回フルハンドシェイクになる
+            response = self.modem.command(f'AT+CSSLCFG="SESSIONRESUMPTION",{self.index},1')
+            self.resumption_enabled = "OK" in response
+            if not self.resumption_enabled:
+                logger.warning("TLS session resumption is not supported by this firmware.")
+        return True
+
+    def _expect_resumed(self, host):
+        established = self.state.get("sessions", {}).get(host)
+        return self.resumption_enabled and established is not None and time.time() - established < SESSION_LIFETIME
+
+    def _handshake(self, host, command, success, timeout):
+        """
+        接続コマンドを送信してハンドシェイク時間を記録する (セッションは接続先ホストごとに管理する)
+        """
+        sessions = self.state.setdefault("sessions", {})
+        resumed = self._expect_resumed(host)
+        started = time.monotonic()
+        response = self.modem.command(command, timeout=timeout, expect=success)
+        elapsed = time.monotonic() - started
+        if success not in response:
+            self.stats["failed"] += 1
+            # 再開に失敗したセッションは次回使わない
+            sessions.pop(host, None)
+            logger.error(f"TLS connection failed: {command} -> '{response}'")
+            return False
+        kind = "resumed" if resumed else "full"
+        self.handshakes[kind].record(elapsed)
+        self.counts[kind] += 1
+        self.stats["estimated_bytes"] += (RESUMED_HANDSHAKE_BYTES if resumed
+                                          else FULL_HANDSHAKE_BYTES + self.server_chain_bytes)
+        sessions[host] = time.time()
+        self._save_state()
+        logger.info(f"TLS handshake completed in {elapsed:.2f}s (presumably {kind}).")
+        return True
+
+    def mqtt_connect(self, host, port=8883, keeptime=60, timeout=HANDSHAKE_TIMEOUT):
+        """
+        AT+SMSSL で TLS を有効にして MQTT ブローカーへ接続する
+        Returns:
+            bool: 接続できたらTrue
+        """
+        ca = self.module_name(self.ca_cert) or ""
+        cert = self.module_name(self.client_cert) or ""
+        for command in (f'AT+SMCONF="URL","{host}",{port}', f'AT+SMCONF="KEEPTIME",{keeptime}',
+                        f'AT+SMSSL={self.index},"{ca}","{cert}"'):
+            if "OK" not in self.modem.command(command):
+                logger.error(f"{command} failed.")
+                return False
+        return self._handshake(host, "AT+SMCONN", "OK", timeout)
+
+    def open_tcp(self, host, port, cid=0, timeout=HANDSHAKE_TIMEOUT):
+        """
+        AT+CASSLCFG で接続 cid に TLS を設定して TCP 接続を開く
+        Returns:
+            bool: 接続できたらTrue
+        """
+        commands = [f'AT+CASSLCFG={cid},"SSL",1', f'AT+CASSLCFG={cid},"CRINDEX",{self.index}']
+        if self.ca_cert:
+            commands.append(f'AT+CASSLCFG={cid},"CACERT","{self.module_name(self.ca_cert)}"')
+        if self.client_cert:
+            commands.append(f'AT+CASSLCFG={cid},"CERT","{self.module_name(self.client_cert)}"')
+        for command in commands:
+            if "OK" not in self.modem.command(command):
+                logger.error(f"{command} failed.")
+                return False
+        return self._handshake(host, f'AT+CAOPEN={cid},0,"TCP","{host}",{port}', f"+CAOPEN: {cid},0", timeout)
+
+    def metrics(self):
+        """
+        Returns:
+            dict: フル / 再開 (推定) ごとのハンドシェイク時間の分布と回数、見積もりバイト数、証明書の書き込み回数
+        """
+        return dict(self.stats,
+                    resumption_enabled=self.resumption_enabled,
+                    inferred_full=self.counts["full"],
+                    inferred_resumed=self.counts["resumed"],
+                    inferred_full_handshake=self.handshakes["full"].summary(),
+                    inferred_resumed_handshake=self.handshakes["resumed"].summary())
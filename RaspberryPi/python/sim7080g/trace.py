@@ -0,0 +1,185 @@
+"""
+AT コマンドのトレースとレイテンシ計測
+
+ATEngine.hooks に Tracer.record を登録すると、コマンドごとに送信時刻・最初の受信バイトの時刻・
+最終リザルトコードの時刻・送受信バイト数・試行回数・結果が記録される。
+記録は上限付きのリングバッファに保持し、コマンドごとの HDR 形式ヒストグラムと
+再生可能なトレースファイル (JSON Lines) として出力できる。
+"""
+
+import json
+import time
+from collections import deque
+
+# リングバッファに保持するトレース件数
+TRACE_BUFFER_SIZE = 2048
+# ヒストグラムの有効桁 (2^SUB_BUCKET_BITS で約2桁)
+SUB_BUCKET_BITS = 7
+
+
+class ATTrace:
+    """
+    AT コマンド1回分の記録 (時刻は time.monotonic() の値)
+    """
+
+    __slots__ = ("command", "sent_at", "first_byte_at", "final_at", "bytes_out", "bytes_in",
+                 "attempts", "outcome", "response")
+
+    def __init__(self, command, sent_at, first_byte_at, final_at, bytes_out, bytes_in, attempts, outcome,
+                 response=""):
+        self.command = command
+        self.sent_at = sent_at
+        self.first_byte_at = first_byte_at
+        self.final_at = final_at
+        self.bytes_out = bytes_out
+        self.bytes_in = bytes_in
+        self.attempts = attempts
+        self.outcome = outcome
+        self.response = response
+
+    @property
+    def latency(self):
+        return self.final_at - self.sent_at
+
+    @property
+    def name(self):
+        """
+        ヒストグラムの集計キー (パラメータを除いたコマンド名。例: "AT+CAOPEN=0,0,..." -> "AT+CAOPEN=")
+        """
+        head, sep, _ = self.command.partition("=")
+        return head + sep
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class LatencyHistogram:
+    """
+    HdrHistogram と同じ対数-線形バケットのヒストグラム (単位: マイクロ秒、有効桁約2桁)
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        shift = max(value.bit_length() - SUB_BUCKET_BITS, 0)
+        return (value >> shift) << shift
+
+    def record(self, seconds):
+        value = int(seconds * 1_000_000)
+        key = self.bucket(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Returns:
+            float: 指定パーセンタイルのレイテンシ（秒）
+        """
+        if not self.total:
+            return 0.0
+        threshold = self.total * percent / 100
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= threshold:
+                return key / 1_000_000
+        return self.max / 1_000_000
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max / 1_000_000,
+        }
+
+
+class Tracer:
+    """
+    ATEngine のフックとしてトレースを収集する
+    """
+
+    def __init__(self, size=TRACE_BUFFER_SIZE):
+        self.traces = deque(maxlen=size)
+        self.histograms = {}
+
+    def attach(self, engine):
+        engine.hooks.append(self.record)
+        return self
+
+    def detach(self, engine):
+        engine.hooks.remove(self.record)
+
+    def record(self, trace):
+        self.traces.append(trace)
+        histogram = self.histograms.get(trace.name)
+        if histogram is None:
+            histogram = self.histograms[trace.name] = LatencyHistogram()
+        histogram.record(trace.latency)
+
+    def summary(self):
+        """
+        Returns:
+            dict: コマンド名 -> {count, p50, p90, p99, max}
+        """
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def export(self, path):
+        """
+        リングバッファの内容を JSON Lines で書き出す
+        """
+        with open(path, "w") as f:
+            for trace in self.traces:
+                f.write(json.dumps(trace.to_dict()) + "\n")
+
+
+def load_trace(path):
+    with open(path) as f:
+        return [ATTrace(**json.loads(line)) for line in f if line.strip()]
+
+
+def replay(path, modem, speed=1.0):
+    """
+    トレースファイルのコマンドを元の間隔 (speed 倍速) で modem に再送し、新しいトレースを返す
+    """
+    tracer = Tracer().attach(modem.at)
+    previous = None
+    try:
+        for trace in load_trace(path):
+            if previous is not None:
+                gap = (trace.sent_at - previous.final_at) / speed
+                if gap > 0:
+                    time.sleep(gap)
+            modem.command(trace.command, timeout=max(trace.latency * 2, 1))
+            previous = trace
+    finally:
+        tracer.detach(modem.at)
+    return tracer
+
+
+def format_summary(summary):
+    lines = [f"{'command':24s} {'count':>6s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}"]
+    for name, stats in summary.items():
+        lines.append(f"{name:24s} {stats['count']:6d} " + " ".join(
+            f"{stats[key] * 1000:8.1f}ms" for key in ("p50", "p90", "p99", "max")))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize an AT trace file")
+    parser.add_argument("trace", help="Trace file written by Tracer.export()")
+    args = parser.parse_args()
+
+    tracer = Tracer(size=None)
+    for trace in load_trace(args.trace):
+        tracer.record(trace)
+    print(format_summary(tracer.summary()))
@@ -0,0 +1,253 @@
+"""
+モジュール内蔵の TCP/IP スタックを使った UDP 送受信 (AT+CNACT / AT+CAOPEN / AT+CASEND)
+
+PPP を張らずに UART を AT コマンドモードのまま使える。
+sendto() / recvfrom() / close() を持つため、gps_device_sender.py の
+send_udp_message() に socket.socket の代わりとしてそのまま渡せる。
+"""
+
+import logging
+import re
+import time
+
+logger = logging.getLogger("sim7080g")
+
+# PDP コンテキストの有効化待ち時間（秒）
+ACTIVATE_TIMEOUT = 30
+OPEN_TIMEOUT = 10
+SEND_TIMEOUT = 10
+# AT+CARECV の応答の本文の前まで ("+CARECV: <長さ>,")
+CARECV_PATTERN = re.compile(rb"\+CARECV: (\d+),")
+
+
+class ModemUDPSocket:
+    """
+    SIM7080G の内蔵スタック上の UDP ソケット1本
+    """
+
+    def __init__(self, modem, cid=0, pdp_index=0):
+        self.modem = modem
+        self.cid = cid
+        self.pdp_index = pdp_index
+        self.remote = None
+        self.pending = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.uart_bytes = 0
+
+    def _track(self, received, sent=0):
+        # 応答に紛れて届いた受信通知 (+CADATAIND) を数えておく
+        self.uart_bytes += sent + len(received)
+        self.pending += received.count(f"+CADATAIND: {self.cid}")
+        return received
+
+    def _command(self, command, timeout=1, expect=None):
+        return self._track(self.modem.command(command, timeout=timeout, expect=expect), len(command) + 2)
+
+    def activate(self):
+        """
+        PDP コンテキストが無効なら AT+CNACT で有効化する
+        Returns:
+            bool: 有効化されていればTrue
+        """
+        if f"+CNACT: {self.pdp_index},1" in self._command("AT+CNACT?"):
+            return True
+        # OK の後に "+APP PDP: 0,ACTIVE" の URC が届く
+        response = self._command(f"AT+CNACT={self.pdp_index},1", timeout=ACTIVATE_TIMEOUT, expect="+APP PDP:")
+        if "+APP PDP:" not in response and "OK" in response:
+            response += self.modem.at.read_until(("+APP PDP:",), ACTIVATE_TIMEOUT)
+        if f"+APP PDP: {self.pdp_index},ACTIVE" in response:
+            logger.info(f"PDP context {self.pdp_index} activated.")
+            return True
+        logger.error(f"Failed to activate PDP context {self.pdp_index}: '{response}'")
+        return False
+
+    def connect(self, addr):
+        """
+        送信先を指定して UDP ソケットを開く (既に別の宛先で開いていれば開き直す)
+        """
+        if self.remote == addr:
+            return
+        if self.remote is not None:
+            self.close()
+        if not self.activate():
+            raise OSError("PDP context is not active")
+        host, port = addr
+        response = self._command(f'AT+CAOPEN={self.cid},{self.pdp_index},"UDP","{host}",{port}',
+                                 timeout=OPEN_TIMEOUT, expect="+CAOPEN:")
+        if f"+CAOPEN: {self.cid},0" not in response:
+            raise OSError(f"AT+CAOPEN failed: '{response}'")
+        self.remote = addr
+
+    def sendto(self, payload, addr):
+        """
+        socket.sendto と同じ形式で1データグラムを送信する
+        Returns:
+            int: 送信したバイト数
+        """
+        with self.modem.lock:
+            self.connect(addr)
+            response = self._command(f"AT+CASEND={self.cid},{len(payload)}", timeout=SEND_TIMEOUT, expect=">")
+            if ">" not in response:
+                raise OSError(f"AT+CASEND was not accepted: '{response}'")
+            self.modem.write(payload)
+            result = self._track(self.modem.at.read_until(("OK\r\n", "ERROR\r\n"), SEND_TIMEOUT), len(payload))
+        if "OK" not in result:
+            raise OSError(f"AT+CASEND failed: '{result.strip()}'")
+        self.bytes_sent += len(payload)
+        return len(payload)
+
+    def recvfrom(self, bufsize, timeout=None):
+        """
+        socket.recvfrom と同じ形式で1データグラムを受信する
+        Returns:
+            tuple: (data, addr)。timeout 内に受信がなければ socket.timeout と同様に TimeoutError
+        """
+        if self.remote is None:
+            raise OSError("Socket is not connected")
+        with self.modem.lock:
+            if not self.pending:
+                self._track(self.modem.at.read_until((f"+CADATAIND: {self.cid}",), timeout or SEND_TIMEOUT))
+                if not self.pending:
+                    raise TimeoutError("No datagram received")
+            # 本文はバイナリのため Modem.command (応答を文字列で返す) を通さずに読む
+            command = f"AT+CARECV={self.cid},{bufsize}"
+            self.modem.write(command + "\r\n")
+            head, data, rest = self.modem.at.read_payload(CARECV_PATTERN, SEND_TIMEOUT)
+            if data is not None and "OK\r\n" not in rest:
+                rest += self.modem.at.read_until(("OK\r\n", "ERROR\r\n"), SEND_TIMEOUT)
+            self._track(head + rest, len(command) + 2)
+        self.pending -= 1
+        if data is None:
+            raise OSError(f"AT+CARECV failed: '{(head + rest).strip()}'")
+        self.uart_bytes += len(data)
+        self.bytes_received += len(data)
+        return data, self.remote
+
+    def close(self):
+        if self.remote is not None:
+            self._command(f"AT+CACLOSE={self.cid}", timeout=OPEN_TIMEOUT)
+            self.remote = None
+
+    def reset(self):
+        """
+        モジュールの再起動 (AT+CFUN=1,1 / PWRKEY) の後に呼ぶ。モジュール側のソケットと PDP コンテキストは
+        失われているため状態を捨て、PDP を有効化し直して同じ宛先で開き直す。
+        失敗した場合は次の sendto() で開き直す
+        """
+        remote, self.remote = self.remote, None
+        self.pending = 0
+        if remote is not None:
+            with self.modem.lock:
+                self.connect(remote)
+            logger.info(f"UDP socket {self.cid} reopened after module reset.")
+
+
+def ppp_frame_size(payload_size, ip_header=20, udp_header=8, escaped_ratio=1 / 128):
+    """
+    PPP (HDLC 風フレーミング) 経由で1データグラムを送る場合の UART 上のバイト数を見積もる。
+    フラグ(1) + アドレス/制御(2) + プロトコル(2) + FCS(2) + フラグ(1) と
+    制御文字のエスケープ (平均 escaped_ratio) を加算する
+    """
+    packet = ip_header + udp_header + payload_size
+    return 8 + int(packet * (1 + escaped_ratio))
+
+
+def benchmark(payload_size=8, messages=50, latency=0.05, baudrate=115200, ppp_connect_rounds=6):
+    """
+    疑似モデム上で内蔵スタック経由の送信を測定し、PPP 経由の場合の見積もりと比較する。
+    PPP 側はホストの sendto が即座に戻るため、UART 転送時間と接続手順の往復回数から見積もる
+    Args:
+        payload_size (int): ペイロード長 (gps_device_sender の 'ff' は 8 バイト)
+        messages (int): 送信件数
+        latency (float): 疑似モデムの1コマンドあたりの遅延（秒）
+        baudrate (int): UART のボーレート
+        ppp_connect_rounds (int): PPP 接続 (chat/LCP/IPCP) に必要な往復回数の見積もり
+    """
+    from .emulator import FakeModem
+    from .modem import Modem
+
+    fake = FakeModem(latency=latency)
+    with Modem(fake.start(), baudrate, gpio="mock") as modem:
+        sock = ModemUDPSocket(modem)
+        addr = ("192.0.2.1", 5683)
+        payload = bytes(payload_size)
+
+        started = time.perf_counter()
+        sock.connect(addr)
+        wake = time.perf_counter() - started
+
+        uart_before = sock.uart_bytes
+        started = time.perf_counter()
+        for _ in range(messages):
+            sock.sendto(payload, addr)
+        per_message = (time.perf_counter() - started) / messages
+        uart_per_message = (sock.uart_bytes - uart_before) / messages
+        sock.close()
+    fake.stop()
+
+    # 無線区間はどちらも IP/UDP ヘッダ + ペイロード。PPP では LCP エコー等が別途 UART を占有する
+    air = 20 + 8 + payload_size
+    ppp_uart = ppp_frame_size(payload_size)
+    results = {
+        "embedded": {"air_bytes": air, "uart_bytes": uart_per_message, "latency": per_message, "wake": wake},
+        "ppp": {"air_bytes": air, "uart_bytes": ppp_uart, "latency": ppp_uart * 10 / baudrate,
+                "wake": latency * ppp_connect_rounds},
+    }
+    for name, result in results.items():
+        print(f"{name:9s} air={result['air_bytes']}B/msg uart={result['uart_bytes']:.0f}B/msg "
+              f"latency={result['latency'] * 1000:.1f}ms wake={result['wake'] * 1000:.0f}ms"
+              + (" (model)" if name == "ppp" else ""))
+    return results
+
+
+def echo_check(latency=0.0):
+    """
+    疑似モデムのエコー (udp_echo) で、送った本文がそのまま受信できるか確かめる。
+    0x80 以上のバイトや、応答の区切りと紛らわしい CR/LF・"OK" を含むバイナリを使う
+    Returns:
+        bool: すべて一致すればTrue
+    """
+    import struct
+
+    from .emulator import FakeModem
+    from .modem import Modem
+
+    payloads = [
+        struct.pack("ff", 35.681, 139.767),
+        bytes(range(256)),
+        bytes(range(200, 216)) + b"\r\n\r\nOK\r\n",
+        b"\xff" * 1460,
+    ]
+    fake = FakeModem(latency=latency, udp_echo=True)
+    ok = True
+    with Modem(fake.start(), gpio="mock") as modem:
+        sock = ModemUDPSocket(modem)
+        addr = ("192.0.2.1", 7)
+        for payload in payloads:
+            sock.sendto(payload, addr)
+            data, _ = sock.recvfrom(1460, timeout=2)
+            matched = data == payload
+            ok = ok and matched
+            result = "ok" if matched else f"MISMATCH {data[:8].hex()}"
+            print(f"{len(payload):5d} bytes {payload[:8].hex()}...: {result}")
+        sock.close()
+    fake.stop()
+    return ok
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Embedded-stack UDP transport benchmark")
+    parser.add_argument("--payload", type=int, default=8, help="Payload size in bytes (default: 8)")
+    parser.add_argument("--messages", type=int, default=50, help="Messages to send (default: 50)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated per-command latency in seconds (default: 0.05)")
+    parser.add_argument("--baudrate", type=int, default=115200, help="UART baud rate (default: 115200)")
+    parser.add_argument("--echo-check", action="store_true",
+                        help="Check that binary payloads survive a round trip through the emulator's UDP echo")
+    args = parser.parse_args()
+
+    if args.echo_check:
+        raise SystemExit(0 if echo_check() else 1)
+    benchmark(args.payload, args.messages, args.latency, args.baudrate)
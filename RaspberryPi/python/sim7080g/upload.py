@@ -0,0 +1,358 @@
+"""
+内蔵 HTTP クライアント (AT+SH*) によるファイルのアップロード
+
+モジュールの HTTP クライアントは1リクエストの本文が AT+SHCONF="BODYLEN" までに限られるため、
+ファイルをその大きさのチャンクに分け、オフセット付きの POST で順に送る。
+ファイルはチャンク単位で読み込み (gzip も逐次圧縮) 、全体をメモリに載せない。
+
+サーバ側のプロトコル:
+    GET  <path>            -> 200 受信済みのバイト数 (10進数)。未受信なら 404
+    POST <path>?offset=N   -> 受信済みサイズが N なら本文を追記して 200 新しいサイズ、
+                              異なれば追記せずに 409 現在のサイズ
+中断したアップロードはサーバが確認した最後のオフセットから再開する。
+gzip の出力は同じ入力に対して常に同じなので、再開時は先頭から圧縮し直して送信済みの分を読み飛ばす。
+"""
+
+import logging
+import os
+import re
+import time
+import zlib
+
+logger = logging.getLogger("sim7080g")
+
+# 1リクエストの本文の最大長 (AT+SHCONF="BODYLEN" の上限)
+CHUNK_SIZE = 4096
+HEADER_LENGTH = 350
+# AT+SHREQ の応答 (+SHREQ: URC) を待つ時間（秒）
+REQUEST_TIMEOUT = 30
+# 通信エラーでセッションを張り直す回数の上限 (成功すると数え直す)
+MAX_FAILURES = 5
+RETRY_DELAY = 2
+GZIP_LEVEL = 6
+# ファイルを読み込む単位
+READ_SIZE = 16384
+METHODS = {"GET": 1, "PUT": 2, "POST": 3, "PATCH": 4, "HEAD": 5}
+SHREQ_PATTERN = re.compile(r'\+SHREQ: "?\w+"?,(\d+),(\d+)\r\n')
+SHREAD_PATTERN = re.compile(r"\+SHREAD: (\d+)\r\n")
+
+
+class HttpError(Exception):
+    """
+    AT+SH* の手順の失敗、または SIM7080G が報告した 6xx (ネットワークエラーなど)
+    """
+
+
+class HttpSession:
+    """
+    AT+SHCONN で張った1つの HTTP(S) 接続
+    Args:
+        modem (Modem): 対象のモデム
+        url (str): 接続先 ("http://host:port"。パスは request() で指定する)
+        body_length (int): 1リクエストの本文の最大長
+        tls (tls.TlsContext): https の場合に使う SSL コンテキスト (configure() 済みのもの)
+    """
+
+    def __init__(self, modem, url, body_length=CHUNK_SIZE, timeout=REQUEST_TIMEOUT, tls=None):
+        self.modem = modem
+        self.url = url
+        self.body_length = body_length
+        self.timeout = timeout
+        self.tls = tls
+        self.connected = False
+
+    def _command(self, command, timeout=1):
+        response = self.modem.command(command, timeout=timeout)
+        if "OK" not in response:
+            raise HttpError(f"{command} failed: '{response}'")
+        return response
+
+    def connect(self):
+        commands = [f'AT+SHCONF="URL","{self.url}"', f'AT+SHCONF="BODYLEN",{self.body_length}',
+                    f'AT+SHCONF="HEADERLEN",{HEADER_LENGTH}']
+        if self.tls is not None:
+            ca = self.tls.module_name(self.tls.ca_cert) or ""
+            cert = self.tls.module_name(self.tls.client_cert)
+            commands.append(f'AT+SHSSL={self.tls.index},"{ca}"' + (f',"{cert}"' if cert else ""))
+        for command in commands:
+            self._command(command)
+        self._command("AT+SHCONN", timeout=self.timeout)
+        self.connected = True
+
+    def close(self):
+        if self.connected:
+            self.modem.command("AT+SHDISC")
+            self.connected = False
+
+    def _read_urc(self, pattern, timeout, buff=""):
+        """
+        pattern に一致する行を受信するまで読み込む
+        Returns:
+            tuple: (re.Match, 受信した文字列)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            match = pattern.search(buff)
+            if match:
+                return match, buff
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise HttpError(f"Timed out waiting for {pattern.pattern!r}")
+            buff += self.modem.at.read_until(("\r\n",), min(remaining, 0.5))
+
+    def request(self, method, path, body=b"", headers=None):
+        """
+        Returns:
+            tuple: (ステータスコード, 応答本文 (str))
+        """
+        if len(body) > self.body_length:
+            raise ValueError(f"Body of {len(body)} bytes exceeds BODYLEN {self.body_length}")
+        if not self.connected:
+            self.connect()
+        with self.modem.lock:
+            self._command("AT+SHCHEAD")
+            for key, value in (headers or {}).items():
+                self._command(f'AT+SHAHEAD="{key}","{value}"')
+            if body:
+                response = self.modem.command(f"AT+SHBOD={len(body)},10000", timeout=5, expect=">")
+                if ">" not in response:
+                    raise HttpError(f"AT+SHBOD was not accepted: '{response}'")
+                self.modem.write(body)
+                if "OK" not in self.modem.at.read_until(("OK\r\n", "ERROR\r\n"), 10):
+                    raise HttpError("Failed to write the request body.")
+            # +SHREQ: は OK の後、サーバの応答を受け取った時点で届く
+            self.modem.at.write(f'AT+SHREQ="{path}",{METHODS[method]}\r\n')
+            match, _ = self._read_urc(SHREQ_PATTERN, self.timeout)
+            status, length = int(match.group(1)), int(match.group(2))
+            if status >= 600:
+                self.connected = False
+                raise HttpError(f"{method} {path}: module reported error {status}")
+            text = ""
+            if length:
+                self.modem.at.write(f"AT+SHREAD=0,{length}\r\n")
+                match, buff = self._read_urc(SHREAD_PATTERN, self.timeout)
+                size = int(match.group(1))
+                text = buff[match.end():]
+                deadline = time.monotonic() + self.timeout
+                while len(text) < size and time.monotonic() < deadline:
+                    text += self.modem.at.read_until(("\r\n",), 0.5)
+                text = text[:size]
+        return status, text
+
+
+def _stream(path, offset=0, gzip=False, chunk_size=CHUNK_SIZE):
+    """
+    ファイルを chunk_size ごとに読み出す (gzip=True なら圧縮後のストリームを区切る)。
+    先頭 offset バイトは読み飛ばす
+    """
+    with open(path, "rb") as f:
+        if not gzip:
+            f.seek(offset)
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        # wbits=31 で gzip 形式 (ヘッダの時刻は 0 になるため出力は常に同じ)
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        pending = bytearray()
+        position = 0
+        while True:
+            block = f.read(READ_SIZE)
+            pending += compressor.compress(block) if block else compressor.flush()
+            if position < offset:
+                skip = min(offset - position, len(pending))
+                del pending[:skip]
+                position += skip
+            while len(pending) >= chunk_size or (not block and pending):
+                chunk = bytes(pending[:chunk_size])
+                del pending[:chunk_size]
+                position += len(chunk)
+                yield chunk
+            if not block:
+                return
+
+
+def remote_offset(session, path):
+    """
+    Returns:
+        int: サーバが受信済みのバイト数
+    """
+    status, text = session.request("GET", path)
+    if status == 404:
+        return 0
+    if status != 200:
+        raise HttpError(f"GET {path} returned {status}")
+    return int(text.strip() or 0)
+
+
+def upload_file(session, local_path, path, gzip=False, max_failures=MAX_FAILURES, retry_delay=RETRY_DELAY):
+    """
+    ファイルをチャンクに分けてアップロードする。失敗した場合はセッションを張り直し、
+    サーバが受信済みのオフセットから再開する
+    Args:
+        session (HttpSession): 接続先のセッション
+        local_path (str): 送信するファイル
+        path (str): サーバ側のパス (gzip の場合は ".gz" 付きの名前を使う)
+        gzip (bool): 送信しながら gzip 圧縮する
+    Returns:
+        dict: 元のファイルサイズ、送信したバイト数、リクエスト数、再開回数、所要時間、スループット
+    """
+    stats = {"file_bytes": os.path.getsize(local_path), "sent": 0, "requests": 0, "resumes": 0}
+    started = time.monotonic()
+    failures = 0
+    offset = None
+    headers = {"Content-Type": "application/gzip" if gzip else "application/octet-stream"}
+    while True:
+        try:
+            if offset is None:
+                offset = remote_offset(session, path)
+                stats["requests"] += 1
+                if offset:
+                    logger.info(f"Resuming upload of {local_path} at offset {offset}.")
+            for chunk in _stream(local_path, offset, gzip, session.body_length):
+                status, text = session.request("POST", f"{path}?offset={offset}", chunk, headers)
+                stats["requests"] += 1
+                stats["sent"] += len(chunk)
+                if status == 409:
+                    # サーバの受信済みサイズと食い違っている。サーバの値から送り直す
+                    offset = int(text.strip())
+                    stats["resumes"] += 1
+                    break
+                if status != 200:
+                    raise HttpError(f"POST {path} returned {status}")
+                offset = int(text.strip())
+                failures = 0
+            else:
+                break
+        except HttpError as e:
+            failures += 1
+            if failures > max_failures:
+                raise
+            logger.warning(f"Upload interrupted at offset {offset}: {e}. Retrying ({failures}/{max_failures}).")
+            session.close()
+            time.sleep(retry_delay)
+            offset = None
+            stats["resumes"] += 1
+    stats["elapsed"] = time.monotonic() - started
+    stats["uploaded"] = offset
+    stats["throughput"] = stats["file_bytes"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    return stats
+
+
+def serve_uploads(directory, host="127.0.0.1", port=0, fail_every=0):
+    """
+    上記プロトコルを話すアップロード受信サーバを別スレッドで起動する (ベンチマーク・動作確認用)
+    Args:
+        fail_every (int): 0 以外なら、この回数ごとに POST を 500 で失敗させる (再開の確認用)
+    Returns:
+        http.server.ThreadingHTTPServer: server_address で待ち受けアドレスが分かる。shutdown() で停止する
+    """
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    posts = [0]
+
+    class Handler(BaseHTTPRequestHandler):
+        def _target(self):
+            name = os.path.basename(urlsplit(self.path).path)
+            return os.path.join(directory, name)
+
+        def _reply(self, status, size):
+            body = str(size).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            target = self._target()
+            if os.path.exists(target):
+                self._reply(200, os.path.getsize(target))
+            else:
+                self._reply(404, 0)
+
+        def do_POST(self):
+            target = self._target()
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            size = os.path.getsize(target) if os.path.exists(target) else 0
+            posts[0] += 1
+            if fail_every and posts[0] % fail_every == 0:
+                self._reply(500, size)
+                return
+            offset = int(parse_qs(urlsplit(self.path).query).get("offset", ["0"])[0])
+            if offset != size:
+                self._reply(409, size)
+                return
+            with open(target, "ab") as f:
+                f.write(body)
+            self._reply(200, size + len(body))
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark(size=256 * 1024, latency=0.05, chunk_sizes=(1024, CHUNK_SIZE)):
+    """
+    疑似モデムとローカルの受信サーバで、チャンクサイズと gzip の有無ごとにアップロード時間を比べる。
+    latency は疑似モデムの1コマンドあたりの遅延 (無線区間の往復の代わり)。
+    最後に POST を定期的に失敗させて、再開後の内容が一致することを確認する
+    """
+    import gzip as gzip_module
+    import random
+    import tempfile
+
+    from .emulator import FakeModem
+    from .modem import Modem
+
+    workdir = tempfile.mkdtemp(prefix="upload_bench_")
+    source = os.path.join(workdir, "track.csv")
+    rng = random.Random(1)
+    with open(source, "w") as f:
+        while f.tell() < size:
+            f.write(f"{int(time.time())},{35.68 + rng.random() / 100:.6f},{139.76 + rng.random() / 100:.6f}\n")
+    with open(source, "rb") as f:
+        original = f.read()
+
+    received = os.path.join(workdir, "received")
+    os.makedirs(received)
+    fake = FakeModem(latency=latency)
+    port = fake.start()
+    modem = Modem(port, 115200, timeout=0.1)
+    runs = [(chunk, gzip) for chunk in chunk_sizes for gzip in (False, True)] + [(chunk_sizes[-1], True)]
+    try:
+        for index, (chunk, gzip) in enumerate(runs):
+            resume_test = index == len(runs) - 1
+            server = serve_uploads(received, fail_every=3 if resume_test else 0)
+            session = HttpSession(modem, "http://%s:%d" % server.server_address, body_length=chunk)
+            name = f"run{index}.csv" + (".gz" if gzip else "")
+            stats = upload_file(session, source, f"/upload/{name}", gzip=gzip, retry_delay=0)
+            session.close()
+            server.shutdown()
+            with open(os.path.join(received, name), "rb") as f:
+                data = f.read()
+            intact = (gzip_module.decompress(data) if gzip else data) == original
+            label = f"chunk={chunk:5d} gzip={'on ' if gzip else 'off'}" + (" (POST fails every 3rd)" if resume_test else "")
+            print(f"{label:44s} {stats['elapsed']:6.2f}s {stats['throughput'] / 1024:7.1f} KB/s of file, "
+                  f"sent {stats['sent']:7d} B in {stats['requests']:3d} requests, resumes {stats['resumes']}, "
+                  f"{'intact' if intact else 'MISMATCH'}")
+    finally:
+        modem.close()
+        fake.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark chunked HTTP uploads over AT+SH* against a local server")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Size of the generated track file (default: 256 KiB)")
+    parser.add_argument("--latency", type=float, default=0.05, help="Emulated per-command latency in seconds")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    benchmark(args.size, args.latency)
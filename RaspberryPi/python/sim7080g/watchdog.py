@@ -0,0 +1,238 @@
+"""
+GNSS の監視と段階的な復旧
+
+測位の失敗が続いたら、軽い手順から順に復旧を試みる:
+    gnss_power  AT+CGNSPWR=0 -> AT+CGNSPWR=1 で GNSS エンジンの電源を入れ直す
+    warm_reset  AT+CGNSWARM (エフェメリスを捨てて再捕捉)
+    cold_reset  AT+CGNSCOLD (保持している衛星情報をすべて捨てる。XTRA は書き込み直す)
+    soft_reset  AT+CFUN=1,1 でモジュールごと再起動する
+    pwrkey      PWRKEY で電源を切って入れ直す
+GNSS の手順は GNSS ウィンドウの外で実行されるため、最後に GNSS の電源を切り (LTE ウィンドウで
+GNSS を動かさない)、リセットした方式での起動は次の GNSS ウィンドウに任せる。
+各手順の後は待ち時間 (GNSS が再捕捉する猶予) を置き、それでも測位できなければ次の手順に進む。
+最後の手順は待ち時間を倍々に伸ばしながら繰り返す。測位できたら最初の手順に戻る。
+"""
+
+import logging
+import time
+
+from .gnss import START_COMMANDS
+
+logger = logging.getLogger("sim7080g")
+
+# (手順名, 実行後に次の手順へ進むまでの待ち時間（秒）)
+STEPS = (
+    ("gnss_power", 30),
+    ("warm_reset", 60),
+    ("cold_reset", 120),
+    ("soft_reset", 120),
+    ("pwrkey", 300),
+)
+# 測位できないまま何回ウィンドウが閉じたら復旧を始めるか
+# (GNSS が動いていて衛星が見えないだけの場合。応答が不正・GNSS が止まっている場合は1回で始める)
+NO_FIX_WINDOWS = 3
+# 最後の手順を繰り返すときの待ち時間の上限（秒）
+MAX_BACKOFF = 3600
+
+
+class GnssWatchdog:
+    """
+    GNSS ウィンドウの結果を受け取り、必要なら復旧手順を実行する
+    Args:
+        modem (Modem): 対象のモデム
+        gnss (AssistedGnss): GNSS 制御 (リセット後に XTRA を書き込み直させる)
+        cache (ResponseCache): モジュールのリセット後に無効にするキャッシュ
+    """
+
+    def __init__(self, modem, gnss, cache=None, no_fix_windows=NO_FIX_WINDOWS, max_backoff=MAX_BACKOFF):
+        self.modem = modem
+        self.gnss = gnss
+        self.cache = cache
+        self.no_fix_windows = no_fix_windows
+        self.max_backoff = max_backoff
+        self.last_result = None
+        self.failures = 0
+        self.stuck = False
+        self.failing_since = None
+        self.step = 0
+        self.next_action_at = 0.0
+        self.stats = {step: {"attempts": 0, "recovered": 0} for step, _ in STEPS}
+        # モジュールのリセット後に呼ぶ関数 (ModemUDPSocket.reset など。ソケットと PDP コンテキストは失われる)
+        self.reset_hooks = []
+        self.actions = {
+            "gnss_power": self._gnss_power,
+            "warm_reset": lambda: self._gnss_reset("warm"),
+            "cold_reset": self._cold_reset,
+            "soft_reset": self._soft_reset,
+            "pwrkey": self._pwrkey,
+        }
+
+    def track(self, result):
+        """
+        AT+CGNSINF の結果を記録してそのまま返す (RadioScheduler の read_fix を包んで使う)
+        """
+        self.last_result = result
+        if result is None or not result["run"]:
+            # 応答がない・電源を入れたのに GNSS が動いていない
+            self.stuck = True
+        return result
+
+    def update(self, fix):
+        """
+        GNSS ウィンドウが閉じるたびに呼ぶ。必要なら復旧手順を1つ実行する (ブロッキング)
+        Args:
+            fix (dict): ウィンドウで得た測位結果 (測位できなければ None)
+        Returns:
+            dict: サーバへ報告するイベント ("recovery" / "recovered")。何もしなければ None
+        """
+        now = time.monotonic()
+        if fix is not None:
+            event = None
+            if self.step:
+                step = STEPS[min(self.step, len(STEPS)) - 1][0]
+                self.stats[step]["recovered"] += 1
+                event = {"event": "recovered", "step": step, "downtime": round(now - self.failing_since, 1)}
+                logger.info(f"GNSS recovered after '{step}' ({event['downtime']}s without a fix).")
+            self.failures = 0
+            self.stuck = False
+            self.failing_since = None
+            self.step = 0
+            self.next_action_at = 0.0
+            return event
+
+        self.failures += 1
+        if self.failing_since is None:
+            self.failing_since = now
+        stuck, self.stuck = self.stuck, False
+        if not stuck and self.failures < self.no_fix_windows:
+            return None
+        if now < self.next_action_at:
+            return None
+
+        index = min(self.step, len(STEPS) - 1)
+        step, grace = STEPS[index]
+        # 最後の手順を繰り返す場合は待ち時間を倍々に伸ばす
+        repeats = self.step - index
+        delay = min(grace * (2 ** repeats), self.max_backoff)
+        logger.warning(f"GNSS has no fix for {now - self.failing_since:.0f}s ({self.failures} windows"
+                       f"{', engine not running' if stuck else ''}): trying '{step}'.")
+        self.stats[step]["attempts"] += 1
+        try:
+            ok = self.actions[step]()
+        except Exception as e:
+            logger.error(f"GNSS recovery step '{step}' failed: {e}")
+            ok = False
+        self.step += 1
+        self.next_action_at = time.monotonic() + delay
+        return {"event": "recovery", "step": step, "ok": ok, "failures": self.failures,
+                "failing_for": round(now - self.failing_since, 1), "next_in": delay}
+
+    def _gnss_power(self):
+        # 電源を入れ直して応答を確かめ、次の GNSS ウィンドウまでは切っておく
+        self.modem.command("AT+CGNSPWR=0")
+        ok = "OK" in self.modem.command("AT+CGNSPWR=1")
+        self.gnss.stop()
+        return ok
+
+    def _gnss_reset(self, start_type):
+        self.modem.command("AT+CGNSPWR=1")
+        ok = "OK" in self.modem.command(START_COMMANDS[start_type])
+        self.gnss.stop()
+        # 次のウィンドウも同じ方式で起動する (hot start で捨てた衛星情報を使い直さない)
+        self.gnss.next_start = start_type
+        return ok
+
+    def _cold_reset(self):
+        self.gnss.xtra_ready = False
+        return self._gnss_reset("cold")
+
+    def _after_module_reset(self):
+        # モジュールが再起動すると XTRA とキャッシュした設定は失われる
+        self.gnss.xtra_ready = False
+        if self.cache is not None:
+            self.cache.reset()
+        for hook in self.reset_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.warning(f"Failed to restore state after module reset: {e}")
+
+    def _soft_reset(self):
+        try:
+            with self.modem.lock:
+                try:
+                    self.modem.command("AT+CFUN=1,1", timeout=5)
+                except OSError as e:
+                    # 応答の前に USB のポートが消えることがある (serial.SerialException は OSError)
+                    logger.info(f"Serial port closed during AT+CFUN=1,1: {e}")
+                # 再起動したモジュールは USB に現れ直すため、ポートは wait_ready で開き直す
+                self.modem.close_serial()
+                return self.modem.wait_ready()
+        finally:
+            self._after_module_reset()
+
+    def _pwrkey(self):
+        try:
+            with self.modem.lock:
+                self.modem.power_down()
+                self.modem.close_serial()
+                return self.modem.power_on()
+        finally:
+            self._after_module_reset()
+
+    def metrics(self):
+        """
+        Returns:
+            dict: 現在の段階、連続失敗回数、手順ごとの実行回数と復旧につながった回数
+        """
+        return {"step": self.step, "failures": self.failures, "steps": self.stats}
+
+
+def recovery_check():
+    """
+    疑似モデムで復旧手順を実行し、GNSS の手順の後は GNSS の電源が切れていること、
+    AT+CFUN=1,1 の後も内蔵スタックの UDP 送信ができることを確かめる
+    Returns:
+        bool: すべて期待どおりならTrue
+    """
+    import tempfile
+
+    from .emulator import FakeModem
+    from .gnss import AssistedGnss
+    from .modem import Modem
+    from .udp import ModemUDPSocket
+
+    fake = FakeModem()
+    addr = ("192.0.2.1", 5683)
+    with Modem(fake.start(), gpio="mock") as modem:
+        watchdog = GnssWatchdog(modem, AssistedGnss(modem, cache_dir=tempfile.mkdtemp(prefix="watchdog_")))
+        sock = ModemUDPSocket(modem)
+        watchdog.reset_hooks.append(sock.reset)
+        gnss_off = True
+        for step in ("gnss_power", "warm_reset", "cold_reset"):
+            watchdog.actions[step]()
+            power = [command for command in fake.commands if command.startswith("AT+CGNSPWR=")][-1]
+            print(f"{step}: GNSS left {'off' if power.endswith('0') else 'ON'}, next start {watchdog.gnss.next_start}")
+            gnss_off = gnss_off and power.endswith("0")
+        sock.sendto(b"before", addr)
+        engine, port = modem.at, modem.serial
+        ready = watchdog.actions["soft_reset"]()
+        try:
+            sock.sendto(b"after", addr)
+            sent = True
+        except OSError as e:
+            print(f"send after recovery failed: {e}")
+            sent = False
+        # ポートは開き直し、フックを登録した ATEngine はそのまま使う
+        reopened = modem.at is engine and modem.serial is not port
+        sock.close()
+    fake.stop()
+    print(f"soft_reset: module ready={ready}, resets seen by modem={fake.resets}, serial port "
+          f"{'reopened' if reopened else 'NOT reopened'}, send after recovery {'ok' if sent else 'FAILED'}")
+    return (gnss_off and ready and sent and reopened and fake.resets == 1
+            and fake.received.endswith(b"after"))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    raise SystemExit(0 if recovery_check() else 1)
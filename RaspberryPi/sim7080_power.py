@@ -1,25 +1,19 @@
-from gpiozero import OutputDevice
-from time import sleep
+import logging
+import os
+import sys
 
-# GPIO ピン番号 (BCM モード)
-powerKey = 4  # GPIO4 (物理ピン7)
-
-# グローバル変数
-command_input = ''
-rec_buff = ''
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python"))
+from sim7080g import Modem
 
-# powerOn 関数
-def powerOn(powerKey):
-    print('SIM7080X is starting...')
-    # GPIO 設定
-    pwrkey = OutputDevice(powerKey, active_high=True, initial_value=False)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-    # PWRKEY をトグル
-    pwrkey.on()  # HIGH に設定
-    sleep(1)  # 1秒間保持
-    pwrkey.off()  # LOW に戻す
-    sleep(5)  # SIM7080G の起動を待機
-    print('SIM7080X should now be powered on.')
+# GPIO ピン番号 (BCM モード)
+powerKey = 4  # GPIO4 (物理ピン7)
 
 if __name__ == '__main__':
-    powerOn(powerKey)
+    # 起動済みかどうかを AT 応答で確認してから PWRKEY をトグルする
+    with Modem('/dev/ttyAMA0', 9600, power_key=powerKey, gpio="gpiozero") as modem:
+        if modem.power_on():
+            print('SIM7080X is powered on.')
+        else:
+            print('SIM7080X did not respond after power on.')
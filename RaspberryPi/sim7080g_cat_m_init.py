@@ -1,103 +1,83 @@
 #!/usr/bin/python3
 
 import os
+import sys
 import subprocess
 import logging
 from time import sleep
 import time  # timeモジュールをインポート
-import serial  # pyserialを使用
-from gpiozero import OutputDevice
+from dataclasses import replace
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python"))
+from sim7080g import Modem
+from sim7080g.modem import BOOT_TIMEOUT
+from sim7080g.baud import autobaud, enable_flow_control, negotiate_baudrate
+from sim7080g.bringup import BringUp
+from sim7080g.cache import ResponseCache
+from sim7080g.gnss import AssistedGnss
+from sim7080g.network import RegistrationWatcher
+from sim7080g.ppp import PROFILES, write_profile
+from sim7080g.logpipe import BatchFileHandler, setup_logging
 
-# ログ設定
+
+# ログ設定 (書き込みは専用スレッドでまとめて行い、DEBUG はエラー時のみファイルに残す)
 log_file = "/var/log/sim7080g_pppd.log"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_file),  # ファイルにログを記録
-        logging.StreamHandler()        # 標準出力にログを表示
-    ]
-)
+setup_logging(["SIM7080G_PPPD", "sim7080g"], BatchFileHandler(log_file))
 
 logger = logging.getLogger("SIM7080G_PPPD")
 
 # グローバル設定
 SERIAL_PORT = "/dev/ttyAMA0"
-BAUDRATE = 9600
+BAUDRATE = 9600  # オートボー検出に失敗した場合のフォールバック
 TIMEOUT = 1
-POWER_KEY_GPIO = 4
-pwrkey = OutputDevice(POWER_KEY_GPIO, active_high=True, initial_value=False)
-
+# ICCID・IMEI・APN 設定などの問い合わせ応答のキャッシュ (再起動をまたいで使う)
+AT_CACHE_FILE = "/var/cache/sim7080g/at_cache.json"
+# GNSS アシストデータ (XTRA) のキャッシュ先。キャッシュがあれば登録待ちの間にモジュールへ書き込む
+GNSS_CACHE_DIR = "/var/cache/sim7080g"
 
 # PPP 接続用の設定ファイルパス
 PPP_PEER_FILE = "/etc/ppp/peers/sim7080g"
 CHAT_CONNECT_FILE = "/etc/chatscripts/chat-connect"
 CHAT_DISCONNECT_FILE = "/etc/chatscripts/chat-disconnect"
+# PPP 接続プロファイル (sim7080g.ppp.PROFILES のキー)
+PPP_PROFILE = "tuned"
 
 # GPIO ピン番号 (BCM モード)
 POWER_KEY_GPIO = 4
+# STATUS ピンを配線している場合はその GPIO 番号 (未配線なら None で AT 応答により判定)
+STATUS_GPIO = None
 
-def power_on_modem():
+def power_on_modem(modem):
     """
-    Power on the SIM7080G module using GPIO
+    Power on the SIM7080G module using GPIO and wait until it answers at any baud rate
+    Returns:
+        int: 起動後に検出したボーレート。応答がなければ None
     """
     try:
         logger.info("Powering on the SIM7080G module...")
-        pwrkey.on()
-        sleep(1)
-        pwrkey.off()
-        sleep(5)
-        logger.info("Power-on sequence completed.")
+        # 保存済みの AT+IPR で起動するため、固定ボーレートでの待機ではなくボーレート検出で起動完了を判定する
+        modem.power_on(force=modem.status is None, wait=False)
+        deadline = time.monotonic() + BOOT_TIMEOUT
+        while time.monotonic() < deadline:
+            baudrate = autobaud(modem)
+            if baudrate is not None:
+                logger.info("Power-on sequence completed.")
+                return baudrate
+        logger.error("Modem did not respond after power on.")
+        return None
     except Exception as e:
         logger.error(f"Error powering on the modem: {e}")
         raise
 
-def setup_ppp_files(apn, plmn):
+def setup_ppp_files(apn, plmn, baudrate=BAUDRATE, rtscts=False, profile=PPP_PROFILE):
     """
     Create PPP and chat script files for the SIM7080G connection
+    (ボーレートとフロー制御はネゴシエーション結果に合わせる。内容が変わらないファイルは書き換えない)
     """
-    logger.info("Setting up PPP configuration files...")
+    logger.info(f"Setting up PPP configuration files (profile: {profile})...")
     try:
-        # PPP peers file
-        with open(PPP_PEER_FILE, "w") as ppp_file:
-            ppp_file.write(f"""/dev/ttyAMA0 9600
-connect '/usr/sbin/chat -v -f {CHAT_CONNECT_FILE}'
-disconnect '/usr/sbin/chat -v -f {CHAT_DISCONNECT_FILE}'
-noauth
-defaultroute
-usepeerdns
-persist
-user ""
-password ""
-""")
-        logger.info("PPP peers file created.")
-
-        # Chat connect file
-        with open(CHAT_CONNECT_FILE, "w") as connect_file:
-            connect_file.write(f"""ABORT 'BUSY'
-ABORT 'NO CARRIER'
-ABORT 'ERROR'
-ABORT 'NO DIALTONE'
-'' AT
-OK ATZ
-OK AT+CGDCONT=1,"IP","{apn}"
-OK AT+COPS=1,2,"{plmn}"
-OK ATD*99#
-CONNECT ''
-""")
-        logger.info("Chat connect file created.")
-
-        # Chat disconnect file
-        with open(CHAT_DISCONNECT_FILE, "w") as disconnect_file:
-            disconnect_file.write("""ABORT 'ERROR'
-'' +++
-SAY "Disconnecting the modem\n"
-'' ATH
-OK
-""")
-        logger.info("Chat disconnect file created.")
-
+        settings = replace(PROFILES[profile], device=SERIAL_PORT, baudrate=baudrate, rtscts=rtscts, apn=apn, plmn=plmn)
+        return write_profile(settings, PPP_PEER_FILE, CHAT_CONNECT_FILE, CHAT_DISCONNECT_FILE)
     except Exception as e:
         logger.error(f"Error setting up PPP files: {e}")
         raise
@@ -162,44 +142,20 @@ def configure_dns():
     except subprocess.CalledProcessError as e:
         logger.error(f"Failed to configure DNS: {e}")
 
-def send_at_command(command, ser, retries=3, response_delay=1):
+def inject_gnss_assistance(modem):
     """
-    モデムにATコマンドを送信し、応答を取得する
+    キャッシュ済みの XTRA をモジュールに書き込む (GNSS の電源は入れない。無線は LTE の登録に使う)
     """
-    if not isinstance(ser, serial.Serial):
-        logger.error(f"'ser' is not a serial.Serial object. Received type: {type(ser)}")
-        return ""
-
-    for attempt in range(1, retries + 1):
-        try:
-            ser.reset_input_buffer()  # バッファをクリア
-            logger.debug(f"Sending AT command (Attempt {attempt}/{retries}): {command}")
-            ser.write((command + "\r\n").encode())  # コマンド送信
-            sleep(response_delay)  # 応答待ち
-
-            # 応答を取得
-            if ser.in_waiting > 0:
-                response = ser.read(ser.in_waiting).decode(errors='ignore').strip()
-                logger.debug(f"AT command response: {response}")
-                return response
-            else:
-                logger.warning(f"No response received for command '{command}' (Attempt {attempt}/{retries}).")
-
-        except Exception as e:
-            logger.error(f"Error sending AT command '{command}' (Attempt {attempt}/{retries}): {e}")
-
-    logger.error(f"Failed to get a response for command '{command}' after {retries} attempts.")
-    return ""
-
+    gnss = AssistedGnss(modem, cache_dir=GNSS_CACHE_DIR)
+    if gnss.xtra_age() is None:
+        logger.info("No cached XTRA data, skipping GNSS assistance.")
+    elif not gnss.inject_xtra():
+        logger.warning("Failed to inject XTRA data.")
 
-def initialize_modem(ser, apn, plmn):
+def initialize_modem(modem, apn, plmn):
     """
     モデムを初期化し、ネットワーク接続を準備する
     """
-    if not isinstance(ser, serial.Serial):
-        logger.error(f"'ser' is not a serial.Serial object. Received type: {type(ser)}")
-        return False
-
     logger.info("Initializing modem...")
 
     # 必須ATコマンドのリスト (コマンド, 期待する応答)
@@ -214,7 +170,7 @@ def initialize_modem(ser, apn, plmn):
 
     for cmd, expected in commands:
         logger.info(f"Sending command: {cmd}")
-        response = send_at_command(cmd, ser)
+        response = modem.command(cmd, retries=3)
         if expected not in response:
             logger.error(f"Command '{cmd}' failed. Expected '{expected}' but got: '{response}'")
             return False
@@ -223,40 +179,48 @@ def initialize_modem(ser, apn, plmn):
     return True
 
 
-def wait_for_modem_ready(ser, timeout=60):
+def wait_for_modem_ready(modem, timeout=60, cache=None, watcher=None, apn="iot.1nce.net"):
     """
     モデムが準備完了するまで待機
     Args:
-        ser (serial.Serial): シリアルポートオブジェクト
+        modem (Modem): モデムオブジェクト
         timeout (int): 最大待機時間（秒）
+        cache (ResponseCache): AT+CGDCONT? / AT+COPS? の応答キャッシュ (None なら毎回問い合わせる)
+        watcher (RegistrationWatcher): 登録状態の URC 監視 (None ならここで有効にする)
+        apn (str): AT+CGDCONT? に設定されているべき APN
     Returns:
         bool: 準備完了でTrue、タイムアウトでFalse
     """
     logger.info("Waiting for modem to be ready...")
     start_time = time.time()
+    query = cache.command if cache is not None else modem.command
+    if watcher is None:
+        watcher = RegistrationWatcher(modem)
+        watcher.enable()
 
     while time.time() - start_time < timeout:
-        # AT+CGDCONT? でAPNの設定確認
-        response_cgdc = send_at_command("AT+CGDCONT?", ser)
+        # AT+CGDCONT? でAPNの設定確認 (AT+CGDCONT= を送るまではキャッシュを使う)
+        response_cgdc = query("AT+CGDCONT?", retries=3)
         logger.debug(f"AT+CGDCONT response: {response_cgdc}")
 
-        # AT+COPS? でネットワーク登録状況を確認
-        response_cops = send_at_command("AT+COPS?", ser)
+        # AT+COPS? でネットワーク登録状況を確認 (+CEREG: を受信するとキャッシュを捨てる)
+        response_cops = query("AT+COPS?", retries=3)
         logger.debug(f"AT+COPS response: {response_cops}")
 
         # AT+CPSI? で現在の接続状態を確認
-        response_cpsi = send_at_command("AT+CPSI?", ser)
+        response_cpsi = modem.command("AT+CPSI?", retries=3)
         logger.debug(f"AT+CPSI response: {response_cpsi}")
 
         # 条件を満たす場合はモデムが準備完了と判断
-        if ("Online" in response_cpsi or "LTE" in response_cpsi or "NR5G" in response_cpsi) and \
-           ("iot.1nce.net" in response_cgdc):  # APNが正しい
+        online = watcher.registered.is_set() or \
+            "Online" in response_cpsi or "LTE" in response_cpsi or "NR5G" in response_cpsi
+        if online and apn in response_cgdc:  # APNが正しい
             logger.info("Modem is ready and connected to the network.")
             return True
 
-        # 準備中の場合は再試行
+        # 準備中の場合は登録の URC (+CEREG / +CGREG) を受信した時点で再確認する
         logger.warning("Modem is not ready yet. Retrying...")
-        sleep(5)
+        watcher.wait(min(5, max(timeout - (time.time() - start_time), 0)))
 
     logger.error("Timeout waiting for modem to be ready.")
     return False
@@ -284,33 +248,62 @@ def check_ppp_device(retries=10, interval=5):
     logger.error("ppp0 device not found after retries.")
     return False
 
-def main(apn, plmn, retries, timeout):
+def main(apn, plmn, retries, timeout, rtscts=False, ppp_profile=PPP_PROFILE):
     """
     Main function to power on the modem, wait for readiness, and establish PPP connection
     """
-    power_on_modem()
-
     try:
-        with serial.Serial(SERIAL_PORT, BAUDRATE, timeout=TIMEOUT) as ser:
-            if not initialize_modem(ser, apn, plmn):
-                logger.error("Modem initialization failed.")
-                return
-
-            if not wait_for_modem_ready(ser, timeout):
-                logger.error("Modem did not become ready in time.")
-                return
-
-            setup_ppp_files(apn, plmn)
-            connect()
-
-            if not check_ppp_device(retries=retries, interval=5):
-                logger.error("PPP device not detected.")
-                return
-
-            configure_default_route()
-            configure_dns()
-
-            logger.info("PPP connection established. You can now access the internet.")
+        with Modem(SERIAL_PORT, BAUDRATE, timeout=TIMEOUT, power_key=POWER_KEY_GPIO, gpio="gpiozero",
+                   status_pin=STATUS_GPIO) as modem:
+            bringup = BringUp()
+            watcher = None
+            cache = None
+
+            def start_modem():
+                nonlocal watcher, cache
+                # 既に起動しているモジュールに PWRKEY を入れると停止するため、先にボーレート検出で応答を確認する
+                if autobaud(modem) is None and power_on_modem(modem) is None:
+                    return False
+                # 設定コマンドや URC で無効になるよう、初期化コマンドより先にフックを登録する
+                cache = ResponseCache(modem, AT_CACHE_FILE)
+                watcher = RegistrationWatcher(modem)
+                # RTS/CTS は配線されている場合だけ有効にする (未配線で有効にすると送信が止まる)
+                flow_control = enable_flow_control(modem) if rtscts else False
+                return negotiate_baudrate(modem), flow_control
+
+            def init_modem():
+                if not initialize_modem(modem, apn, plmn):
+                    logger.error("Modem initialization failed.")
+                    return False
+                # 登録状態の URC を有効にし、以降の登録待ちは URC で判定する
+                watcher.enable()
+
+            def wait_ready():
+                if not wait_for_modem_ready(modem, timeout, cache, watcher, apn):
+                    logger.error("Modem did not become ready in time.")
+                    return False
+
+            def ppp_device():
+                if not check_ppp_device(retries=retries, interval=5):
+                    logger.error("PPP device not detected.")
+                    return False
+
+            # 互いに依存しない手順 (PPP ファイル生成・XTRA 書き込み・DNS 設定) はネットワーク登録待ちと並行して実行する
+            bringup.add("dns", configure_dns)
+            bringup.add("modem", start_modem)
+            bringup.add("ppp_files", lambda: setup_ppp_files(apn, plmn, *bringup.result("modem"), ppp_profile), after=("modem",))
+            bringup.add("init", init_modem, after=("modem",))
+            bringup.add("xtra", lambda: inject_gnss_assistance(modem), after=("init",))
+            bringup.add("register", wait_ready, after=("init",))
+            # pppd はシリアルポートを使うため、モデムへのコマンドがすべて終わってから起動する
+            bringup.add("pon", connect, after=("register", "ppp_files", "xtra"))
+            bringup.add("ppp0", ppp_device, after=("pon",))
+            bringup.add("route", configure_default_route, after=("ppp0",))
+
+            succeeded = bringup.run()
+            logger.info("Bring-up timing:\n%s", bringup.report())
+            if succeeded:
+                logger.info("PPP connection established. You can now access the internet.")
 
     except Exception as e:
         logger.error(f"Unexpected error in main: {e}")
@@ -324,9 +317,13 @@ if __name__ == "__main__":
     parser.add_argument("--disconnect", action="store_true", help="Disconnect the PPP connection")
     parser.add_argument("--retries", type=int, default=10, help="Number of retries for ppp0 device check (default: 10, 0 for unlimited)")
     parser.add_argument("--timeout", type=int, default=60, help="Timeout in seconds for modem readiness (default: 60)")
+    parser.add_argument("--rtscts", action="store_true",
+                        help="Enable RTS/CTS hardware flow control (only if the RTS/CTS lines are wired to the module)")
+    parser.add_argument("--ppp-profile", choices=sorted(PROFILES), default=PPP_PROFILE,
+                        help=f"PPP link profile for the peers/chat files (default: {PPP_PROFILE})")
     args = parser.parse_args()
 
     if args.disconnect:
         disconnect()
     else:
-        main(args.apn, args.plmn, args.retries, args.timeout)
+        main(args.apn, args.plmn, args.retries, args.timeout, rtscts=args.rtscts, ppp_profile=args.ppp_profile)